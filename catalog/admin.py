@@ -1,6 +1,12 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.db.models import Prefetch
 
+from . import circulation
+from .forms import RenewBookForm
 from .models import Author, Genre, Book, BookInstance, Language
+from .pagination import EstimatedCountPaginator
 
 # Register your models here.
 
@@ -17,39 +23,102 @@ class BooksInstanceInline(admin.TabularInline):
 	model = BookInstance
 	extra = 0
 
-class BookInline(admin.StackedInline):
+	# a <select> of every user per copy otherwise
+	autocomplete_fields = ['borrower']
+
+class BookInline(admin.TabularInline):
+	'''Lists an author's books with links, books are edited on their own page.'''
 	model = Book
 	extra = 0
+	max_num = 0
+	can_delete = False
+	show_change_link = True
 
+	fields = ('title', 'isbn')
+	readonly_fields = ('title', 'isbn')
 
 class AuthorAdmin(admin.ModelAdmin):
 	list_display = ('last_name', 'first_name', 'date_of_birth', 'date_of_death')
+	search_fields = ('last_name', 'first_name')
 
 	fields = ['first_name', 'last_name', ('date_of_birth', 'date_of_death')]
 
 	inlines = [BookInline]
 
+	paginator = EstimatedCountPaginator
+	show_full_result_count = False
+
 @admin.register(Genre)
 class GenreAdmin(admin.ModelAdmin):
-	pass
+	search_fields = ('name',)
 
 class BookAdmin(admin.ModelAdmin):
 	list_display = ('title', 'author', 'display_genre')
+	list_select_related = ('author',)
+	search_fields = ('title', 'isbn')
+
+	autocomplete_fields = ['author', 'language']
 
 	inlines = [BooksInstanceInline]
 
+	paginator = EstimatedCountPaginator
+	show_full_result_count = False
+
+	def get_queryset(self, request):
+		# display_genre reads the prefetched genres instead of querying per row
+		return super().get_queryset(request).prefetch_related(
+			Prefetch('genre', queryset=Genre.objects.only('name').order_by('name'))
+		)
+
+class BookInstanceActionForm(ActionForm):
+	renewal_date = forms.DateField(required=False, help_text='For renewals, between now and 4 weeks.')
+
 class BookInstanceAdmin(admin.ModelAdmin):
 	list_display = ('book', 'status', 'due_back', 'id')
 	list_filter = ('status', 'due_back')
+	list_select_related = ('book',)
+
+	autocomplete_fields = ['book', 'borrower']
 
 	fieldsets = (
 		(None, { 'fields' : ('book', 'imprint', 'id') }),
 		('Availability', { 'fields' : ('status', 'due_back', 'borrower') }),
 	)
 
+	paginator = EstimatedCountPaginator
+	show_full_result_count = False
+
+	# each runs as one UPDATE over the selection (see catalog.circulation)
+	actions = ['renew', 'mark_returned', 'send_to_maintenance']
+	action_form = BookInstanceActionForm
+
+	def has_mark_returned_permission(self, request):
+		return request.user.has_perm('catalog.can_mark_returned')
+
+	@admin.action(description='Renew selected loans until the renewal date', permissions=['mark_returned'])
+	def renew(self, request, queryset):
+		form = RenewBookForm({ 'renewal_date' : request.POST.get('renewal_date') })
+		if not form.is_valid():
+			for error in form.errors['renewal_date']:
+				self.message_user(request, error, messages.ERROR)
+			return
+
+		renewed = circulation.renew_many(queryset, form.cleaned_data['renewal_date'])
+		self.message_user(request, f'Renewed {renewed} loans until {form.cleaned_data["renewal_date"]}.')
+
+	@admin.action(description='Mark selected copies returned', permissions=['mark_returned'])
+	def mark_returned(self, request, queryset):
+		returned = circulation.give_back_many(queryset)
+		self.message_user(request, f'Marked {returned} copies returned.')
+
+	@admin.action(description='Send selected copies to maintenance', permissions=['change'])
+	def send_to_maintenance(self, request, queryset):
+		sent = circulation.send_to_maintenance(queryset)
+		self.message_user(request, f'Sent {sent} copies to maintenance.')
+
 @admin.register(Language)
 class LanguageAdmin(admin.ModelAdmin):
-	pass
+	search_fields = ('name',)
 
 admin.site.register(Author, AuthorAdmin)
 # admin.site.register(Genre)
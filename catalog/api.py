@@ -0,0 +1,148 @@
+import hashlib
+
+from django.core.exceptions import PermissionDenied
+from django.db.models import Min
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import etag, require_safe
+
+from . import circulation
+from .models import Author, Book, BookInstance, CopyCount, Genre, Hold, Language
+from .pagination import paginate_by_cursor
+from .routers import use_primary
+from .versioning import get_versions, model_version_key
+
+# Read-only JSON API (v1), serialized from .values() rows rather than model instances
+
+API_PAGE_SIZE = 50
+
+def versioned_etag(*models):
+	'''
+	Conditional GET keyed on the request URL and the version tokens of the models
+	the response is built from. A matching If-None-Match gets a 304 before the view
+	runs a single query. The tokens have to come from a cache shared by all worker
+	processes (see CACHES in settings), else workers that missed a write keep
+	answering 304 for changed data.
+	'''
+	def etag_func(request, *args, **kwargs):
+		versions = get_versions(*(model_version_key(model) for model in models))
+		return hashlib.sha1('\n'.join([request.get_full_path(), *versions]).encode()).hexdigest()
+
+	def decorator(func):
+		# a lagging replica could answer with old rows under the new ETag, read the primary
+		return etag(etag_func)(use_primary()(func))
+
+	return decorator
+
+def cursor_page(request, queryset):
+	'''Returns the list payload for one keyset page of a .values() queryset.'''
+	page = paginate_by_cursor(queryset, request.GET.get('cursor'), API_PAGE_SIZE)
+
+	return {
+		'results' : list(page),
+		'next' : page.next_cursor,
+		'previous' : page.previous_cursor,
+	}
+
+@require_safe
+@versioned_etag(Book, Language)
+def book_list(request):
+	books = Book.objects.order_by('pk').values('id', 'title', 'isbn', 'author_id', 'language__name')
+	return JsonResponse(cursor_page(request, books))
+
+@require_safe
+@versioned_etag(Book, Author, Genre, Language, BookInstance)
+def book_detail(request, pk):
+	book = (
+		Book.objects
+			.filter(pk=pk)
+			.values(
+				'id', 'title', 'summary', 'isbn',
+				'author_id', 'author__first_name', 'author__last_name',
+				'language__name'
+			)
+			.first()
+	)
+	if book is None:
+		raise Http404('No book found')
+
+	book['genres'] = list(Genre.objects.filter(book=pk).order_by('name').values_list('name', flat=True))
+	book['copies'] = CopyCount.objects.counts(book=pk)
+
+	return JsonResponse(book)
+
+@require_safe
+@versioned_etag(Book, BookInstance)
+def book_availability(request, pk):
+	if not Book.objects.filter(pk=pk).exists():
+		raise Http404('No book found')
+
+	counts = CopyCount.objects.counts(book=pk)
+	next_due_back = BookInstance.objects.filter(book=pk, status__exact='o').aggregate(
+		next_due_back=Min('due_back')
+	)['next_due_back']
+
+	return JsonResponse({
+		'book_id' : pk,
+		'copies' : sum(counts.values()),
+		'available' : counts.get('a', 0),
+		'statuses' : counts,
+		'next_due_back' : next_due_back,
+	})
+
+@require_safe
+@use_primary()
+def hold_detail(request, pk):
+	'''
+	Queue position and estimated wait of one of the user's holds, librarians see every
+	hold. Not cached, the position moves with every other borrower's holds.
+	'''
+	if not request.user.is_authenticated:
+		raise PermissionDenied
+
+	holds = Hold.objects.select_related('copy')
+	if not request.user.has_perm('catalog.can_mark_returned'):
+		holds = holds.filter(borrower=request.user)
+
+	hold = holds.filter(pk=pk).first()
+	if hold is None:
+		raise Http404('No hold found')
+
+	position = circulation.queue_position(hold)
+
+	return JsonResponse({
+		'id' : hold.pk,
+		'book_id' : hold.book_id,
+		'created' : hold.created,
+		'position' : position,
+		'copy_id' : hold.copy_id,
+		'pickup_by' : hold.copy.due_back if hold.copy else None,
+		'estimated_available' : circulation.estimated_availability(hold, position) if position else None,
+	})
+
+@require_safe
+@versioned_etag(Author)
+def author_list(request):
+	authors = Author.objects.values('id', 'first_name', 'last_name', 'date_of_birth', 'date_of_death')
+	return JsonResponse(cursor_page(request, authors))
+
+@require_safe
+@versioned_etag(Author, Book)
+def author_detail(request, pk):
+	author = (
+		Author.objects
+			.filter(pk=pk)
+			.values('id', 'first_name', 'last_name', 'date_of_birth', 'date_of_death')
+			.first()
+	)
+	if author is None:
+		raise Http404('No author found')
+
+	author['books'] = list(Book.objects.filter(author=pk).order_by('pk').values('id', 'title', 'isbn'))
+
+	return JsonResponse(author)
+
+@require_safe
+@versioned_etag(Genre)
+def genre_list(request):
+	genres = Genre.objects.order_by('name').values('id', 'name')
+	return JsonResponse(cursor_page(request, genres))
@@ -0,0 +1,160 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import InvalidPage, Paginator
+from django.http import Http404
+from django.shortcuts import render
+from django.views.decorators.http import require_safe
+
+from .models import Author, Book
+from .pagination import paginate_by_cursor, wants_cursor_pagination
+from .routers import use_primary
+from .stats import aget_catalog_stats
+from .versioning import aget_object_version
+from .views import BookDetailView, BookListView, CopySummary, all_loans, author_books, loans_of
+from .visits import get_visit_count, set_visit_count
+
+# Async versions of the read-only pages, routed instead of the class-based views in
+# views.py when CATALOG_ASYNC_VIEWS is on (see urls.py). Queries go through the async
+# ORM; templates still render synchronously, in one worker thread hop per request.
+
+PAGE_SIZE = 10
+
+arender = sync_to_async(render)
+
+async def apaginate(request, queryset, page_size=PAGE_SIZE):
+	'''Async counterpart of ListView.paginate_queryset(), returns the pagination context.'''
+	if wants_cursor_pagination(request):
+		page = await sync_to_async(paginate_by_cursor)(queryset, request.GET.get('cursor'), page_size)
+		return {
+			'paginator' : None,
+			'page_obj' : page,
+			'is_paginated' : page.has_other_pages(),
+			'object_list' : page.object_list,
+		}
+
+	paginator = Paginator(queryset, page_size)
+	paginator.count = await queryset.acount()
+
+	page_number = request.GET.get('page') or 1
+	if page_number == 'last':
+		page_number = paginator.num_pages
+	try:
+		page = paginator.page(page_number)
+	except InvalidPage as e:
+		raise Http404(f'Invalid page ({page_number}): {e}')
+
+	page.object_list = [obj async for obj in page.object_list]
+
+	return {
+		'paginator' : paginator,
+		'page_obj' : page,
+		'is_paginated' : page.has_other_pages(),
+		'object_list' : page.object_list,
+	}
+
+async def aget_object_or_404(queryset, **kwargs):
+	try:
+		return await queryset.aget(**kwargs)
+	except queryset.model.DoesNotExist:
+		raise Http404(f'No {queryset.model._meta.verbose_name} found matching the query')
+
+@require_safe
+async def index(request):
+	'''Async index().'''
+	stats = await aget_catalog_stats()
+
+	num_visits = await sync_to_async(get_visit_count)(request) + 1
+
+	context = {
+		**stats,
+
+		'num_visits' : num_visits,
+	}
+
+	response = await arender(request, 'index.html', context=context)
+	return set_visit_count(response, num_visits)
+
+@require_safe
+async def book_list(request):
+	'''Async BookListView.'''
+	context = await apaginate(request, BookListView.queryset.all())
+	context['book_list'] = context['object_list']
+
+	return await arender(request, 'catalog/book_list.html', context)
+
+@require_safe
+async def book_detail(request, pk):
+	'''Async BookDetailView, genres and copies stay lazy behind the page cache.'''
+	# cached under the newest token, read from the primary like VersionedPageMixin
+	with use_primary():
+		book, page_version = await asyncio.gather(
+			aget_object_or_404(BookDetailView.queryset.all(), pk=pk),
+			aget_object_version(Book, pk)
+		)
+
+		context = {
+			'object' : book,
+			'book' : book,
+			'copies' : CopySummary(book),
+			'page_version' : page_version,
+			'page_cache_timeout' : settings.CATALOG_PAGE_CACHE_TIMEOUT,
+		}
+		return await arender(request, 'catalog/book_detail.html', context)
+
+@require_safe
+async def author_list(request):
+	'''Async AuthorListView.'''
+	context = await apaginate(request, Author.objects.all())
+	context['author_list'] = context['object_list']
+
+	return await arender(request, 'catalog/author_list.html', context)
+
+@require_safe
+async def author_detail(request, pk):
+	'''Async AuthorDetailView.'''
+	with use_primary():
+		author, page_version = await asyncio.gather(
+			aget_object_or_404(Author.objects.all(), pk=pk),
+			aget_object_version(Author, pk)
+		)
+
+		context = {
+			'object' : author,
+			'author' : author,
+			'books' : author_books(author),
+			'page_version' : page_version,
+			'page_cache_timeout' : settings.CATALOG_PAGE_CACHE_TIMEOUT,
+		}
+		return await arender(request, 'catalog/author_detail.html', context)
+
+@require_safe
+async def loaned_books_by_user(request, overdue=False):
+	'''Async LoanedBooksByUserListView.'''
+	user = await request.auser()
+	if not user.is_authenticated:
+		return redirect_to_login(request.get_full_path())
+
+	context = await apaginate(request, loans_of(user, overdue=overdue))
+	context['bookinstance_list'] = context['object_list']
+	context['overdue'] = overdue
+
+	return await arender(request, 'catalog/bookinstance_list_borrowed_user.html', context)
+
+@require_safe
+async def all_loaned_books(request, overdue=False):
+	'''Async AllLoanedBooksListView.'''
+	user = await request.auser()
+	if not await sync_to_async(user.has_perm)('catalog.can_mark_returned'):
+		if user.is_authenticated:
+			raise PermissionDenied
+		return redirect_to_login(request.get_full_path())
+
+	context = await apaginate(request, all_loans(overdue=overdue))
+	context['bookinstance_list'] = context['object_list']
+	context['overdue'] = overdue
+
+	return await arender(request, 'catalog/bookinstance_list_all_borrowed.html', context)
@@ -0,0 +1,275 @@
+import asyncio
+import datetime
+import io
+import json
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections, router
+from django.urls import URLPattern, reverse
+from django.urls.converters import UUIDConverter
+
+from . import urls
+from .middleware import QueryRecorder
+from .models import Author, Book, BookInstance
+
+# Helpers shared by the benchmark commands: URL discovery, timing, percentiles and
+# the machine-readable result files they write
+
+# Query strings for the views that need one to do any work
+QUERY_STRINGS = {
+	'book_search' : 'q=river',
+}
+
+# Streams the whole catalog, or answers only the borrower; excluded unless asked for by name
+DEFAULT_EXCLUDE = {'catalog_export', 'api_hold_detail'}
+
+def percentile(samples, pct):
+	'''Nearest-rank percentile of a list of numbers.'''
+	if not samples:
+		return None
+	ordered = sorted(samples)
+	rank = max(1, -(-len(ordered) * pct // 100))
+	return ordered[int(rank) - 1]
+
+def summarize(durations, queries=None):
+	'''Latency percentiles (milliseconds) and query counts of a set of samples.'''
+	summary = {
+		'requests' : len(durations),
+		'p50_ms' : round(percentile(durations, 50) * 1000, 2),
+		'p95_ms' : round(percentile(durations, 95) * 1000, 2),
+		'p99_ms' : round(percentile(durations, 99) * 1000, 2),
+		'mean_ms' : round(sum(durations) / len(durations) * 1000, 2),
+	}
+	if queries:
+		summary['queries_per_request'] = round(sum(queries) / len(queries), 2)
+		summary['max_queries'] = max(queries)
+	return summary
+
+def dataset_size():
+	'''Row counts the results were measured against.'''
+	return {
+		'books' : Book.objects.count(),
+		'authors' : Author.objects.count(),
+		'copies' : BookInstance.objects.count(),
+		'users' : get_user_model().objects.count(),
+	}
+
+def environment():
+	connection = connections[router.db_for_read(Book)]
+	return {
+		'python' : platform.python_version(),
+		'django' : django.get_version(),
+		'database' : connection.vendor,
+		'measured_at' : datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+	}
+
+def sample_kwargs():
+	'''URL arguments pointing at existing objects, None when the catalog is empty.'''
+	book = Book.objects.order_by('-pk').values_list('pk', flat=True).first()
+	author = Author.objects.order_by('-pk').values_list('pk', flat=True).first()
+	copy = BookInstance.objects.filter(status__exact='o').values_list('pk', flat=True).first()
+
+	return {
+		'book' : book,
+		'author' : author,
+		'copy' : copy,
+	}
+
+def catalog_urls(include=(), exclude=DEFAULT_EXCLUDE):
+	'''Returns [(name, url)] for the named routes in catalog/urls.py.'''
+	objects = sample_kwargs()
+	found = []
+
+	for pattern in urls.urlpatterns:
+		if not isinstance(pattern, URLPattern) or not pattern.name:
+			continue
+		name = pattern.name
+		if (include and name not in include) or (not include and name in exclude):
+			continue
+
+		converters = pattern.pattern.converters
+		kwargs = {}
+		if 'pk' in converters:
+			if isinstance(converters['pk'], UUIDConverter):
+				kwargs['pk'] = objects['copy']
+			elif name.startswith(('author', 'api_author')):
+				kwargs['pk'] = objects['author']
+			else:
+				kwargs['pk'] = objects['book']
+		if 'dataset' in converters:
+			kwargs.update(dataset='books', fmt='csv')
+		if None in kwargs.values():
+			continue
+
+		url = reverse(name, kwargs=kwargs or None)
+		if name in QUERY_STRINGS:
+			url = f'{url}?{QUERY_STRINGS[name]}'
+		found.append((name, url))
+
+	return found
+
+def time_requests(client, url, requests, warmup=0):
+	'''Times requests GETs of url, returns (status, durations, queries).'''
+	for _ in range(warmup):
+		consume(client.get(url))
+
+	durations = []
+	queries = []
+	status = None
+	for _ in range(requests):
+		recorder = QueryRecorder()
+		with recorder.record():
+			started = time.perf_counter()
+			response = client.get(url)
+			consume(response)
+			durations.append(time.perf_counter() - started)
+		queries.append(recorder.count)
+		status = response.status_code
+
+	return status, durations, queries
+
+def consume(response):
+	'''Reads a streaming response to the end, so its queries and time are included.'''
+	if response.streaming:
+		for _ in response.streaming_content:
+			pass
+	return response
+
+def write_results(path, results):
+	with open(path, 'w', encoding='utf-8') as output:
+		json.dump(results, output, indent=2, sort_keys=True)
+		output.write('\n')
+
+def compare(results, baseline, key='p95_ms'):
+	'''Yields (name, baseline value, value, change %) for the entries found in both runs.'''
+	before = { entry['name'] : entry for entry in baseline.get('results', []) }
+	for entry in results['results']:
+		old = before.get(entry['name'])
+		if old and old.get(key) and entry.get(key) is not None:
+			yield entry['name'], old[key], entry[key], (entry[key] - old[key]) / old[key] * 100
+
+# Pages with an async version in async_views.py, compared under WSGI and ASGI
+ASYNC_PAGES = ('index', 'books', 'book_detail', 'authors', 'author_detail')
+
+def split(total, parts):
+	'''Splits total into parts near-equal shares.'''
+	return [total // parts + (1 if part < total % parts else 0) for part in range(parts)]
+
+def wsgi_get(handler, url, host):
+	'''Sends one anonymous GET straight through the WSGI handler, returns the status code.'''
+	path, _, query = url.partition('?')
+	environ = {
+		'REQUEST_METHOD' : 'GET',
+		'SCRIPT_NAME' : '',
+		'PATH_INFO' : path,
+		'QUERY_STRING' : query,
+		'SERVER_NAME' : host,
+		'SERVER_PORT' : '80',
+		'HTTP_HOST' : host,
+		'wsgi.url_scheme' : 'http',
+		'wsgi.input' : io.BytesIO(),
+		'wsgi.errors' : sys.stderr,
+	}
+	status = []
+
+	def start_response(response_status, headers, exc_info=None):
+		status.append(int(response_status.split()[0]))
+
+	response = handler(environ, start_response)
+	try:
+		for _ in response:
+			pass
+	finally:
+		# fires request_finished, as a WSGI server would
+		response.close()
+
+	return status[0]
+
+async def asgi_get(handler, url, host):
+	'''Sends one anonymous GET straight through the ASGI handler, returns the status code.'''
+	path, _, query = url.partition('?')
+	scope = {
+		'type' : 'http',
+		'asgi' : { 'version' : '3.0' },
+		'http_version' : '1.1',
+		'method' : 'GET',
+		'scheme' : 'http',
+		'root_path' : '',
+		'path' : path,
+		'raw_path' : path.encode(),
+		'query_string' : query.encode(),
+		'headers' : [(b'host', host.encode())],
+		'server' : (host, 80),
+		'client' : ('127.0.0.1', 0),
+	}
+	disconnected = asyncio.Event()
+	body_sent = False
+	status = []
+
+	async def receive():
+		nonlocal body_sent
+		if not body_sent:
+			body_sent = True
+			return { 'type' : 'http.request', 'body' : b'', 'more_body' : False }
+		# the client never goes away before the response is complete
+		await disconnected.wait()
+		return { 'type' : 'http.disconnect' }
+
+	async def send(message):
+		if message['type'] == 'http.response.start':
+			status.append(message['status'])
+
+	await handler(scope, receive, send)
+	return status[0]
+
+def wsgi_throughput(url, requests, concurrency, host):
+	'''Runs requests GETs of url from concurrency threads, returns (elapsed, durations, statuses).'''
+	handler = WSGIHandler()
+
+	def worker(count):
+		durations = []
+		statuses = set()
+		for _ in range(count):
+			started = time.perf_counter()
+			statuses.add(wsgi_get(handler, url, host))
+			durations.append(time.perf_counter() - started)
+		return durations, statuses
+
+	started = time.perf_counter()
+	with ThreadPoolExecutor(concurrency) as pool:
+		results = list(pool.map(worker, split(requests, concurrency)))
+
+	return collect(time.perf_counter() - started, results)
+
+def asgi_throughput(url, requests, concurrency, host):
+	'''Runs requests GETs of url from concurrency tasks, returns (elapsed, durations, statuses).'''
+	handler = ASGIHandler()
+
+	async def worker(count):
+		durations = []
+		statuses = set()
+		for _ in range(count):
+			started = time.perf_counter()
+			statuses.add(await asgi_get(handler, url, host))
+			durations.append(time.perf_counter() - started)
+		return durations, statuses
+
+	async def run():
+		return await asyncio.gather(*(worker(count) for count in split(requests, concurrency)))
+
+	started = time.perf_counter()
+	results = asyncio.run(run())
+
+	return collect(time.perf_counter() - started, results)
+
+def collect(elapsed, results):
+	durations = [duration for worker_durations, statuses in results for duration in worker_durations]
+	statuses = set().union(*(statuses for worker_durations, statuses in results))
+	return elapsed, durations, sorted(statuses)
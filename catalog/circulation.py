@@ -0,0 +1,316 @@
+import datetime
+
+from django.db import connections, router, transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import BookInstance, CopyCount, Hold, LoanEvent, LoanEventArchive, copies_bulk_changed
+
+# Loan length when checking out without a due date
+LOAN_PERIOD = datetime.timedelta(weeks=3)
+
+# Time a borrower has to collect a copy reserved for their hold, stored as its due_back
+PICKUP_PERIOD = datetime.timedelta(weeks=1)
+
+# Loan events inserted per INSERT
+EVENT_BATCH_SIZE = 500
+
+class CirculationError(Exception):
+	'''The copy isn't in the state the operation needs.'''
+
+class CopyUnavailable(CirculationError):
+	pass
+
+class NotOnLoan(CirculationError):
+	pass
+
+def _pk(obj):
+	return getattr(obj, 'pk', obj)
+
+def _copies(using):
+	return BookInstance.objects.using(using or router.db_for_write(BookInstance))
+
+def _skip_locked(queryset):
+	'''Locks the rows read, skipping the ones a concurrent transaction holds, where supported.'''
+	if connections[queryset.db].features.has_select_for_update_skip_locked:
+		return queryset.select_for_update(skip_locked=True)
+	return queryset
+
+def default_due_back():
+	return datetime.date.today() + LOAN_PERIOD
+
+# Loan ledger
+
+LOAN_FIELDS = ('pk', 'book', 'borrower', 'due_back')
+
+def record(using, action, loans):
+	'''Appends a LoanEvent per (copy id, book id, borrower id, due_back) to the ledger.'''
+	LoanEvent.objects.using(using).bulk_create(
+		[
+			LoanEvent(action=action, copy_id=copy_id, book_id=book_id, borrower_id=borrower_id, due_back=due_back)
+			for copy_id, book_id, borrower_id, due_back in loans
+		],
+		batch_size=EVENT_BATCH_SIZE,
+	)
+
+def record_copies(copies, action):
+	'''Appends an event per copy with its current book, borrower and due date.'''
+	record(copies.db, action, copies.order_by().values_list(*LOAN_FIELDS))
+
+def loan_history(book=None, borrower=None, using=None):
+	'''
+	Events of a book or a borrower, newest first, from the ledger and its archive
+	together. Each side is read through its (book or borrower, created) index.
+	'''
+	filters = {}
+	if book is not None:
+		filters['book'] = _pk(book)
+	if borrower is not None:
+		filters['borrower'] = _pk(borrower)
+
+	fields = ('id', 'action', 'copy', 'book', 'borrower', 'due_back', 'created')
+	using = using or router.db_for_read(LoanEvent)
+	recent = LoanEvent.objects.using(using).filter(**filters).values(*fields)
+	archived = LoanEventArchive.objects.using(using).filter(**filters).values(*fields)
+
+	return recent.union(archived, all=True).order_by('-created', '-id')
+
+def lend(copies, borrower_id, due_back, status):
+	'''
+	Lends out the first copy in copies with status, 'a' or 'r' for a copy reserved for
+	the borrower, returns its (copy id, book id), None when there's no such copy.
+
+	The copy is picked and taken in one statement, UPDATE ... WHERE id = (SELECT ...
+	LIMIT 1 FOR UPDATE SKIP LOCKED) RETURNING, two librarians can never lend out the
+	same copy and concurrent checkouts of a book take different copies instead of
+	queueing on the same row. The copy leaves a known status, so the counters are moved
+	by one instead of counting the copies first like BookInstanceQuerySet.update().
+	'''
+	ready = copies.filter(status__exact=status)
+	if status == 'r':
+		ready = ready.filter(borrower_id=borrower_id)
+	pick, pick_params = _skip_locked(ready.order_by('pk').values('pk')[:1]).query.get_compiler(copies.db).as_sql()
+
+	connection = connections[copies.db]
+	opts = BookInstance._meta
+	table, pk, book, status_column, borrower, due = (
+		connection.ops.quote_name(name)
+		for name in (opts.db_table, opts.pk.column, *(opts.get_field(field).column for field in ('book', 'status', 'borrower', 'due_back')))
+	)
+	with connection.cursor() as cursor:
+		cursor.execute(
+			f'UPDATE {table} SET {status_column} = %s, {borrower} = %s, {due} = %s '
+			f'WHERE {pk} = ({pick}) AND {status_column} = %s RETURNING {pk}, {book}',
+			['o', borrower_id, connection.ops.adapt_datefield_value(due_back), *pick_params, status],
+		)
+		row = cursor.fetchone()
+
+	if row is None:
+		return None
+
+	copy_id, book_id = opts.pk.to_python(row[0]), row[1]
+	CopyCount.objects.db_manager(copies.db).adjust({ (book_id, status) : -1, (book_id, 'o') : 1 })
+	copies_bulk_changed.send(sender=BookInstance, using=copies.db, book_ids={ book_id })
+	return copy_id, book_id
+
+def checkout(book, borrower, due_back=None, using=None):
+	'''
+	Lends out any available copy of the book, returns the copy id. A copy reserved for
+	the borrower's hold is taken first. Raises CopyUnavailable when no copy is left.
+	'''
+	copies = _copies(using).filter(book_id=_pk(book))
+	due_back = due_back or default_due_back()
+
+	with transaction.atomic(using=copies.db):
+		lent = lend(copies, _pk(borrower), due_back, 'r')
+		if lent is not None:
+			Hold.objects.using(copies.db).filter(copy=lent[0]).delete()
+		else:
+			lent = lend(copies, _pk(borrower), due_back, 'a')
+
+		if lent is not None:
+			record(copies.db, 'c', [(*lent, _pk(borrower), due_back)])
+			return lent[0]
+
+	raise CopyUnavailable(f'No copy of book {_pk(book)} is available.')
+
+def checkout_copy(copy, borrower, due_back=None, using=None):
+	'''Lends out the given copy, raises CopyUnavailable unless it is available or reserved for the borrower.'''
+	copies = _copies(using).filter(pk=_pk(copy))
+	due_back = due_back or default_due_back()
+
+	with transaction.atomic(using=copies.db):
+		lent = lend(copies, _pk(borrower), due_back, 'a')
+		if lent is None:
+			lent = lend(copies, _pk(borrower), due_back, 'r')
+			if lent is None:
+				raise CopyUnavailable(f'Copy {_pk(copy)} is not available.')
+			Hold.objects.using(copies.db).filter(copy=_pk(copy), borrower=_pk(borrower)).delete()
+
+		record(copies.db, 'c', [(*lent, _pk(borrower), due_back)])
+
+def give_back(copy, using=None):
+	'''
+	Takes back a lent out copy and hands it to the first hold on its book, or makes
+	it available. Raises NotOnLoan unless the copy is on loan.
+	'''
+	copies = _copies(using)
+
+	with transaction.atomic(using=copies.db):
+		loan = copies.filter(pk=_pk(copy), status__exact='o').values_list(*LOAN_FIELDS).first()
+		if loan is None:
+			raise NotOnLoan(f'Copy {_pk(copy)} is not on loan.')
+
+		# ahead of the reservation it may lead to, rolled back with it if the copy was taken back concurrently
+		record(copies.db, 'r', [loan])
+		if not release(copies, _pk(copy), loan[1], 'o'):
+			raise NotOnLoan(f'Copy {_pk(copy)} is not on loan.')
+
+def renew(copy, due_back, using=None):
+	'''
+	Moves the due date of a lent out copy, raises NotOnLoan unless it is on loan. Only
+	due_back is written, a concurrent return or checkout is never overwritten.
+	'''
+	copies = _copies(using)
+
+	with transaction.atomic(using=copies.db):
+		if not copies.filter(pk=_pk(copy), status__exact='o').update(due_back=due_back):
+			raise NotOnLoan(f'Copy {_pk(copy)} is not on loan.')
+		record_copies(copies.filter(pk=_pk(copy)), 'n')
+
+# Bulk operations, one UPDATE per batch of copies
+
+def renew_many(copies, due_back):
+	'''Moves the due date of every lent out copy in copies, returns how many.'''
+	with transaction.atomic(using=copies.db):
+		renewed = copies.filter(status__exact='o').update(due_back=due_back)
+		record_copies(copies.filter(status__exact='o', due_back=due_back), 'n')
+		return renewed
+
+def give_back_many(copies):
+	'''
+	Takes back every lent out copy in copies, returns how many. Copies of books with a
+	waiting hold are reserved for it one by one, the rest are made available together.
+	'''
+	with transaction.atomic(using=copies.db):
+		on_loan = copies.filter(status__exact='o')
+		loans = list(on_loan.order_by().values_list(*LOAN_FIELDS))
+		record(copies.db, 'r', loans)
+		waited_for = Exists(Hold.objects.filter(book=OuterRef('book'), copy__isnull=True))
+
+		returned = 0
+		for copy_id, book_id in list(on_loan.filter(waited_for).values_list('pk', 'book')):
+			returned += release(copies, copy_id, book_id, 'o')
+
+		returned += on_loan.update(status='a', borrower=None, due_back=None)
+		return returned
+
+def send_to_maintenance(copies):
+	'''Takes the copies out of circulation, returns how many. Holds they were reserved for wait again.'''
+	with transaction.atomic(using=copies.db):
+		Hold.objects.using(copies.db).filter(copy__in=copies.values('pk')).update(copy=None)
+
+		in_circulation = copies.exclude(status__exact='m')
+		# with the borrower and due date they had
+		loans = list(in_circulation.order_by().values_list(*LOAN_FIELDS))
+		sent = in_circulation.update(status='m', borrower=None, due_back=None)
+		record(copies.db, 'm', loans)
+		return sent
+
+# Holds
+
+def queue(book_id, using):
+	'''Holds of the book still waiting for a copy, first come first served.'''
+	return Hold.objects.using(using).filter(book_id=book_id, copy__isnull=True).order_by('created', 'id')
+
+def release(copies, copy_id, book_id, status):
+	'''
+	Reserves a copy leaving status for the first hold on its book, or makes it available
+	when nobody waits; returns whether the copy still had that status. The head of the
+	queue is read from the (book, created) index, never scanned for.
+	'''
+	copy = copies.filter(pk=copy_id, status__exact=status)
+	hold = _skip_locked(queue(book_id, copies.db)).first()
+	if hold is None:
+		return copy.update(status='a', borrower=None, due_back=None) == 1
+
+	pickup_by = datetime.date.today() + PICKUP_PERIOD
+	if not copy.update(status='r', borrower_id=hold.borrower_id, due_back=pickup_by):
+		return False
+
+	Hold.objects.using(copies.db).filter(pk=hold.pk).update(copy=copy_id)
+	record(copies.db, 'h', [(copy_id, book_id, hold.borrower_id, pickup_by)])
+	return True
+
+def place_hold(book, borrower, using=None):
+	'''
+	Queues the borrower for a copy of the book and returns their Hold, the existing one
+	if they already wait. Nobody waiting and a copy available, it's reserved right away.
+	'''
+	copies = _copies(using)
+
+	with transaction.atomic(using=copies.db):
+		hold, created = Hold.objects.using(copies.db).get_or_create(book_id=_pk(book), borrower_id=_pk(borrower))
+		if not created or queue(hold.book_id, copies.db).exclude(pk=hold.pk).exists():
+			return hold
+
+		available = copies.filter(book_id=hold.book_id, status__exact='a').order_by('pk').values_list('pk', flat=True)
+		copy_id = _skip_locked(available).first()
+		if copy_id is not None:
+			pickup_by = datetime.date.today() + PICKUP_PERIOD
+			reserved = copies.filter(pk=copy_id, status__exact='a').update(
+				status='r', borrower_id=hold.borrower_id, due_back=pickup_by
+			)
+			if reserved:
+				hold.copy_id = copy_id
+				hold.save(update_fields=['copy'])
+				record(copies.db, 'h', [(copy_id, hold.book_id, hold.borrower_id, pickup_by)])
+
+	return hold
+
+def cancel_hold(hold, using=None):
+	'''Drops the hold, a copy reserved for it goes to the next hold in line.'''
+	copies = _copies(using)
+
+	with transaction.atomic(using=copies.db):
+		Hold.objects.using(copies.db).filter(pk=hold.pk).delete()
+		if hold.copy_id is not None:
+			release(copies.filter(borrower_id=hold.borrower_id), hold.copy_id, hold.book_id, 'r')
+
+def queue_position(hold, using=None):
+	'''1-based place of a waiting hold in its book's queue, 0 once a copy is reserved for it.'''
+	if hold.copy_id is not None:
+		return 0
+
+	ahead = queue(hold.book_id, using or router.db_for_read(Hold)).filter(
+		Q(created__lt=hold.created) | Q(created=hold.created, id__lt=hold.id)
+	)
+	return ahead.count() + 1
+
+def estimated_availability(hold, position=None, using=None):
+	'''
+	Date a copy is expected for a waiting hold: the due date of the loan that ends in its
+	turn, assuming loans end on their due date and every later one runs LOAN_PERIOD.
+	None without copies on loan. Reads the loan counter and one row of the book's loans
+	by due date, the whole queue or all loans are never loaded.
+	'''
+	using = using or router.db_for_read(BookInstance)
+	position = position or queue_position(hold, using)
+	if not position:
+		return datetime.date.today()
+
+	on_loan = CopyCount.objects.db_manager(using).counts(hold.book_id).get('o', 0)
+	if on_loan <= 0:
+		return None
+
+	rounds, index = divmod(position - 1, on_loan)
+	due_back = list(
+		BookInstance.objects
+			.using(using)
+			.filter(book_id=hold.book_id, status__exact='o', due_back__isnull=False)
+			.order_by('due_back')
+			.values_list('due_back', flat=True)[index:index + 1]
+	)
+	if not due_back:
+		return None
+
+	return max(due_back[0], datetime.date.today()) + rounds * LOAN_PERIOD
@@ -0,0 +1,26 @@
+import hashlib
+
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+def permission_set_key(user):
+	'''
+	Names what the layout shows a user: their login state and permission set. Users
+	with the same key see the same sidebar links.
+	'''
+	if not user.is_authenticated:
+		return 'anonymous'
+	if user.is_active and user.is_superuser:
+		# every permission, without loading them
+		return 'superuser'
+
+	permissions = sorted(user.get_all_permissions())
+	return hashlib.sha1('\n'.join(permissions).encode()).hexdigest()
+
+def layout(request):
+	'''Cache key and lifetime of the {% cache %} fragments in base_generic.html.'''
+	return {
+		# lazy, pages that don't extend the layout never load the user for it
+		'layout_cache_key' : SimpleLazyObject(lambda: permission_set_key(request.user)),
+		'layout_cache_timeout' : settings.CATALOG_LAYOUT_CACHE_TIMEOUT,
+	}
@@ -0,0 +1,71 @@
+import csv
+import json
+
+from django.db.models import Prefetch
+
+from .models import Book, BookInstance, Genre
+
+# Rows fetched (and prefetched for) per database round trip
+EXPORT_CHUNK_SIZE = 2000
+
+BOOK_FIELDS = ['id', 'title', 'isbn', 'summary', 'author_id', 'author', 'language', 'genres']
+COPY_FIELDS = ['id', 'book_id', 'imprint', 'status', 'due_back', 'borrower_id']
+
+def book_rows(chunk_size=EXPORT_CHUNK_SIZE):
+	'''Yields every book with author, language and genres flattened.'''
+	books = (
+		Book.objects
+			.select_related('author', 'language')
+			.prefetch_related(Prefetch('genre', queryset=Genre.objects.only('name')))
+			.order_by('pk')
+	)
+
+	for book in books.iterator(chunk_size=chunk_size):
+		yield {
+			'id' : book.pk,
+			'title' : book.title,
+			'isbn' : book.isbn,
+			'summary' : book.summary,
+			'author_id' : book.author_id,
+			'author' : str(book.author) if book.author else '',
+			'language' : book.language.name if book.language else '',
+			# same separator import_catalog reads
+			'genres' : ';'.join(genre.name for genre in book.genre.all()),
+		}
+
+def copy_rows(chunk_size=EXPORT_CHUNK_SIZE):
+	'''Yields every copy with its status, due date and borrower id.'''
+	copies = BookInstance.objects.order_by('pk').values_list(*COPY_FIELDS)
+
+	for row in copies.iterator(chunk_size=chunk_size):
+		yield dict(zip(COPY_FIELDS, row))
+
+DATASETS = {
+	'books' : (BOOK_FIELDS, book_rows),
+	'copies' : (COPY_FIELDS, copy_rows),
+}
+
+FORMATS = {
+	'csv' : 'text/csv',
+	'jsonl' : 'application/x-ndjson',
+}
+
+class Echo:
+	'''File-like object handing back what the csv writer writes, for streaming.'''
+
+	def write(self, value):
+		return value
+
+def export_lines(dataset, fmt, chunk_size=EXPORT_CHUNK_SIZE):
+	'''Yields the dataset as CSV or JSONL text, one line at a time.'''
+	fields, rows = DATASETS[dataset]
+
+	if fmt == 'csv':
+		writer = csv.writer(Echo())
+		# header goes out before the first query runs
+		yield writer.writerow(fields)
+		for row in rows(chunk_size):
+			yield writer.writerow([row[field] for field in fields])
+	else:
+		for row in rows(chunk_size):
+			yield json.dumps(row, default=str) + '\n'
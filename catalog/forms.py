@@ -46,3 +46,8 @@ class RenewBookModelForm(ModelForm):
 		# mark the due_back field as the renewal date
 		labels = { 'due_back' : _('New renewal date') }
 		help_texts = { 'due_back' : _('Enter a date between now and 4 weeks (default 3).') }
+
+class BulkRenewForm(RenewBookForm):
+	'''Renews the loans of several copies to one date, validated like a single renewal.'''
+	# copies returned meanwhile are skipped rather than failing the whole batch
+	copies = forms.ModelMultipleChoiceField(queryset=BookInstance.objects.all())
@@ -0,0 +1,63 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from catalog.models import LoanEvent, LoanEventArchive
+from catalog.routers import use_primary
+
+FIELDS = ('id', 'action', 'copy_id', 'book_id', 'borrower_id', 'due_back', 'created')
+
+def months_ago(now, months):
+	'''The same day and time months calendar months before now, clamped to the month end.'''
+	year, month = divmod(now.year * 12 + now.month - 1 - months, 12)
+	month += 1
+	next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+	last_day = (next_month - datetime.timedelta(days=1)).day
+	return now.replace(year=year, month=month, day=min(now.day, last_day))
+
+class Command(BaseCommand):
+	help = (
+		'Moves loan events older than --months into the archive table in batches, each batch '
+		'copied and deleted in one transaction. The ledger stays small, catalog.circulation.'
+		'loan_history() still reads both.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('--months', type=int, default=12, help='Archive events older than this many months.')
+		parser.add_argument('--batch-size', type=int, default=5000, help='Events moved per transaction.')
+		parser.add_argument('--dry-run', action='store_true', help='Only count the events that would be archived.')
+
+	@use_primary()
+	def handle(self, *args, **options):
+		if options['months'] < 0 or options['batch_size'] < 1:
+			raise CommandError('--months must not be negative and --batch-size must be at least 1.')
+
+		cutoff = months_ago(timezone.now(), options['months'])
+		old = LoanEvent.objects.filter(created__lt=cutoff)
+		if options['dry_run']:
+			self.stdout.write(f'Would archive {old.count()} loan event(s) from before {cutoff:%Y-%m-%d}.')
+			return
+
+		moved = 0
+
+		while True:
+			with transaction.atomic():
+				# the oldest first, by the created index
+				batch = list(old.order_by('created', 'id').values_list(*FIELDS)[:options['batch_size']])
+				if not batch:
+					break
+
+				# ignore_conflicts: rows copied by an interrupted run that didn't get to delete them
+				LoanEventArchive.objects.bulk_create(
+					[LoanEventArchive(**dict(zip(FIELDS, row))) for row in batch],
+					batch_size=500,
+					ignore_conflicts=True,
+				)
+				LoanEvent.objects.filter(pk__in=[row[0] for row in batch]).delete()
+
+			moved += len(batch)
+			self.stdout.write(f'Archived {moved} event(s).')
+
+		self.stdout.write(self.style.SUCCESS(f'Archived {moved} loan event(s) from before {cutoff:%Y-%m-%d}.'))
@@ -0,0 +1,108 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import benchmark
+from catalog.management.commands.benchmark_catalog import default_host
+
+MODES = {
+	'wsgi' : benchmark.wsgi_throughput,
+	'asgi' : benchmark.asgi_throughput,
+}
+
+class Command(BaseCommand):
+	help = (
+		'Compares the throughput of the read-only pages served by the sync views through the WSGI handler '
+		'with the async views through the ASGI handler, on the same database.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('--mode', choices=('wsgi', 'asgi', 'both'), default='both', help='Handler to measure; both runs each in a fresh process.')
+		parser.add_argument('--requests', type=int, default=200, help='Requests per URL.')
+		parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at once (threads for WSGI, tasks for ASGI).')
+		parser.add_argument('--url', action='append', default=[], dest='include', help='URL name to time (repeatable), the async pages by default.')
+		parser.add_argument('--output', '-o', help='Write the results as JSON to this file.')
+		parser.add_argument('--host', help='Host header sent, the first plain ALLOWED_HOSTS entry by default.')
+
+	def handle(self, *args, **options):
+		if options['requests'] < 1 or options['concurrency'] < 1:
+			raise CommandError('--requests and --concurrency must be at least 1.')
+
+		if options['mode'] == 'both':
+			results = self.run_both(options)
+		else:
+			results = self.run(options['mode'], options)
+
+		for run in results['runs']:
+			self.stdout.write(f'{run["mode"].upper()} (async views {"on" if run["async_views"] else "off"})')
+			for entry in run['results']:
+				self.stdout.write(
+					f'  {entry["name"]:<16} {entry["throughput_rps"]:>9.1f} req/s '
+					f'p50 {entry["p50_ms"]:>8.2f} ms  p95 {entry["p95_ms"]:>8.2f} ms  p99 {entry["p99_ms"]:>8.2f} ms'
+				)
+
+		if options['output']:
+			benchmark.write_results(options['output'], results)
+			self.stdout.write(f'Results written to {options["output"]}.')
+
+	def run(self, mode, options):
+		if mode == 'asgi' and not settings.CATALOG_ASYNC_VIEWS:
+			self.stderr.write('CATALOG_ASYNC_VIEWS is off, the ASGI handler serves the sync views.')
+
+		host = options['host'] or default_host()
+		run = { 'mode' : mode, 'async_views' : settings.CATALOG_ASYNC_VIEWS, 'concurrency' : options['concurrency'], 'results' : [] }
+
+		for name, url in benchmark.catalog_urls(include=options['include'] or benchmark.ASYNC_PAGES):
+			elapsed, durations, statuses = MODES[mode](url, options['requests'], options['concurrency'], host)
+			run['results'].append({
+				'name' : name,
+				'url' : url,
+				'statuses' : statuses,
+				'throughput_rps' : round(len(durations) / elapsed, 1),
+				**benchmark.summarize(durations),
+			})
+
+		return {
+			'dataset' : benchmark.dataset_size(),
+			'environment' : benchmark.environment(),
+			'runs' : [run],
+		}
+
+	def run_both(self, options):
+		'''Runs each mode in its own process, the URL routing is fixed at import time.'''
+		runs = []
+		results = None
+
+		for mode, async_views in (('wsgi', 'False'), ('asgi', 'True')):
+			with tempfile.TemporaryDirectory() as directory:
+				output = Path(directory) / f'{mode}.json'
+				command = [
+					sys.executable, '-m', 'django', 'benchmark_async',
+					'--mode', mode,
+					'--requests', str(options['requests']),
+					'--concurrency', str(options['concurrency']),
+					'--output', str(output),
+				]
+				for name in options['include']:
+					command += ['--url', name]
+				if options['host']:
+					command += ['--host', options['host']]
+
+				subprocess.run(
+					command,
+					check=True,
+					cwd=settings.BASE_DIR,
+					stdout=subprocess.DEVNULL,
+					env={ **os.environ, 'CATALOG_ASYNC_VIEWS' : async_views, 'DJANGO_SETTINGS_MODULE' : os.environ.get('DJANGO_SETTINGS_MODULE', 'liib1.settings') },
+				)
+				results = json.loads(output.read_text())
+				runs.extend(results['runs'])
+
+		results['runs'] = runs
+		return results
@@ -0,0 +1,78 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from catalog import benchmark
+
+# Typical workflow, once per catalog size (10k, 100k, 1M books):
+#
+#   manage.py flush --no-input
+#   manage.py seed_catalog --books 100000 --copies-per-book 3 --users 1000
+#   manage.py benchmark_catalog --label 100k --output bench-100k.json --compare bench-100k-main.json
+
+class Command(BaseCommand):
+	help = 'Times every catalog URL through the test client and reports latency percentiles and queries per request.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--requests', type=int, default=50, help='Timed requests per URL.')
+		parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per URL before timing (fills caches).')
+		parser.add_argument('--username', help='Log the client in as this user, anonymous by default.')
+		parser.add_argument('--url', action='append', default=[], dest='include', help='URL name to time (repeatable), all by default.')
+		parser.add_argument('--label', default='', help='Name of the run stored with the results, e.g. the catalog size.')
+		parser.add_argument('--output', '-o', help='Write the results as JSON to this file.')
+		parser.add_argument('--compare', help='Earlier JSON results to print p95 changes against.')
+		parser.add_argument('--host', help='Host header sent, the first plain ALLOWED_HOSTS entry by default.')
+
+	def handle(self, *args, **options):
+		if options['requests'] < 1:
+			raise CommandError('--requests must be at least 1.')
+
+		client = Client(SERVER_NAME=options['host'] or default_host())
+		if options['username']:
+			try:
+				client.force_login(get_user_model().objects.get_by_natural_key(options['username']))
+			except get_user_model().DoesNotExist:
+				raise CommandError(f'No user named {options["username"]!r}.')
+
+		urls = benchmark.catalog_urls(include=options['include'])
+		if not urls:
+			raise CommandError('Nothing to time, is the catalog empty?')
+
+		results = {
+			'label' : options['label'],
+			'user' : options['username'] or None,
+			'dataset' : benchmark.dataset_size(),
+			'environment' : benchmark.environment(),
+			'results' : [],
+		}
+
+		self.stdout.write(f'{"url":<28} {"status":>6} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"queries":>8}')
+		for name, url in urls:
+			status, durations, queries = benchmark.time_requests(client, url, options['requests'], options['warmup'])
+			entry = { 'name' : name, 'url' : url, 'status' : status, **benchmark.summarize(durations, queries) }
+			results['results'].append(entry)
+
+			self.stdout.write(
+				f'{name:<28} {status:>6} {entry["p50_ms"]:>9.2f} {entry["p95_ms"]:>9.2f} '
+				f'{entry["p99_ms"]:>9.2f} {entry["queries_per_request"]:>8.1f}'
+			)
+
+		if options['output']:
+			benchmark.write_results(options['output'], results)
+			self.stdout.write(f'Results written to {options["output"]}.')
+
+		if options['compare']:
+			with open(options['compare'], encoding='utf-8') as baseline:
+				changes = benchmark.compare(results, json.load(baseline))
+				for name, before, after, change in changes:
+					self.stdout.write(f'{name:<28} p95 {before:>9.2f} -> {after:>9.2f} ms ({change:+.0f}%)')
+
+def default_host():
+	'''A host the test client may use without tripping the ALLOWED_HOSTS check.'''
+	for host in settings.ALLOWED_HOSTS:
+		if host and '*' not in host and not host.startswith('.'):
+			return host
+	return 'localhost'
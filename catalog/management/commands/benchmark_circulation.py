@@ -0,0 +1,167 @@
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+
+from catalog import benchmark, circulation
+from catalog.models import BookInstance
+
+OPERATIONS = ('checkout', 'renew', 'return')
+
+class Command(BaseCommand):
+	help = (
+		'Measures checkout, renew and return throughput with N workers writing in parallel. '
+		'Every copy lent out is returned, but the due dates and counters are really written.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('--workers', type=int, default=4, help='Parallel workers, each with its own connection.')
+		parser.add_argument('--loans', type=int, default=100, help='Checkout/renew/return cycles per worker.')
+		parser.add_argument('--books', type=int, default=1000, help='Books to borrow from, 1 makes every checkout contend for the same copies.')
+		parser.add_argument('--seed', type=int, default=0, help='Random seed for picking books and borrowers.')
+		parser.add_argument('--output', '-o', help='Write the results as JSON to this file.')
+		parser.add_argument(
+			'--compare-profiles',
+			action='store_true',
+			help='Run once with DJANGO_DB_PROFILE=plain and once with tuned, each in a fresh process.'
+		)
+
+	def handle(self, *args, **options):
+		if options['workers'] < 1 or options['loans'] < 1 or options['books'] < 1:
+			raise CommandError('--workers, --loans and --books must be at least 1.')
+
+		if options['compare_profiles']:
+			results = self.run_profiles(options)
+		else:
+			results = self.run(options)
+
+		for run in results['runs']:
+			self.stdout.write(
+				f'{run["profile"]}: {run["workers"]} workers, {run["throughput_ops"]:.1f} ops/s, '
+				f'{run["errors"]} lock errors, {run["no_copy"]} checkouts found no copy'
+			)
+			for name in OPERATIONS:
+				entry = run['operations'][name]
+				if entry:
+					self.stdout.write(
+						f'  {name:<9} p50 {entry["p50_ms"]:>8.2f} ms  p95 {entry["p95_ms"]:>8.2f} ms  p99 {entry["p99_ms"]:>8.2f} ms'
+					)
+
+		if options['output']:
+			benchmark.write_results(options['output'], results)
+			self.stdout.write(f'Results written to {options["output"]}.')
+
+	def run(self, options):
+		book_ids = list(
+			BookInstance.objects
+				.filter(status__exact='a')
+				.order_by('book')
+				.values_list('book', flat=True)
+				.distinct()[:options['books']]
+		)
+		user_ids = list(get_user_model().objects.order_by('pk').values_list('pk', flat=True)[:1000])
+		if not book_ids or not user_ids:
+			raise CommandError('Needs available copies and users, see seed_catalog.')
+
+		durations = { name : [] for name in OPERATIONS }
+		counts = { 'errors' : 0, 'no_copy' : 0 }
+		lock = threading.Lock()
+
+		def worker(number):
+			picker = random.Random(options['seed'] * 1000 + number)
+			timings = { name : [] for name in OPERATIONS }
+			errors = no_copy = 0
+
+			try:
+				for _ in range(options['loans']):
+					try:
+						started = time.perf_counter()
+						try:
+							copy_id = circulation.checkout(picker.choice(book_ids), picker.choice(user_ids))
+						except circulation.CopyUnavailable:
+							no_copy += 1
+							continue
+						finally:
+							timings['checkout'].append(time.perf_counter() - started)
+
+						started = time.perf_counter()
+						circulation.renew(copy_id, circulation.default_due_back() + datetime.timedelta(weeks=1))
+						timings['renew'].append(time.perf_counter() - started)
+
+						started = time.perf_counter()
+						circulation.give_back(copy_id)
+						timings['return'].append(time.perf_counter() - started)
+					except OperationalError:
+						# "database is locked" once the busy timeout runs out
+						errors += 1
+			finally:
+				connections.close_all()
+
+			with lock:
+				for name in OPERATIONS:
+					durations[name].extend(timings[name])
+				counts['errors'] += errors
+				counts['no_copy'] += no_copy
+
+		started = time.perf_counter()
+		with ThreadPoolExecutor(options['workers']) as pool:
+			list(pool.map(worker, range(options['workers'])))
+		elapsed = time.perf_counter() - started
+
+		run = {
+			'profile' : settings.DATABASE_PROFILE,
+			'workers' : options['workers'],
+			'elapsed_s' : round(elapsed, 3),
+			'throughput_ops' : round(sum(len(values) for values in durations.values()) / elapsed, 1),
+			**counts,
+			'operations' : {
+				name : benchmark.summarize(values) if values else None
+				for name, values in durations.items()
+			},
+		}
+
+		return {
+			'dataset' : benchmark.dataset_size(),
+			'environment' : benchmark.environment(),
+			'runs' : [run],
+		}
+
+	def run_profiles(self, options):
+		'''Runs each profile in its own process, the profile is read once at settings import.'''
+		runs = []
+		results = None
+
+		for profile in ('plain', 'tuned'):
+			with tempfile.TemporaryDirectory() as directory:
+				output = Path(directory) / f'{profile}.json'
+				subprocess.run(
+					[
+						sys.executable, '-m', 'django', 'benchmark_circulation',
+						'--workers', str(options['workers']),
+						'--loans', str(options['loans']),
+						'--books', str(options['books']),
+						'--seed', str(options['seed']),
+						'--output', str(output),
+					],
+					check=True,
+					cwd=settings.BASE_DIR,
+					stdout=subprocess.DEVNULL,
+					env={ **os.environ, 'DJANGO_DB_PROFILE' : profile, 'DJANGO_SETTINGS_MODULE' : os.environ.get('DJANGO_SETTINGS_MODULE', 'liib1.settings') },
+				)
+				results = json.loads(output.read_text())
+				runs.extend(results['runs'])
+
+		results['runs'] = runs
+		return results
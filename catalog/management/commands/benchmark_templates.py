@@ -0,0 +1,129 @@
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.template.backends.django import Template
+from django.test import Client, override_settings
+
+from catalog import benchmark
+from catalog.management.commands.benchmark_catalog import default_host
+from catalog.middleware import QueryRecorder
+
+def uncached_templates():
+	'''TEMPLATES with the plain loaders, every render reads and compiles the files again.'''
+	templates = []
+	for engine in settings.TEMPLATES:
+		options = dict(engine.get('OPTIONS', {}))
+		options['loaders'] = [
+			'django.template.loaders.filesystem.Loader',
+			'django.template.loaders.app_directories.Loader',
+		]
+		templates.append({ **engine, 'APP_DIRS' : False, 'OPTIONS' : options })
+	return templates
+
+# before: no compiled template cache and the layout fragments rendered every time,
+# after: the configured TEMPLATES and CATALOG_LAYOUT_CACHE_TIMEOUT
+VARIANTS = {
+	'before' : lambda: override_settings(TEMPLATES=uncached_templates(), CATALOG_LAYOUT_CACHE_TIMEOUT=0),
+	'after' : lambda: override_settings(),
+}
+
+class Command(BaseCommand):
+	help = (
+		'Times the template rendering of every HTML catalog page, without and with the cached '
+		'template loader and layout fragment cache. Only the render is timed, not the view.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('--requests', type=int, default=50, help='Timed renders per URL and variant.')
+		parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per URL before timing (fills caches).')
+		parser.add_argument('--username', help='Log the client in as this user, anonymous by default.')
+		parser.add_argument('--url', action='append', default=[], dest='include', help='URL name to time (repeatable), all HTML pages by default.')
+		parser.add_argument('--output', '-o', help='Write the results as JSON to this file.')
+		parser.add_argument('--host', help='Host header sent, the first plain ALLOWED_HOSTS entry by default.')
+
+	def handle(self, *args, **options):
+		if options['requests'] < 1:
+			raise CommandError('--requests must be at least 1.')
+
+		client = Client(SERVER_NAME=options['host'] or default_host())
+		if options['username']:
+			try:
+				client.force_login(get_user_model().objects.get_by_natural_key(options['username']))
+			except get_user_model().DoesNotExist:
+				raise CommandError(f'No user named {options["username"]!r}.')
+
+		urls = [(name, url) for name, url in benchmark.catalog_urls(include=options['include']) if not name.startswith('api_')]
+		if not urls:
+			raise CommandError('Nothing to time, is the catalog empty?')
+
+		results = {
+			'user' : options['username'] or None,
+			'dataset' : benchmark.dataset_size(),
+			'environment' : benchmark.environment(),
+			'results' : [],
+		}
+
+		self.stdout.write(f'{"url":<28} {"variant":>7} {"p50 ms":>9} {"p95 ms":>9} {"queries":>8}')
+		for name, url in urls:
+			for variant, settings_override in VARIANTS.items():
+				# keep the request log of the instrumentation middleware out of the table
+				quiet = override_settings(CATALOG_SLOW_REQUEST_MS=60 * 60 * 1000, CATALOG_DUPLICATE_QUERY_THRESHOLD=10 ** 6)
+				with settings_override(), quiet:
+					cache.clear()
+					renders, queries = self.time_renders(client, url, options['requests'], options['warmup'])
+				if not renders:
+					continue
+
+				entry = { 'name' : name, 'url' : url, 'variant' : variant, **benchmark.summarize(renders, queries) }
+				results['results'].append(entry)
+				self.stdout.write(
+					f'{name:<28} {variant:>7} {entry["p50_ms"]:>9.3f} {entry["p95_ms"]:>9.3f} '
+					f'{entry["queries_per_request"]:>8.1f}'
+				)
+
+		if options['output']:
+			benchmark.write_results(options['output'], results)
+			self.stdout.write(f'Results written to {options["output"]}.')
+
+	def time_renders(self, client, url, requests, warmup):
+		'''Returns (render durations, queries per render) of the page's top-level template.'''
+		for _ in range(warmup):
+			benchmark.consume(client.get(url))
+
+		renders = []
+		queries = []
+		with self.timed_renders(renders, queries):
+			for _ in range(requests):
+				benchmark.consume(client.get(url))
+
+		return renders, queries
+
+	@contextmanager
+	def timed_renders(self, renders, queries):
+		'''Records the duration and queries of every page's top-level template render.'''
+		render = Template.render
+		depth = [0]
+
+		def timed(template, context=None, request=None):
+			# form widgets render through the same backend, inside the page render
+			if depth[0]:
+				return render(template, context, request)
+
+			recorder = QueryRecorder()
+			depth[0] += 1
+			with recorder.record():
+				started = time.perf_counter()
+				try:
+					return render(template, context, request)
+				finally:
+					renders.append(time.perf_counter() - started)
+					queries.append(recorder.count)
+					depth[0] -= 1
+
+		with mock.patch.object(Template, 'render', timed):
+			yield
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from catalog import export
+
+class Command(BaseCommand):
+	help = 'Streams a full dump of books or copies as CSV or JSONL.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('dataset', choices=sorted(export.DATASETS))
+		parser.add_argument('--format', choices=sorted(export.FORMATS), default='csv', help='Output format.')
+		parser.add_argument('--output', '-o', help='File to write, standard output by default.')
+		parser.add_argument(
+			'--chunk-size',
+			type=int,
+			default=export.EXPORT_CHUNK_SIZE,
+			help='Rows fetched per database round trip.'
+		)
+
+	def handle(self, *args, **options):
+		lines = export.export_lines(options['dataset'], options['format'], options['chunk_size'])
+
+		if options['output']:
+			with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+				output.writelines(lines)
+		else:
+			for line in lines:
+				self.stdout.write(line, ending='')
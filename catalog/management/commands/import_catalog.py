@@ -0,0 +1,225 @@
+import csv
+import json
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.routers import use_primary
+from catalog.stats import invalidate_catalog_stats
+from catalog.versioning import bump_versions, bump_object_versions, model_version_key
+
+# Input: one row per book with the fields title, isbn, summary, author (as "Last, First")
+# or author_first_name/author_last_name, language, genres (";"-separated in CSV, a list
+# in JSONL), copies (number of copies to create), imprint and status (loan status of
+# the copies, "a" by default).
+
+class Command(BaseCommand):
+	help = 'Streams books, authors, genres, languages and copies into the catalog from a CSV or JSONL file.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('path', help='File to import, "-" reads standard input.')
+		parser.add_argument('--format', choices=('csv', 'jsonl'), help='Input format, guessed from the extension by default.')
+		parser.add_argument('--batch-size', type=int, default=1000, help='Rows committed per transaction.')
+		parser.add_argument('--resume', action='store_true', help='Skip the rows committed by a previous run.')
+		parser.add_argument('--state-file', help='Progress file used by --resume, defaults to <path>.progress.')
+
+	# lookups and existence checks must see the batches already written
+	@use_primary()
+	def handle(self, *args, **options):
+		path = options['path']
+		fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+		batch_size = options['batch_size']
+
+		if path == '-' and options['resume'] and not options['state_file']:
+			raise CommandError('--resume from standard input needs --state-file.')
+
+		state_file = Path(options['state_file'] or f'{path}.progress')
+		skip = int(state_file.read_text() or 0) if options['resume'] and state_file.exists() else 0
+
+		self.load_lookups()
+
+		stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+		try:
+			rows = read_rows(stream, fmt)
+			if skip:
+				self.stdout.write(f'Resuming after row {skip}.')
+				rows = islice(rows, skip, None)
+
+			done = skip
+			totals = { 'books' : 0, 'copies' : 0, 'skipped' : 0 }
+			started = time.monotonic()
+
+			while batch := list(islice(rows, batch_size)):
+				with transaction.atomic():
+					counts = self.import_batch(batch, done + 1)
+
+				# bulk inserts skip the signals that bump the model versions
+				bump_versions(*(model_version_key(model) for model in (Author, Book, Genre, Language)))
+				bump_object_versions(Author, counts.pop('author_ids'))
+
+				done += len(batch)
+				for key, value in counts.items():
+					totals[key] += value
+
+				# checkpoint only once the batch is committed
+				if path != '-' or options['state_file']:
+					state_file.write_text(str(done))
+
+				self.stdout.write(f'{done} rows ({rate(done - skip, started):.0f} rows/s)')
+		finally:
+			if stream is not sys.stdin:
+				stream.close()
+
+		invalidate_catalog_stats()
+
+		self.stdout.write(self.style.SUCCESS(
+			f'Imported {totals["books"]} books and {totals["copies"]} copies, '
+			f'skipped {totals["skipped"]} existing books, '
+			f'{done - skip} rows in {time.monotonic() - started:.1f}s ({rate(done - skip, started):.0f} rows/s).'
+		))
+
+	def load_lookups(self):
+		'''Loads the existing authors, genres and languages into name -> id maps.'''
+		self.authors = {
+			(first_name, last_name): pk
+			for pk, first_name, last_name in Author.objects.values_list('pk', 'first_name', 'last_name')
+		}
+		# genre names are unique case-insensitively
+		self.genres = { name.lower(): pk for pk, name in Genre.objects.values_list('pk', 'name') }
+		# language names aren't unique, the oldest one wins
+		self.languages = dict(Language.objects.order_by('-pk').values_list('name', 'pk'))
+
+	def resolve(self, lookup, model, keys, build):
+		'''Creates the missing keys in one bulk insert, then returns lookup.'''
+		missing = { key for key in keys if key not in lookup }
+		if missing:
+			missing = sorted(missing)
+			created = model.objects.bulk_create([build(key) for key in missing])
+			lookup.update(zip(missing, (obj.pk for obj in created)))
+		return lookup
+
+	def import_batch(self, batch, first_row):
+		rows = [parse_row(row, row_number) for row_number, row in enumerate(batch, first_row)]
+
+		existing = set(
+			Book.objects
+				.filter(isbn__in=[row['isbn'] for row in rows])
+				.values_list('isbn', flat=True)
+		)
+		seen = set()
+		new_rows = []
+		for row in rows:
+			if row['isbn'] not in existing and row['isbn'] not in seen:
+				seen.add(row['isbn'])
+				new_rows.append(row)
+
+		self.resolve(
+			self.authors, Author,
+			(row['author'] for row in new_rows if row['author']),
+			lambda key: Author(first_name=key[0], last_name=key[1])
+		)
+		# genres match case-insensitively, the first spelling seen is the one created
+		spellings = {}
+		for row in new_rows:
+			for name in row['genres']:
+				spellings.setdefault(name.lower(), name)
+
+		self.resolve(self.genres, Genre, spellings, lambda key: Genre(name=spellings[key]))
+		self.resolve(
+			self.languages, Language,
+			(row['language'] for row in new_rows if row['language']),
+			lambda key: Language(name=key)
+		)
+
+		books = Book.objects.bulk_create([
+			Book(
+				title=row['title'],
+				isbn=row['isbn'],
+				summary=row['summary'],
+				author_id=self.authors.get(row['author']),
+				language_id=self.languages.get(row['language']),
+			)
+			for row in new_rows
+		])
+
+		BookGenre = Book.genre.through
+		BookGenre.objects.bulk_create([
+			BookGenre(book_id=book.pk, genre_id=genre_id)
+			for book, row in zip(books, new_rows)
+			for genre_id in { self.genres[name.lower()] for name in row['genres'] }
+		])
+
+		copies = BookInstance.objects.bulk_create([
+			BookInstance(book_id=book.pk, imprint=row['imprint'], status=row['status'])
+			for book, row in zip(books, new_rows)
+			for _ in range(row['copies'])
+		])
+
+		return {
+			'books' : len(books),
+			'copies' : len(copies),
+			'skipped' : len(rows) - len(new_rows),
+			# author pages now list more books
+			'author_ids' : { book.author_id for book in books },
+		}
+
+def rate(rows, started):
+	return rows / max(time.monotonic() - started, 1e-9)
+
+def read_rows(stream, fmt):
+	'''Yields one dict per input row without reading the whole file.'''
+	if fmt == 'csv':
+		yield from csv.DictReader(stream)
+		return
+
+	for line_number, line in enumerate(stream, 1):
+		if line.strip():
+			try:
+				yield json.loads(line)
+			except ValueError as e:
+				raise CommandError(f'Line {line_number}: {e}')
+
+def parse_row(row, row_number):
+	'''Normalizes an input row (row_number counted from 1) into the fields import_batch expects.'''
+	if not row.get('isbn') or not row.get('title'):
+		raise CommandError(f'Row {row_number}: no title or ISBN in {row!r}')
+
+	if row.get('author_first_name') or row.get('author_last_name'):
+		author = ((row.get('author_first_name') or '').strip(), (row.get('author_last_name') or '').strip())
+	elif row.get('author'):
+		last_name, _, first_name = row['author'].partition(',')
+		author = (first_name.strip(), last_name.strip())
+	else:
+		author = None
+
+	genres = row.get('genres') or []
+	if isinstance(genres, str):
+		genres = genres.split(';')
+
+	status = row.get('status') or 'a'
+	if status not in dict(BookInstance.LOAN_STATUS):
+		raise CommandError(f'Row {row_number}: unknown copy status {status!r} for ISBN {row["isbn"]}')
+
+	# a count in JSONL, digits in CSV
+	copies = row.get('copies') or 0
+	if isinstance(copies, str) and copies.strip().isdecimal():
+		copies = int(copies)
+	if type(copies) is not int or copies < 0:
+		raise CommandError(f'Row {row_number}: invalid number of copies {row["copies"]!r} for ISBN {row["isbn"]}')
+
+	return {
+		'title' : row['title'].strip(),
+		'isbn' : str(row['isbn']).strip(),
+		'summary' : (row.get('summary') or '').strip(),
+		'author' : author,
+		'language' : (row.get('language') or '').strip(),
+		'genres' : [name.strip() for name in genres if name.strip()],
+		'copies' : copies,
+		'imprint' : (row.get('imprint') or '').strip(),
+		'status' : status,
+	}
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.models import CopyCount
+
+class Command(BaseCommand):
+	help = 'Rebuilds the per-status copy counters from the BookInstance table and verifies them.'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--check',
+			action='store_true',
+			help='Only compare the stored counters with the copies, exit with an error on drift.'
+		)
+		parser.add_argument('--database', default='default', help='Database to use.')
+
+	def handle(self, *args, **options):
+		counters = CopyCount.objects.db_manager(options['database'])
+
+		if not options['check']:
+			counters.rebuild()
+			self.stdout.write('Rebuilt copy counters.')
+
+		expected = counters.expected()
+		actual = counters.actual()
+
+		drift = sorted(
+			(key for key in expected.keys() | actual.keys() if expected.get(key, 0) != actual.get(key, 0)),
+			key=lambda key: (key[0] is not None, key[0] or 0, key[1])
+		)
+
+		for book_id, status in drift:
+			self.stderr.write(
+				f'book={book_id or "*"} status={status!r}: '
+				f'stored {actual.get((book_id, status), 0)}, '
+				f'expected {expected.get((book_id, status), 0)}'
+			)
+
+		if drift:
+			raise CommandError(f'{len(drift)} copy counter(s) out of date.')
+
+		self.stdout.write(self.style.SUCCESS(f'Verified {len(expected)} copy counter(s).'))
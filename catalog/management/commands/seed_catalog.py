@@ -0,0 +1,151 @@
+import datetime
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.routers import use_primary
+from catalog.stats import invalidate_catalog_stats
+from catalog.versioning import bump_versions, model_version_key
+
+# Word lists the synthetic titles, names and imprints are drawn from
+TITLE_WORDS = (
+	'River', 'Shadow', 'Winter', 'Glass', 'Crown', 'Harbor', 'Silent', 'Iron', 'Garden', 'Storm',
+	'Lantern', 'Empire', 'Orchard', 'Mirror', 'Wild', 'Stone', 'Hidden', 'Golden', 'Last', 'Northern',
+)
+FIRST_NAMES = ('Ada', 'Bruno', 'Chiara', 'Dmitri', 'Elena', 'Femi', 'Grace', 'Hiro', 'Ines', 'Jonas')
+LAST_NAMES = ('Abara', 'Berg', 'Costa', 'Duval', 'Eklund', 'Farah', 'Gallo', 'Horvat', 'Ivers', 'Jansen')
+GENRES = ('Fantasy', 'Science Fiction', 'Mystery', 'History', 'Poetry', 'Romance', 'Biography', 'Horror')
+LANGUAGES = ('English', 'French', 'Spanish', 'German', 'Japanese')
+IMPRINTS = ('Harbor Press', 'Northern Books', 'Stone & Glass', 'Orchard House')
+
+# Share of copies per loan status; loaned copies get a borrower and a due date
+STATUS_WEIGHTS = { 'a' : 60, 'o' : 25, 'r' : 10, 'm' : 5 }
+
+SEED_USERNAME_PREFIX = 'seed-reader-'
+
+class Command(BaseCommand):
+	help = 'Fills the catalog with synthetic books, authors, copies and users for benchmarking.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--books', type=int, default=10000, help='Books to create.')
+		parser.add_argument('--copies-per-book', type=int, default=3, help='Copies created for each book.')
+		parser.add_argument('--users', type=int, default=100, help='Library users to create (borrowers of the loaned copies).')
+		parser.add_argument('--batch-size', type=int, default=5000, help='Books inserted per transaction.')
+		parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same catalog.')
+
+	# lookups and existence checks must see the batches already written
+	@use_primary()
+	def handle(self, *args, **options):
+		if options['books'] < 0 or options['copies_per_book'] < 0 or options['users'] < 0:
+			raise CommandError('--books, --copies-per-book and --users must not be negative.')
+
+		self.random = random.Random(options['seed'])
+		started = time.monotonic()
+
+		user_ids = self.create_users(options['users'])
+		genre_ids = self.ensure_lookup(Genre, GENRES)
+		language_ids = self.ensure_lookup(Language, LANGUAGES)
+		author_ids = self.create_authors(max(1, options['books'] // 10) if options['books'] else 0)
+
+		# numbers well below 978..., never an ISBN that can exist
+		first = Book.objects.count()
+		done = 0
+		while done < options['books']:
+			size = min(options['batch_size'], options['books'] - done)
+			with transaction.atomic():
+				self.create_books(
+					range(first + done, first + done + size),
+					options['copies_per_book'],
+					author_ids, genre_ids, language_ids, user_ids
+				)
+			done += size
+			self.stdout.write(f'{done} books ({done / max(time.monotonic() - started, 1e-9):.0f} books/s)')
+
+		# bulk inserts skip the signals that bump the model versions
+		bump_versions(*(model_version_key(model) for model in (Author, Book, BookInstance, Genre, Language)))
+		invalidate_catalog_stats()
+
+		self.stdout.write(self.style.SUCCESS(
+			f'Created {done} books, {done * options["copies_per_book"]} copies, '
+			f'{len(author_ids)} authors and {len(user_ids)} users in {time.monotonic() - started:.1f}s.'
+		))
+
+	def create_users(self, count):
+		User = get_user_model()
+		first = User.objects.filter(username__startswith=SEED_USERNAME_PREFIX).count()
+		# hashing is slow on purpose, seeded users get one shared unusable password
+		password = make_password(None)
+
+		users = User.objects.bulk_create([
+			User(username=f'{SEED_USERNAME_PREFIX}{number}', password=password)
+			for number in range(first, first + count)
+		], batch_size=1000)
+		return [user.pk for user in users]
+
+	def ensure_lookup(self, model, names):
+		'''Returns the ids of the named genres or languages, creating the missing ones.'''
+		existing = {
+			name.lower(): pk
+			for pk, name in model.objects.values_list('pk', 'name')
+		}
+		missing = [name for name in names if name.lower() not in existing]
+		for obj in model.objects.bulk_create([model(name=name) for name in missing]):
+			existing[obj.name.lower()] = obj.pk
+		return [existing[name.lower()] for name in names]
+
+	def create_authors(self, count):
+		authors = Author.objects.bulk_create([
+			Author(
+				first_name=self.random.choice(FIRST_NAMES),
+				last_name=f'{self.random.choice(LAST_NAMES)} {number}',
+				date_of_birth=datetime.date(1900, 1, 1) + datetime.timedelta(days=self.random.randrange(36500)),
+			)
+			for number in range(count)
+		], batch_size=1000)
+		return [author.pk for author in authors]
+
+	def create_books(self, numbers, copies_per_book, author_ids, genre_ids, language_ids, user_ids):
+		books = Book.objects.bulk_create([
+			Book(
+				title=' '.join(self.random.sample(TITLE_WORDS, 3)),
+				summary=' '.join(self.random.choices(TITLE_WORDS, k=20)).capitalize() + '.',
+				isbn=f'{number:013d}',
+				author_id=self.random.choice(author_ids),
+				language_id=self.random.choice(language_ids),
+			)
+			for number in numbers
+		], batch_size=1000)
+
+		BookGenre = Book.genre.through
+		BookGenre.objects.bulk_create([
+			BookGenre(book_id=book.pk, genre_id=genre_id)
+			for book in books
+			for genre_id in self.random.sample(genre_ids, self.random.randint(1, 2))
+		], batch_size=1000)
+
+		statuses = self.random.choices(
+			list(STATUS_WEIGHTS), weights=list(STATUS_WEIGHTS.values()), k=len(books) * copies_per_book
+		)
+		today = datetime.date.today()
+		copies = []
+		for book in books:
+			for _ in range(copies_per_book):
+				status = statuses[len(copies)]
+				# no users means no borrowers, the copy stays on the shelf
+				if status == 'o' and not user_ids:
+					status = 'a'
+				loaned = status == 'o'
+				copies.append(BookInstance(
+					book_id=book.pk,
+					imprint=self.random.choice(IMPRINTS),
+					status=status,
+					# about a third of the loans are overdue
+					due_back=today + datetime.timedelta(days=self.random.randint(-10, 21)) if loaned else None,
+					borrower_id=self.random.choice(user_ids) if loaned else None,
+				))
+		BookInstance.objects.bulk_create(copies, batch_size=1000)
@@ -0,0 +1,105 @@
+import datetime
+from itertools import groupby
+
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Exists, OuterRef
+
+from catalog.models import BookInstance, OverdueReminder
+from catalog.routers import use_primary
+
+def overdue_loans(today):
+	'''Overdue loans of borrowers with an email address that weren't reminded of yet.'''
+	reminded = OverdueReminder.objects.filter(
+		copy=OuterRef('pk'), borrower=OuterRef('borrower'), due_back=OuterRef('due_back')
+	)
+	return (
+		BookInstance.objects
+			.filter(status__exact='o', due_back__lt=today, borrower__isnull=False)
+			.exclude(borrower__email='')
+			.exclude(Exists(reminded))
+	)
+
+def reminder(borrower, loans):
+	'''One message listing all of the borrower's overdue loans.'''
+	lines = '\n'.join(f'- {title}, due back {due_back:%Y-%m-%d}' for copy_id, title, due_back in loans)
+	return EmailMessage(
+		subject='Overdue library books',
+		body=(
+			f'Hello {borrower.get_short_name() or borrower.get_username()},\n\n'
+			f'These books are past their due date, please return or renew them:\n\n{lines}\n'
+		),
+		to=[borrower.email],
+	)
+
+class Command(BaseCommand):
+	help = (
+		'Emails every borrower with overdue loans one reminder listing them, over a single '
+		'connection of the configured EMAIL_BACKEND. Sent reminders are recorded, a rerun only '
+		'reminds of loans that are new or renewed and overdue again.'
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('--batch-size', type=int, default=100, help='Borrowers loaded and emailed per batch.')
+		parser.add_argument('--date', type=datetime.date.fromisoformat, help='Remind of loans due before this day (YYYY-MM-DD), today by default.')
+		parser.add_argument('--dry-run', action='store_true', help='Only count the reminders that would be sent.')
+
+	# the records of the previous batches must be seen
+	@use_primary()
+	def handle(self, *args, **options):
+		if options['batch_size'] < 1:
+			raise CommandError('--batch-size must be at least 1.')
+
+		loans = overdue_loans(options['date'] or datetime.date.today())
+		borrowers = sent = 0
+		last_borrower = None
+
+		connection = None if options['dry_run'] else get_connection()
+		try:
+			if connection is not None:
+				connection.open()
+
+			while True:
+				# a batch of borrowers in id order, by the (borrower, status, due_back) index
+				batch = loans.order_by('borrower')
+				if last_borrower is not None:
+					batch = batch.filter(borrower__gt=last_borrower)
+				batch_ids = list(batch.values_list('borrower', flat=True).distinct()[:options['batch_size']])
+				if not batch_ids:
+					break
+				last_borrower = batch_ids[-1]
+
+				users = get_user_model().objects.in_bulk(batch_ids)
+				rows = (
+					loans
+						.filter(borrower__in=batch_ids)
+						.order_by('borrower', 'due_back')
+						.values_list('borrower', 'pk', 'book__title', 'due_back')
+				)
+				grouped = [
+					(users[borrower_id], [row[1:] for row in group])
+					for borrower_id, group in groupby(rows.iterator(), key=lambda row: row[0])
+				]
+
+				borrowers += len(grouped)
+				sent += sum(len(group) for borrower, group in grouped)
+				if connection is None:
+					continue
+
+				connection.send_messages([reminder(borrower, group) for borrower, group in grouped])
+				# recorded once handed to the backend, a crash in between sends the batch again
+				OverdueReminder.objects.bulk_create(
+					[
+						OverdueReminder(copy_id=copy_id, borrower=borrower, due_back=due_back)
+						for borrower, group in grouped
+						for copy_id, title, due_back in group
+					],
+					ignore_conflicts=True,
+				)
+		finally:
+			if connection is not None:
+				connection.close()
+
+		verb = 'Would remind' if options['dry_run'] else 'Reminded'
+		self.stdout.write(f'{verb} {borrowers} borrower(s) of {sent} overdue loan(s).')
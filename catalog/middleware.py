@@ -0,0 +1,273 @@
+import hashlib
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.middleware.gzip import GZipMiddleware
+from django.utils.functional import SimpleLazyObject, empty
+
+from . import routers
+
+logger = logging.getLogger('catalog.sql')
+
+class QueryRecorder:
+	'''Execute wrapper counting queries, DB time and repeated SQL across connections.'''
+
+	def __init__(self):
+		self.count = 0
+		self.duration = 0.0
+		self.statements = Counter()
+
+	def __call__(self, execute, sql, params, many, context):
+		started = time.perf_counter()
+		try:
+			return execute(sql, params, many, context)
+		finally:
+			self.duration += time.perf_counter() - started
+			self.count += 1
+			# parameters differ between the queries of an N+1 loop, the SQL doesn't
+			self.statements[(context['connection'].alias, sql)] += 1
+
+	def record(self):
+		'''Patches all configured connections for the current thread while active.'''
+		stack = ExitStack()
+		for alias in connections:
+			stack.enter_context(connections[alias].execute_wrapper(self))
+		return stack
+
+	def duplicates(self, threshold):
+		'''Returns [(alias, sql, times)] for statements run at least threshold times.'''
+		return [
+			(alias, sql, times)
+			for (alias, sql), times in self.statements.most_common()
+			if times >= threshold
+		]
+
+class QueryInstrumentationMiddleware:
+	'''
+	Counts the queries and DB time of a sampled share of requests (and of every
+	staff request), logs repeated SQL (N+1 patterns) and requests slower than
+	CATALOG_SLOW_REQUEST_MS to the "catalog.sql" logger and sends Server-Timing
+	headers to staff users.
+
+	Staff requests are recognised by a signed cookie (see remember_staff()), so
+	unsampled requests pay for two clock reads and a signature check but never load
+	the session or the user. Queries run while a streaming response is consumed
+	happen after the middleware returns and aren't counted.
+	'''
+
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def sampled(self):
+		rate = settings.CATALOG_SQL_SAMPLE_RATE
+		return bool(rate and random.random() < rate)
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+
+		started = time.perf_counter()
+
+		staff = is_staff(request)
+		if not (staff or self.sampled()):
+			response = self.get_response(request)
+			self.log_if_slow(request, response, time.perf_counter() - started)
+			return remember_staff(request, response)
+
+		recorder = QueryRecorder()
+		with recorder.record():
+			response = self.get_response(request)
+
+		return self.finish(request, response, time.perf_counter() - started, recorder, staff)
+
+	async def __acall__(self, request):
+		started = time.perf_counter()
+
+		staff = is_staff(request)
+		if not (staff or self.sampled()):
+			response = await self.get_response(request)
+			self.log_if_slow(request, response, time.perf_counter() - started)
+			return remember_staff(request, response)
+
+		recorder = QueryRecorder()
+		# the async ORM runs queries in the request's worker thread, patch the connections there
+		stack = await sync_to_async(recorder.record)()
+		try:
+			response = await self.get_response(request)
+		finally:
+			await sync_to_async(stack.close)()
+
+		return self.finish(request, response, time.perf_counter() - started, recorder, staff)
+
+	def finish(self, request, response, elapsed, recorder, staff):
+		if staff:
+			response['Server-Timing'] = ', '.join([
+				f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries"',
+				f'app;dur={(elapsed - recorder.duration) * 1000:.1f}',
+				f'total;dur={elapsed * 1000:.1f}',
+			])
+
+		duplicates = recorder.duplicates(settings.CATALOG_DUPLICATE_QUERY_THRESHOLD)
+		if duplicates:
+			record = request_record(request, response, elapsed, recorder, duplicates)
+			logger.warning('Repeated queries %s', json.dumps(record), extra={ 'request_stats' : record })
+
+		self.log_if_slow(request, response, elapsed, recorder, duplicates)
+		return remember_staff(request, response)
+
+	def log_if_slow(self, request, response, elapsed, recorder=None, duplicates=()):
+		if elapsed * 1000 < settings.CATALOG_SLOW_REQUEST_MS:
+			return
+
+		record = request_record(request, response, elapsed, recorder, duplicates)
+		logger.warning('Slow request %s', json.dumps(record), extra={ 'request_stats' : record })
+
+def request_record(request, response, elapsed, recorder=None, duplicates=()):
+	'''Structured log payload for one request.'''
+	record = {
+		'method' : request.method,
+		'path' : request.path,
+		'status' : response.status_code,
+		'duration_ms' : round(elapsed * 1000, 1),
+	}
+	if recorder is not None:
+		record.update({
+			'queries' : recorder.count,
+			'db_ms' : round(recorder.duration * 1000, 1),
+			'duplicates' : [
+				{ 'database' : alias, 'sql' : sql, 'times' : times }
+				for alias, sql, times in duplicates
+			],
+		})
+	return record
+
+# Signed cookie marking the current session as a staff user's, checked without queries
+STAFF_COOKIE = 'catalog_staff'
+STAFF_COOKIE_SALT = 'catalog.middleware.staff'
+
+def session_token(session_key):
+	# ties the staff cookie to one session, it stops matching after logout or a new login
+	return hashlib.sha256(session_key.encode()).hexdigest()[:32]
+
+def is_staff(request):
+	'''Whether the request comes from a staff session, from the signed cookie only.'''
+	session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+	if not session_key or STAFF_COOKIE not in request.COOKIES:
+		return False
+	token = request.get_signed_cookie(STAFF_COOKIE, default=None, salt=STAFF_COOKIE_SALT, max_age=settings.SESSION_COOKIE_AGE)
+	return token == session_token(session_key)
+
+def loaded_user(request):
+	'''The user if something in the request already loaded it, None otherwise; never queries.'''
+	user = getattr(request, 'user', None)
+	if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+		# the async views load the user through request.auser()
+		return getattr(request, '_acached_user', None)
+	return user
+
+def remember_staff(request, response):
+	'''
+	Sets or clears the staff cookie when the view loaded the user anyway, so the
+	staff check costs no queries. A staff user's first request after logging in
+	gets no Server-Timing header.
+	'''
+	user = loaded_user(request)
+	if user is None:
+		return response
+
+	session = getattr(request, 'session', None)
+	session_key = session.session_key if session is not None else None
+	if session_key and user.is_authenticated and user.is_staff:
+		token = session_token(session_key)
+		current = request.get_signed_cookie(STAFF_COOKIE, default=None, salt=STAFF_COOKIE_SALT, max_age=settings.SESSION_COOKIE_AGE)
+		if current != token:
+			response.set_signed_cookie(
+				STAFF_COOKIE, token, salt=STAFF_COOKIE_SALT,
+				max_age=settings.SESSION_COOKIE_AGE, httponly=True, samesite='Lax'
+			)
+	elif STAFF_COOKIE in request.COOKIES:
+		response.delete_cookie(STAFF_COOKIE, samesite='Lax')
+
+	return response
+
+# Cookie keeping a user's reads on the primary for a while after they wrote
+PIN_COOKIE = 'db_primary_until'
+
+class ReplicaPinningMiddleware:
+	'''
+	Read-your-writes for the replica router: a request that writes to the primary,
+	and the user's requests for DATABASE_REPLICA_PIN_SECONDS after it, read from the
+	primary too. Unsafe methods read from the primary from the start.
+	'''
+
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def pinned(self, request):
+		if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+			return True
+		try:
+			return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+		except ValueError:
+			return False
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+		if not settings.DATABASE_REPLICAS:
+			return self.get_response(request)
+
+		token = routers.start_request(self.pinned(request))
+		try:
+			response = self.get_response(request)
+		finally:
+			wrote = routers.end_request(token)
+
+		return self.pin(response, wrote)
+
+	async def __acall__(self, request):
+		if not settings.DATABASE_REPLICAS:
+			return await self.get_response(request)
+
+		token = routers.start_request(self.pinned(request))
+		try:
+			response = await self.get_response(request)
+		finally:
+			wrote = routers.end_request(token)
+
+		return self.pin(response, wrote)
+
+	def pin(self, response, wrote):
+		if wrote:
+			window = settings.DATABASE_REPLICA_PIN_SECONDS
+			response.set_cookie(PIN_COOKIE, str(int(time.time() + window)), max_age=window, httponly=True, samesite='Lax')
+		return response
+
+class CatalogGZipMiddleware(GZipMiddleware):
+	'''
+	GZipMiddleware leaving the paths under CATALOG_GZIP_EXCLUDE_PATHS uncompressed.
+	Compressing a response turns its ETag weak (W/"..."), the API's version ETags
+	(catalog.api.versioned_etag) stay strong validators.
+	'''
+
+	def process_response(self, request, response):
+		if request.path.startswith(tuple(settings.CATALOG_GZIP_EXCLUDE_PATHS)):
+			return response
+		return super().process_response(request, response)
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.2 on 2026-10-16 23:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_copy_counts(apps, schema_editor):
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+    CopyCount = apps.get_model('catalog', 'CopyCount')
+    db_alias = schema_editor.connection.alias
+
+    copies = BookInstance.objects.using(db_alias).order_by()
+    counters = [
+        CopyCount(book_id=book_id, status=status, count=num)
+        for book_id, status, num in copies.values_list('book', 'status').annotate(num=Count('pk'))
+        if book_id is not None
+    ]
+    counters += [
+        CopyCount(book_id=None, status=status, count=num)
+        for status, num in copies.values_list('status').annotate(num=Count('pk'))
+    ]
+    CopyCount.objects.using(db_alias).bulk_create(counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_book_language_alter_language_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CopyCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(blank=True, choices=[('m', 'Maintenance'), ('o', 'On loan'), ('a', 'Available'), ('r', 'Reserved')], max_length=1)),
+                ('count', models.IntegerField(default=0)),
+                ('book', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='catalog.book')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='copycount',
+            constraint=models.UniqueConstraint(fields=('book', 'status'), name='copycount_book_status_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='copycount',
+            constraint=models.UniqueConstraint(condition=models.Q(('book__isnull', True)), fields=('status',), name='copycount_global_status_unique'),
+        ),
+        migrations.RunPython(populate_copy_counts, migrations.RunPython.noop),
+    ]
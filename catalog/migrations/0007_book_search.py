@@ -0,0 +1,121 @@
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE catalog_book_fts USING fts5(title, summary, isbn, author)
+    """,
+    """
+    INSERT INTO catalog_book_fts (rowid, title, summary, isbn, author)
+    SELECT b.id, b.title, b.summary, b.isbn, COALESCE(a.first_name || ' ' || a.last_name, '')
+    FROM catalog_book b LEFT JOIN catalog_author a ON a.id = b.author_id
+    """,
+    """
+    CREATE TRIGGER catalog_book_fts_insert AFTER INSERT ON catalog_book BEGIN
+        INSERT INTO catalog_book_fts (rowid, title, summary, isbn, author)
+        VALUES (
+            new.id, new.title, new.summary, new.isbn,
+            COALESCE((SELECT first_name || ' ' || last_name FROM catalog_author WHERE id = new.author_id), '')
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER catalog_book_fts_update AFTER UPDATE OF title, summary, isbn, author_id ON catalog_book BEGIN
+        DELETE FROM catalog_book_fts WHERE rowid = old.id;
+        INSERT INTO catalog_book_fts (rowid, title, summary, isbn, author)
+        VALUES (
+            new.id, new.title, new.summary, new.isbn,
+            COALESCE((SELECT first_name || ' ' || last_name FROM catalog_author WHERE id = new.author_id), '')
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER catalog_book_fts_delete AFTER DELETE ON catalog_book BEGIN
+        DELETE FROM catalog_book_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER catalog_author_fts_update AFTER UPDATE OF first_name, last_name ON catalog_author BEGIN
+        UPDATE catalog_book_fts SET author = new.first_name || ' ' || new.last_name
+        WHERE rowid IN (SELECT id FROM catalog_book WHERE author_id = new.id);
+    END
+    """,
+]
+
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS catalog_author_fts_update',
+    'DROP TRIGGER IF EXISTS catalog_book_fts_delete',
+    'DROP TRIGGER IF EXISTS catalog_book_fts_update',
+    'DROP TRIGGER IF EXISTS catalog_book_fts_insert',
+    'DROP TABLE IF EXISTS catalog_book_fts',
+]
+
+POSTGRESQL_FORWARD = [
+    'ALTER TABLE catalog_book ADD COLUMN search_vector tsvector',
+    'CREATE INDEX catalog_book_search_vector_gin ON catalog_book USING GIN (search_vector)',
+    """
+    CREATE FUNCTION catalog_book_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', COALESCE(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('simple', COALESCE(NEW.isbn, '')), 'A') ||
+            setweight(to_tsvector('simple', COALESCE(
+                (SELECT first_name || ' ' || last_name FROM catalog_author WHERE id = NEW.author_id), ''
+            )), 'B') ||
+            setweight(to_tsvector('english', COALESCE(NEW.summary, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER catalog_book_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, summary, isbn, author_id ON catalog_book
+    FOR EACH ROW EXECUTE FUNCTION catalog_book_search_vector_update()
+    """,
+    """
+    CREATE FUNCTION catalog_author_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        -- touching author_id re-runs the book trigger with the new name
+        UPDATE catalog_book SET author_id = author_id WHERE author_id = NEW.id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER catalog_author_search_vector_trigger
+    AFTER UPDATE OF first_name, last_name ON catalog_author
+    FOR EACH ROW EXECUTE FUNCTION catalog_author_search_vector_update()
+    """,
+    # fill in existing rows through the trigger
+    'UPDATE catalog_book SET author_id = author_id',
+]
+
+POSTGRESQL_REVERSE = [
+    'DROP TRIGGER IF EXISTS catalog_author_search_vector_trigger ON catalog_author',
+    'DROP FUNCTION IF EXISTS catalog_author_search_vector_update()',
+    'DROP TRIGGER IF EXISTS catalog_book_search_vector_trigger ON catalog_book',
+    'DROP FUNCTION IF EXISTS catalog_book_search_vector_update()',
+    'DROP INDEX IF EXISTS catalog_book_search_vector_gin',
+    'ALTER TABLE catalog_book DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def run_vendor_sql(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_copycount'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_vendor_sql({ 'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD }),
+            run_vendor_sql({ 'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRESQL_REVERSE }),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.2 on 2026-10-16 23:55
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_book_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['last_name', 'first_name', 'id'], name='author_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(django.db.models.functions.text.Lower('title'), name='book_title_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['borrower', 'status', 'due_back', 'id'], name='bookinst_borrower_status_due'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['status', 'due_back', 'id'], name='bookinst_status_due'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.2 on 2026-10-17 00:55
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_circulation_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['created', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['book', 'status', 'due_back'], name='bookinst_book_status_due'),
+        ),
+        migrations.AddField(
+            model_name='hold',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.book'),
+        ),
+        migrations.AddField(
+            model_name='hold',
+            name='borrower',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='hold',
+            name='copy',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='catalog.bookinstance'),
+        ),
+        migrations.AddIndex(
+            model_name='hold',
+            index=models.Index(fields=['book', 'created', 'id'], name='hold_book_created'),
+        ),
+        migrations.AddConstraint(
+            model_name='hold',
+            constraint=models.UniqueConstraint(fields=('book', 'borrower'), name='hold_book_borrower_unique'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.2 on 2026-10-17 01:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_holds'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('due_back', models.DateField()),
+                ('sent', models.DateTimeField(default=django.utils.timezone.now)),
+                ('borrower', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('copy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.bookinstance')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='overduereminder',
+            constraint=models.UniqueConstraint(fields=('copy', 'borrower', 'due_back'), name='overduereminder_loan_unique'),
+        ),
+    ]
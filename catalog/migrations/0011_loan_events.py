@@ -0,0 +1,47 @@
+# Generated by Django 5.0.2 on 2026-10-17 01:03
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_overduereminder'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('c', 'Checked out'), ('n', 'Renewed'), ('r', 'Returned'), ('h', 'Reserved for a hold'), ('m', 'Sent to maintenance')], max_length=1)),
+                ('due_back', models.DateField(null=True)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('book', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='catalog.book')),
+                ('borrower', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('copy', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='catalog.bookinstance')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['borrower', 'created'], name='loanevent_borrower_created'), models.Index(fields=['book', 'created'], name='loanevent_book_created'), models.Index(fields=['created'], name='loanevent_created')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LoanEventArchive',
+            fields=[
+                ('action', models.CharField(choices=[('c', 'Checked out'), ('n', 'Renewed'), ('r', 'Returned'), ('h', 'Reserved for a hold'), ('m', 'Sent to maintenance')], max_length=1)),
+                ('due_back', models.DateField(null=True)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('book', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='catalog.book')),
+                ('borrower', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('copy', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='catalog.bookinstance')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['borrower', 'created'], name='loanarchive_borrower_created'), models.Index(fields=['book', 'created'], name='loanarchive_book_created')],
+            },
+        ),
+    ]
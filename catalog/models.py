@@ -1,9 +1,13 @@
-from django.db import models
+from django.db import models, transaction, router, connections, IntegrityError
 
 from django.urls import reverse # Use for get_absolute_url()
 from django.conf import settings
 from django.db.models import UniqueConstraint # Constrain fields to unique values
+from django.db.models import Q, F, Count
+from django.db.models.expressions import Combinable
 from django.db.models.functions import Lower # Return lower case value
+from django.dispatch import Signal
+from django.utils import timezone
 
 import uuid
 from datetime import date
@@ -63,6 +67,12 @@ class Book(models.Model):
 	
 	display_genre.short_description = 'Genre'
 
+	class Meta:
+		indexes = [
+			# case-insensitive title lookups, e.g. the home page counts
+			models.Index(Lower('title'), name='book_title_lower_idx'),
+		]
+
 	def __str__(self):
 		"""String for representing the Model object."""
 		return self.title
@@ -71,6 +81,94 @@ class Book(models.Model):
 		'''Returns the URL to access a detail record for this book.'''
 		return reverse('book_detail', args=[str(self.id)])
 	
+# Sent after BookInstance rows were written in bulk, bypassing the per-object signals.
+# book_ids holds the books whose copies changed, None when unknown.
+copies_bulk_changed = Signal()
+
+class BookInstanceQuerySet(models.QuerySet):
+	"""QuerySet keeping the per-status copy counters in step with bulk writes."""
+
+	def bulk_create(self, objs, *args, **kwargs):
+		self._for_write = True
+		with transaction.atomic(using=self.db):
+			objs = super().bulk_create(objs, *args, **kwargs)
+
+			deltas = {}
+			for obj in objs:
+				key = (obj.book_id, obj.status)
+				deltas[key] = deltas.get(key, 0) + 1
+
+			CopyCount.objects.db_manager(self.db).adjust(deltas)
+			copies_bulk_changed.send(sender=self.model, using=self.db, book_ids={ obj.book_id for obj in objs })
+
+		return objs
+
+	def update(self, **kwargs):
+		self._for_write = True
+		with transaction.atomic(using=self.db):
+			queryset, before = self._lock_and_count()
+
+			if 'status' in kwargs or 'book' in kwargs or 'book_id' in kwargs:
+				rows, book_ids = queryset._update_counted(before, **kwargs)
+			else:
+				rows = models.QuerySet.update(queryset, **kwargs)
+				book_ids = { book_id for book_id, status, num in before }
+
+			copies_bulk_changed.send(sender=self.model, using=self.db, book_ids=book_ids)
+
+		return rows
+
+	def _lock_and_count(self):
+		"""
+		Returns (queryset to update, [(book id, status, copies)]) with the counts
+		matching the rows the update will change. Where the database can lock rows the
+		matched copies are locked and the update is limited to them, so a concurrent
+		write can't slip in between the count and the update. SQLite writes one
+		transaction at a time, there counting first is enough.
+		"""
+		if not connections[self.db].features.has_select_for_update:
+			before = list(
+				self.order_by()
+					.values_list('book', 'status')
+					.annotate(num=Count('pk'))
+			)
+			return self, before
+
+		# pk order, concurrent bulk updates lock the copies they share in the same order
+		locked = list(self.select_for_update().order_by('pk').values_list('pk', 'book', 'status'))
+
+		counts = {}
+		for pk, book_id, status in locked:
+			counts[(book_id, status)] = counts.get((book_id, status), 0) + 1
+
+		queryset = self.model.objects.using(self.db).filter(pk__in=[pk for pk, book_id, status in locked])
+		return queryset, [(book_id, status, num) for (book_id, status), num in counts.items()]
+
+	def _update_counted(self, before, **kwargs):
+		"""Runs the update and moves the affected copies between counters, returns (rows, book ids)."""
+		rows = models.QuerySet.update(self, **kwargs)
+
+		new_status = kwargs.get('status')
+		new_book = kwargs.get('book_id', kwargs.get('book'))
+		new_book = getattr(new_book, 'pk', new_book)
+
+		if any(isinstance(value, Combinable) for value in (new_status, new_book)):
+			# can't tell where expression-based updates landed, recount everything
+			CopyCount.objects.db_manager(self.db).rebuild()
+			return rows, None
+
+		deltas = {}
+		for book_id, status, num in before:
+			after = (
+				new_book if 'book' in kwargs or 'book_id' in kwargs else book_id,
+				new_status if 'status' in kwargs else status,
+			)
+			deltas[(book_id, status)] = deltas.get((book_id, status), 0) - num
+			deltas[after] = deltas.get(after, 0) + num
+
+		CopyCount.objects.db_manager(self.db).adjust(deltas)
+		return rows, { book_id for book_id, status in deltas }
+
 class BookInstance(models.Model):
 	"""Model representing a specific copy of a book (that can be borrowed from the library)"""
 
@@ -105,9 +203,19 @@ class BookInstance(models.Model):
 		blank=True
 	)
 
+	objects = BookInstanceQuerySet.as_manager()
+
 	class Meta:
 		ordering = ['due_back']
 		permissions = (('can_mark_returned', 'Set book as returned'),)
+		indexes = [
+			# a borrower's loans by due date (id breaks ties for keyset pagination)
+			models.Index(fields=['borrower', 'status', 'due_back', 'id'], name='bookinst_borrower_status_due'),
+			# all loans by due date
+			models.Index(fields=['status', 'due_back', 'id'], name='bookinst_status_due'),
+			# a book's loans by due date, for the hold wait estimates
+			models.Index(fields=['book', 'status', 'due_back'], name='bookinst_book_status_due'),
+		]
 
 	@property
 	def is_overdue(self):
@@ -117,7 +225,106 @@ class BookInstance(models.Model):
 	def __str__(self):
 		"""String for representing the Model object."""
 		return f'${self.id} ({self.book.title})'
+
+	def save(self, *args, **kwargs):
+		# copy counters are adjusted by signal handlers inside the same transaction
+		with transaction.atomic(using=kwargs.get('using')):
+			super().save(*args, **kwargs)
+
+	def delete(self, *args, **kwargs):
+		with transaction.atomic(using=kwargs.get('using')):
+			return super().delete(*args, **kwargs)
 	
+class Hold(models.Model):
+	"""Model representing a borrower waiting for a copy of a book (see catalog.circulation)."""
+
+	book = models.ForeignKey('Book', on_delete=models.CASCADE)
+	borrower = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+	created = models.DateTimeField(default=timezone.now)
+	# the copy reserved for the borrower, null while waiting
+	copy = models.ForeignKey('BookInstance', on_delete=models.SET_NULL, null=True, blank=True)
+
+	class Meta:
+		ordering = ['created', 'id']
+		constraints = [
+			UniqueConstraint(fields=['book', 'borrower'], name='hold_book_borrower_unique'),
+		]
+		indexes = [
+			# the queue of a book, oldest first
+			models.Index(fields=['book', 'created', 'id'], name='hold_book_created'),
+		]
+
+	def __str__(self):
+		return f'{self.borrower} waiting for {self.book}'
+
+class OverdueReminder(models.Model):
+	"""Model recording a reminder sent for an overdue loan, one per loan and due date."""
+
+	copy = models.ForeignKey('BookInstance', on_delete=models.CASCADE)
+	borrower = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+	# renewing moves the due date, the renewed loan gets its own reminder
+	due_back = models.DateField()
+	sent = models.DateTimeField(default=timezone.now)
+
+	class Meta:
+		constraints = [
+			UniqueConstraint(fields=['copy', 'borrower', 'due_back'], name='overduereminder_loan_unique'),
+		]
+
+	def __str__(self):
+		return f'Reminder to {self.borrower} for {self.copy_id} due {self.due_back}'
+
+class LoanEventBase(models.Model):
+	"""Fields of a loan event, shared by the ledger and its archive."""
+
+	ACTIONS = (
+		('c', 'Checked out'),
+		('n', 'Renewed'),
+		('r', 'Returned'),
+		('h', 'Reserved for a hold'),
+		('m', 'Sent to maintenance'),
+	)
+
+	action = models.CharField(max_length=1, choices=ACTIONS)
+	# plain ids without constraints, the history outlives deleted copies, books and users
+	copy = models.ForeignKey('BookInstance', on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+	# indexed together with created below
+	book = models.ForeignKey('Book', on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, null=True, related_name='+')
+	borrower = models.ForeignKey(
+		settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, null=True, related_name='+'
+	)
+	# the due date set by the event, for returns the one the loan had
+	due_back = models.DateField(null=True)
+	created = models.DateTimeField(default=timezone.now)
+
+	class Meta:
+		abstract = True
+
+	def __str__(self):
+		return f'{self.get_action_display()}: {self.copy_id} ({self.created:%Y-%m-%d})'
+
+class LoanEvent(LoanEventBase):
+	"""Model representing one step of a loan, appended by catalog.circulation and never changed."""
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['borrower', 'created'], name='loanevent_borrower_created'),
+			models.Index(fields=['book', 'created'], name='loanevent_book_created'),
+			# archival cuts off by age
+			models.Index(fields=['created'], name='loanevent_created'),
+		]
+
+class LoanEventArchive(LoanEventBase):
+	"""Loan events moved out of the ledger by archive_loan_events, with their ids kept."""
+
+	id = models.BigIntegerField(primary_key=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['borrower', 'created'], name='loanarchive_borrower_created'),
+			models.Index(fields=['book', 'created'], name='loanarchive_book_created'),
+		]
+
 class Author(models.Model):
 	"""Model representing an author."""
 
@@ -129,6 +336,9 @@ class Author(models.Model):
 
 	class Meta:
 		ordering = ['last_name', 'first_name']
+		indexes = [
+			models.Index(fields=['last_name', 'first_name', 'id'], name='author_name_idx'),
+		]
 	
 	def get_absolute_url(self):
 		"""Returns the URL to access a particular author instance."""
@@ -151,3 +361,152 @@ class Language(models.Model):
 	def get_absolute_url(self):
 		"""Returns the URL to access a particular language instance."""
 		return reverse('language-detail', args=[str(self.id)])
+
+class CopyCountManager(models.Manager):
+	"""Manager for reading and maintaining the denormalized copy counters."""
+
+	def _writer(self):
+		return self.db_manager(self._db or router.db_for_write(self.model))
+
+	def adjust(self, deltas):
+		"""Applies {(book_id, status): delta} to the per-book and global counters."""
+		totals = {}
+		for (book_id, status), delta in deltas.items():
+			if book_id is not None:
+				totals[(book_id, status)] = totals.get((book_id, status), 0) + delta
+			totals[(None, status)] = totals.get((None, status), 0) + delta
+
+		totals = { key: delta for key, delta in totals.items() if delta }
+
+		writer = self._writer()
+		with transaction.atomic(using=writer.db):
+			if len(totals) > self.BULK_THRESHOLD:
+				writer._add_many(totals)
+			else:
+				for (book_id, status), delta in totals.items():
+					writer._add(book_id, status, delta)
+
+	# above this many counters adjust() switches from one UPDATE per counter to set-based writes
+	BULK_THRESHOLD = 8
+
+	# bound on the ids per IN (...) clause, below SQLite's host parameter limit
+	BATCH_SIZE = 900
+
+	def _add_many(self, deltas):
+		"""Applies {(book_id, status): delta} in a number of queries independent of the books."""
+		book_ids = sorted({ book_id for book_id, status in deltas if book_id is not None })
+		existing = dict(
+			((book_id, status), pk)
+			for pk, book_id, status in self.filter(book__isnull=True).values_list('pk', 'book', 'status')
+		)
+		for start in range(0, len(book_ids), self.BATCH_SIZE):
+			existing.update(
+				((book_id, status), pk)
+				for pk, book_id, status in self.filter(book__in=book_ids[start:start + self.BATCH_SIZE])
+					.values_list('pk', 'book', 'status')
+			)
+
+		# one UPDATE per distinct delta (and batch) for the counters that exist
+		by_delta = {}
+		for key, delta in deltas.items():
+			if key in existing:
+				by_delta.setdefault(delta, []).append(existing[key])
+		for delta, pks in by_delta.items():
+			for start in range(0, len(pks), self.BATCH_SIZE):
+				self.filter(pk__in=pks[start:start + self.BATCH_SIZE]).update(count=F('count') + delta)
+
+		missing = [key for key in deltas if key not in existing]
+		try:
+			with transaction.atomic(using=self.db):
+				self.bulk_create(
+					[self.model(book_id=book_id, status=status, count=deltas[(book_id, status)]) for book_id, status in missing],
+					batch_size=self.BATCH_SIZE
+				)
+		except IntegrityError:
+			# another writer created some of the rows meanwhile, fall back to one at a time
+			for book_id, status in missing:
+				self._add(book_id, status, deltas[(book_id, status)])
+
+	def _add(self, book_id, status, delta):
+		counter = self.filter(book_id=book_id, status=status)
+
+		if counter.update(count=F('count') + delta):
+			return
+
+		try:
+			# first copy with this (book, status), the row doesn't exist yet
+			with transaction.atomic(using=self.db):
+				self.create(book_id=book_id, status=status, count=delta)
+		except IntegrityError:
+			# lost a race with another writer creating the same row
+			counter.update(count=F('count') + delta)
+
+	def counts(self, book=None):
+		"""Returns {status: count} for a book, or for the whole library."""
+		if book is None:
+			counters = self.filter(book__isnull=True)
+		else:
+			counters = self.filter(book=book)
+
+		return dict(counters.values_list('status', 'count'))
+
+	def expected(self):
+		"""Returns the counters as recomputed from the BookInstance table."""
+		copies = BookInstance.objects.using(self.db).order_by()
+		expected = {}
+
+		for book_id, status, num in copies.values_list('book', 'status').annotate(num=Count('pk')):
+			if book_id is not None:
+				expected[(book_id, status)] = num
+
+		for status, num in copies.values_list('status').annotate(num=Count('pk')):
+			expected[(None, status)] = num
+
+		return expected
+
+	def actual(self):
+		"""Returns the stored counters, leaving out empty ones."""
+		return {
+			(book_id, status): num
+			for book_id, status, num in self.values_list('book', 'status', 'count')
+			if num
+		}
+
+	def rebuild(self):
+		"""Recomputes every counter from scratch."""
+		writer = self._writer()
+		with transaction.atomic(using=writer.db):
+			expected = writer.expected()
+			writer.all().delete()
+			writer.bulk_create(
+				self.model(book_id=book_id, status=status, count=num)
+				for (book_id, status), num in expected.items()
+			)
+
+		return expected
+
+class CopyCount(models.Model):
+	"""Denormalized number of copies per loan status, per book and library-wide."""
+
+	# null book holds the library-wide counter
+	book = models.ForeignKey('Book', on_delete=models.CASCADE, null=True, blank=True)
+	status = models.CharField(max_length=1, choices=BookInstance.LOAN_STATUS, blank=True)
+	count = models.IntegerField(default=0)
+
+	objects = CopyCountManager()
+
+	class Meta:
+		constraints = [
+			UniqueConstraint(
+				fields=['book', 'status'],
+				name='copycount_book_status_unique'
+			),
+			UniqueConstraint(
+				fields=['status'],
+				condition=Q(book__isnull=True),
+				name='copycount_global_status_unique'
+			),
+		]
+
+	def __str__(self):
+		return f'{self.book or "All books"}: {self.get_status_display()} ({self.count})'
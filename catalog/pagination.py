@@ -0,0 +1,278 @@
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Q, QuerySet
+from django.http import Http404
+from django.utils.functional import cached_property
+
+# Salt for signing cursors so they can't be reused across other signed values
+CURSOR_SALT = 'catalog.pagination.cursor'
+
+class CursorPage(Sequence):
+	'''A page of results located by a keyset cursor instead of a page number.'''
+
+	# no paginator, the total count is never computed
+	paginator = None
+	number = None
+
+	def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+		self.object_list = object_list
+		self.next_cursor = next_cursor
+		self.previous_cursor = previous_cursor
+
+	def __repr__(self):
+		return f'<CursorPage {self.previous_cursor!r}..{self.next_cursor!r}>'
+
+	def __len__(self):
+		return len(self.object_list)
+
+	def __getitem__(self, index):
+		return self.object_list[index]
+
+	def has_next(self):
+		return self.next_cursor is not None
+
+	def has_previous(self):
+		return self.previous_cursor is not None
+
+	def has_other_pages(self):
+		return self.has_next() or self.has_previous()
+
+def wants_cursor_pagination(request, cursor_kwarg='cursor', default=None):
+	'''Whether a list request is paginated by cursor rather than page number.'''
+	if cursor_kwarg in request.GET:
+		return True
+	if default is not None:
+		return default
+	return settings.CATALOG_CURSOR_PAGINATION
+
+class KeysetPaginationMixin:
+	'''
+	ListView mixin paginating by seeking on the queryset ordering (plus pk as tiebreaker).
+
+	Used when the view sets cursor_pagination, when CATALOG_CURSOR_PAGINATION is on,
+	or when the request carries a 'cursor' parameter. Otherwise the regular offset
+	paginator is kept.
+	'''
+
+	cursor_pagination = None
+	cursor_kwarg = 'cursor'
+
+	def use_cursor_pagination(self):
+		return wants_cursor_pagination(self.request, self.cursor_kwarg, self.cursor_pagination)
+
+	def paginate_queryset(self, queryset, page_size):
+		if not self.use_cursor_pagination():
+			return super().paginate_queryset(queryset, page_size)
+
+		page = paginate_by_cursor(queryset, self.request.GET.get(self.cursor_kwarg), page_size)
+		return (None, page, page.object_list, page.has_other_pages())
+
+def get_keyset_ordering(queryset):
+	'''Returns [(field, descending)] for the queryset ordering, ending on the pk.'''
+	opts = queryset.model._meta
+	ordering = queryset.query.order_by
+
+	if not ordering and queryset.query.default_ordering:
+		ordering = opts.ordering
+
+	keys = []
+	for item in ordering:
+		name = item.lstrip('-') if isinstance(item, str) else None
+		field = opts.pk if name == 'pk' else next((f for f in opts.concrete_fields if f.name == name), None)
+
+		# related orderings follow the related Meta.ordering, which can't be seeked on directly
+		if field is None or field.is_relation:
+			raise ImproperlyConfigured(f'Keyset pagination needs local field orderings, got {item!r}.')
+
+		keys.append((field, item.startswith('-')))
+
+	# pk breaks ties so the ordering is total
+	if not any(field.primary_key for field, descending in keys):
+		keys.append((opts.pk, False))
+
+	return keys
+
+def _dump(value):
+	'''Makes a key value JSON serializable, the field's to_python() reverses it.'''
+	if value is None or isinstance(value, (bool, int, float, str)):
+		return value
+	return str(value)
+
+def _seek(keys, values, forward, nulls=True):
+	'''
+	Builds the filter selecting rows strictly after (or before) the cursor row.
+
+	Each key is bounded before the rows tied on it are narrowed down by the next keys,
+	k1 >= v1 AND (k1 > v1 OR (k2 >= v2 AND (k2 > v2 OR ...))), so the database seeks
+	on a range of the leading key instead of filtering an OR over the whole index.
+	Without nulls, rows with a null first key are left out, they're read separately.
+	'''
+	(field, descending), value = keys[0], values[0]
+	name = field.name
+
+	# nulls are ordered last, after every value
+	if value is None:
+		step = None if forward else Q(**{ f'{name}__isnull' : False })
+		same = Q(**{ f'{name}__isnull' : True })
+	else:
+		lookup = 'gt' if descending != forward else 'lt'
+		step = Q(**{ f'{name}__{lookup}' : value })
+		bound = Q(**{ f'{name}__{lookup}e' : value })
+		if forward and field.null and nulls:
+			step |= Q(**{ f'{name}__isnull' : True })
+			bound |= Q(**{ f'{name}__isnull' : True })
+		same = Q(**{ name : value })
+
+	if len(keys) == 1:
+		return step if step is not None else Q(pk__in=[])
+
+	rest = _seek(keys[1:], values[1:], forward)
+	if value is None:
+		return same & rest if step is None else step | (same & rest)
+	return bound & (step | rest)
+
+def _key_order(field, descending, forward, nulls=True):
+	if not forward:
+		descending = not descending
+	expression = F(field.name).desc if descending else F(field.name).asc
+
+	if not (field.null and nulls):
+		return expression()
+	if forward:
+		return expression(nulls_last=True)
+	return expression(nulls_first=True)
+
+def _order_by(keys, forward):
+	'''Returns the ordering walking forward, or backward from the cursor.'''
+	return [_key_order(field, descending, forward) for field, descending in keys]
+
+def _segments(keys, values, forward):
+	'''
+	Returns the [(filter, ordering)] parts of the walk from the cursor (values None for
+	the first page), read in turn until the page is full.
+
+	A nullable first key is walked in two parts, its values and then its nulls (the other
+	way around walking backward). Each part is then a plain range of the key's index,
+	with no IS NULL alternative in every page and no NULLS LAST sort.
+	'''
+	(field, descending), rest = keys[0], keys[1:]
+
+	if not field.null:
+		condition = Q() if values is None else _seek(keys, values, forward)
+		return [(condition, _order_by(keys, forward))]
+
+	not_null = Q(**{ f'{field.name}__isnull' : False })
+	null = Q(**{ f'{field.name}__isnull' : True })
+	not_null_order = [_key_order(field, descending, forward, nulls=False), *_order_by(rest, forward)]
+	null_order = _order_by(rest, forward)
+
+	if values is None:
+		return [(not_null, not_null_order), (null, null_order)]
+
+	if values[0] is not None:
+		seek = not_null & _seek(keys, values, forward, nulls=False)
+		if forward:
+			return [(seek, not_null_order), (null, null_order)]
+		return [(seek, not_null_order)]
+
+	seek = null & _seek(rest, values[1:], forward)
+	if forward:
+		return [(seek, null_order)]
+	return [(seek, null_order), (not_null, not_null_order)]
+
+def paginate_by_cursor(queryset, cursor, page_size):
+	'''Returns the CursorPage following (or preceding) the row encoded in cursor.'''
+	keys = get_keyset_ordering(queryset)
+	forward = True
+	values = None
+
+	if cursor:
+		try:
+			direction, values = signing.loads(cursor, salt=CURSOR_SALT)
+			if direction not in ('n', 'p') or len(values) != len(keys):
+				raise ValueError(cursor)
+			values = [
+				None if value is None else field.to_python(value)
+				for (field, descending), value in zip(keys, values)
+			]
+		except (signing.BadSignature, ValidationError, TypeError, ValueError) as e:
+			raise Http404('Invalid cursor') from e
+
+		forward = direction == 'n'
+
+	# one extra row tells whether there is anything past this page
+	rows = []
+	for condition, ordering in _segments(keys, values, forward):
+		rows += queryset.filter(condition).order_by(*ordering)[:page_size + 1 - len(rows)]
+		if len(rows) > page_size:
+			break
+
+	has_more = len(rows) > page_size
+	rows = rows[:page_size]
+
+	if forward:
+		has_next, has_previous = has_more, bool(cursor)
+	else:
+		# walked backward from the cursor row, which comes right after this page
+		rows.reverse()
+		has_next, has_previous = True, has_more
+
+	def encode(direction, obj):
+		# rows are model instances, or dicts for .values() querysets
+		if isinstance(obj, dict):
+			values = [_dump(obj[field.attname]) for field, descending in keys]
+		else:
+			values = [_dump(getattr(obj, field.attname)) for field, descending in keys]
+		return signing.dumps((direction, values), salt=CURSOR_SALT, compress=True)
+
+	next_cursor = previous_cursor = None
+	if rows:
+		if has_next:
+			next_cursor = encode('n', rows[-1])
+		if has_previous:
+			previous_cursor = encode('p', rows[0])
+
+	return CursorPage(rows, next_cursor, previous_cursor)
+
+def estimate_row_count(queryset):
+	'''Returns the database's estimate of the rows in the queryset's table, None if unknown.'''
+	connection = connections[queryset.db]
+	table = queryset.model._meta.db_table
+
+	with connection.cursor() as cursor:
+		if connection.vendor == 'postgresql':
+			# maintained by ANALYZE / autovacuum, -1 for a table never analyzed
+			cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+			row = cursor.fetchone()
+			return row[0] if row and row[0] >= 0 else None
+
+		if connection.vendor == 'sqlite':
+			# rowids are handed out in increasing order, the highest one is an upper bound
+			cursor.execute(f'SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}')
+			return cursor.fetchone()[0] or 0
+
+	return None
+
+class EstimatedCountPaginator(Paginator):
+	'''
+	Paginator that takes the row count of an unfiltered queryset over a big table
+	from the database's estimate instead of a full COUNT(*). Filtered querysets
+	and small tables are still counted exactly.
+	'''
+
+	# tables estimated below this size are counted exactly
+	estimate_threshold = 10000
+
+	@cached_property
+	def count(self):
+		if isinstance(self.object_list, QuerySet) and not self.object_list.query.where:
+			estimate = estimate_row_count(self.object_list)
+			if estimate is not None and estimate >= self.estimate_threshold:
+				return estimate
+
+		return Paginator.count.func(self)
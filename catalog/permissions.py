@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from .versioning import get_versions, version_key
+
+# Version keys of the cached permission sets (see catalog.signals): one per user for
+# their own permissions, superuser flag and groups, one for every user, bumped when
+# group permissions or permissions themselves change
+PERMISSIONS_VERSION_KEY = version_key('permissions')
+
+def user_permissions_version_key(user_id):
+	return version_key('permissions', 'user', user_id)
+
+def permissions_cache_key(user_obj):
+	'''Cache key of the user's permission set, changes with either version token.'''
+	versions = get_versions(user_permissions_version_key(user_obj.pk), PERMISSIONS_VERSION_KEY)
+	return ':'.join(['catalog:permissions', str(user_obj.pk), *versions])
+
+class CachedModelBackend(ModelBackend):
+	'''
+	ModelBackend sharing each user's permission set across requests through the cache,
+	so perms.* in the templates and PermissionRequiredMixin cost no queries once cached.
+	'''
+
+	def get_all_permissions(self, user_obj, obj=None):
+		if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+			return set()
+
+		if not hasattr(user_obj, '_perm_cache'):
+			key = permissions_cache_key(user_obj)
+			permissions = cache.get(key)
+			if permissions is None:
+				permissions = super().get_all_permissions(user_obj)
+				cache.set(key, permissions, settings.CATALOG_PERMISSION_CACHE_TIMEOUT)
+			user_obj._perm_cache = permissions
+
+		return user_obj._perm_cache
@@ -0,0 +1,75 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Apps whose reads may be served by a replica; sessions, auth and the rest stay on the primary
+REPLICA_APPS = {'catalog'}
+
+# Per-request routing state, set up by ReplicaPinningMiddleware
+_state = ContextVar('catalog_db_routing', default=None)
+
+class PrimaryReplicaRouter:
+	'''
+	Sends catalog reads to a random DATABASE_REPLICAS alias and everything else to the
+	primary. Reads stay on the primary inside a transaction on it and while the
+	current request (or the user's recent requests) wrote something.
+	'''
+
+	def db_for_read(self, model, **hints):
+		if not settings.DATABASE_REPLICAS or model._meta.app_label not in REPLICA_APPS:
+			return DEFAULT_DB_ALIAS
+
+		state = _state.get()
+		if state and (state['pinned'] or state['wrote']):
+			return DEFAULT_DB_ALIAS
+
+		# a transaction on the primary must see its own uncommitted rows
+		if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+			return DEFAULT_DB_ALIAS
+
+		return random.choice(settings.DATABASE_REPLICAS)
+
+	def db_for_write(self, model, **hints):
+		state = _state.get()
+		# session, cache table and other writes don't change what the replicas serve
+		if state is not None and model._meta.app_label in REPLICA_APPS:
+			state['wrote'] = True
+		return DEFAULT_DB_ALIAS
+
+	def allow_relation(self, obj1, obj2, **hints):
+		# replicas hold the same rows as the primary
+		return True
+
+	def allow_migrate(self, db, app_label, model_name=None, **hints):
+		return db == DEFAULT_DB_ALIAS
+
+def start_request(pinned):
+	'''Starts routing for a request, returns the token for end_request().'''
+	return _state.set({ 'pinned' : pinned, 'wrote' : False })
+
+def end_request(token):
+	'''Ends routing for a request, returns whether it wrote to the primary.'''
+	state = _state.get()
+	_state.reset(token)
+	return bool(state and state['wrote'])
+
+@contextmanager
+def use_primary():
+	'''Sends every read in the block to the primary, for code that reads back its own writes.'''
+	state = _state.get()
+	if state is None:
+		token = start_request(pinned=True)
+		try:
+			yield
+		finally:
+			_state.reset(token)
+		return
+
+	pinned, state['pinned'] = state['pinned'], True
+	try:
+		yield
+	finally:
+		state['pinned'] = pinned
@@ -0,0 +1,161 @@
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+
+from .models import Book
+
+# Index maintained by the 0007_book_search migration (triggers keep it in sync)
+SQLITE_FTS_TABLE = 'catalog_book_fts'
+POSTGRES_SEARCH_COLUMN = 'search_vector'
+POSTGRES_SEARCH_CONFIG = 'english'
+
+def _terms(query):
+	'''Splits free text into plain search words.'''
+	return re.findall(r'\w+', query or '')
+
+class SqliteSearchBackend:
+	'''Ranks books through the FTS5 virtual table, title and ISBN weigh most.'''
+
+	def __init__(self, connection):
+		self.connection = connection
+
+	def match(self, query):
+		# quote every word so user input can't be read as FTS5 syntax, prefix-match the last one
+		words = [f'"{word}"' for word in _terms(query)]
+		if words:
+			words[-1] += '*'
+		return ' '.join(words)
+
+	def count(self, query):
+		with self.connection.cursor() as cursor:
+			cursor.execute(
+				f'SELECT COUNT(*) FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s',
+				[self.match(query)]
+			)
+			return cursor.fetchone()[0]
+
+	def ranked_ids(self, query, offset, limit):
+		'''Returns [(book_id, rank)], best match first.'''
+		with self.connection.cursor() as cursor:
+			# bm25() is lower for better matches, negate it so higher ranks better everywhere
+			cursor.execute(
+				f'SELECT rowid, -bm25({SQLITE_FTS_TABLE}, 10.0, 1.0, 10.0, 5.0) AS rank '
+				f'FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s '
+				f'ORDER BY rank DESC, rowid LIMIT %s OFFSET %s',
+				[self.match(query), limit, offset]
+			)
+			return cursor.fetchall()
+
+class PostgresSearchBackend:
+	'''Ranks books through the GIN-indexed tsvector column on catalog_book.'''
+
+	def __init__(self, connection):
+		self.connection = connection
+
+	def tsquery(self):
+		return f"websearch_to_tsquery('{POSTGRES_SEARCH_CONFIG}', %s)"
+
+	def count(self, query):
+		with self.connection.cursor() as cursor:
+			cursor.execute(
+				f'SELECT COUNT(*) FROM catalog_book WHERE {POSTGRES_SEARCH_COLUMN} @@ {self.tsquery()}',
+				[query]
+			)
+			return cursor.fetchone()[0]
+
+	def ranked_ids(self, query, offset, limit):
+		'''Returns [(book_id, rank)], best match first.'''
+		with self.connection.cursor() as cursor:
+			cursor.execute(
+				f'SELECT id, ts_rank_cd({POSTGRES_SEARCH_COLUMN}, query) AS rank '
+				f'FROM catalog_book, {self.tsquery()} AS query '
+				f'WHERE {POSTGRES_SEARCH_COLUMN} @@ query '
+				f'ORDER BY rank DESC, id LIMIT %s OFFSET %s',
+				[query, limit, offset]
+			)
+			return cursor.fetchall()
+
+class BasicSearchBackend:
+	'''
+	Unranked fallback for databases without a search index (e.g. MySQL, Oracle):
+	every word has to appear in the title, summary, ISBN or author name. Scans the
+	table, fine for small catalogs.
+	'''
+
+	FIELDS = ('title', 'summary', 'isbn', 'author__first_name', 'author__last_name')
+
+	def __init__(self, connection):
+		self.connection = connection
+
+	def matches(self, query):
+		condition = Q()
+		for word in _terms(query):
+			condition &= Q(*(Q(**{ f'{field}__icontains' : word }) for field in self.FIELDS), _connector=Q.OR)
+		return Book.objects.using(self.connection.alias).filter(condition)
+
+	def count(self, query):
+		return self.matches(query).count()
+
+	def ranked_ids(self, query, offset, limit):
+		'''Returns [(book_id, rank)] in title order, every match ranks the same.'''
+		ids = self.matches(query).order_by('title', 'pk').values_list('pk', flat=True)[offset:offset + limit]
+		return [(book_id, 0.0) for book_id in ids]
+
+SEARCH_BACKENDS = {
+	'sqlite' : SqliteSearchBackend,
+	'postgresql' : PostgresSearchBackend,
+}
+
+def get_search_backend(using=None):
+	'''Returns the search backend matching the vendor of the database books are read from.'''
+	connection = connections[using or router.db_for_read(Book)]
+
+	# the 0007_book_search migration only builds an index on SQLite and PostgreSQL
+	return SEARCH_BACKENDS.get(connection.vendor, BasicSearchBackend)(connection)
+
+class SearchResults:
+	'''Lazy, sliceable ranked results, suitable for Django's Paginator.'''
+
+	model = Book
+
+	def __init__(self, query, using=None):
+		self.query = query
+		self.backend = get_search_backend(using)
+		self._count = None
+
+	def count(self):
+		if self._count is None:
+			self._count = self.backend.count(self.query) if _terms(self.query) else 0
+		return self._count
+
+	def __len__(self):
+		return self.count()
+
+	def __getitem__(self, key):
+		if not isinstance(key, slice):
+			return self[key:key + 1][0]
+
+		offset = key.start or 0
+		limit = (key.stop if key.stop is not None else self.count()) - offset
+		if limit <= 0 or not _terms(self.query):
+			return []
+
+		ranked = self.backend.ranked_ids(self.query, offset, limit)
+		books = (
+			Book.objects
+				.using(self.backend.connection.alias)
+				.select_related('author')
+				.in_bulk([book_id for book_id, rank in ranked])
+		)
+
+		results = []
+		for book_id, rank in ranked:
+			if book_id in books:
+				books[book_id].search_rank = rank
+				results.append(books[book_id])
+		return results
+
+def search_books(query, using=None):
+	'''Returns books matching query by title, summary, ISBN or author name, best first.'''
+	return SearchResults(query, using=using)
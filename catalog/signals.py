@@ -0,0 +1,227 @@
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Book, BookInstance, Author, Genre, Language, CopyCount, copies_bulk_changed
+from .permissions import PERMISSIONS_VERSION_KEY, user_permissions_version_key
+from .stats import invalidate_catalog_stats
+from .versioning import (
+	bump_versions, model_version_key, bump_object_versions, ALL_OBJECTS_VERSION_KEY
+)
+
+# Models whose rows feed the home page counts
+STATS_MODELS = (Book, BookInstance, Author, Genre)
+
+# Models with a version token for conditional GETs and cached pages
+VERSIONED_MODELS = (Book, BookInstance, Author, Genre, Language)
+
+def catalog_stats_changed(sender, **kwargs):
+	'''Invalidates the stats snapshot once a change to a counted model commits.'''
+	# wait for commit so a concurrent reader can't re-cache the old counts
+	transaction.on_commit(invalidate_catalog_stats)
+
+# per model, a delete listener on every model would stop all querysets from fast deleting
+for model in STATS_MODELS:
+	post_save.connect(catalog_stats_changed, sender=model)
+	post_delete.connect(catalog_stats_changed, sender=model)
+
+def catalog_model_changed(sender, using, **kwargs):
+	'''Bumps the model version once the change commits.'''
+	transaction.on_commit(partial(bump_versions, model_version_key(sender)), using=using)
+
+# per model, a delete listener on every model would stop all querysets from fast deleting
+for model in VERSIONED_MODELS:
+	post_save.connect(catalog_model_changed, sender=model)
+	post_delete.connect(catalog_model_changed, sender=model)
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_changed(sender, action, using, **kwargs):
+	if action in ('post_add', 'post_remove', 'post_clear'):
+		transaction.on_commit(partial(bump_versions, model_version_key(Book)), using=using)
+
+@receiver(copies_bulk_changed)
+def copies_changed_in_bulk(sender, using, **kwargs):
+	transaction.on_commit(invalidate_catalog_stats, using=using)
+	transaction.on_commit(partial(bump_versions, model_version_key(BookInstance)), using=using)
+
+# Copy counters
+
+@receiver(pre_save, sender=BookInstance)
+def remember_copy_state(sender, instance, using, **kwargs):
+	'''Locks the stored row and records its (book, status) before it is overwritten.'''
+	instance._stored_copy_state = None
+
+	if not instance._state.adding:
+		instance._stored_copy_state = (
+			sender.objects
+				.using(using)
+				.select_for_update()
+				.filter(pk=instance.pk)
+				.values_list('book', 'status')
+				.first()
+		)
+
+@receiver(post_save, sender=BookInstance)
+def count_saved_copy(sender, instance, using, **kwargs):
+	'''Moves the copy between counters when its book or status changed.'''
+	stored = getattr(instance, '_stored_copy_state', None)
+	current = (instance.book_id, instance.status)
+
+	if stored != current:
+		deltas = { current : 1 }
+		if stored is not None:
+			deltas[stored] = -1
+
+		CopyCount.objects.db_manager(using).adjust(deltas)
+
+@receiver(post_delete, sender=BookInstance)
+def count_deleted_copy(sender, instance, using, **kwargs):
+	CopyCount.objects.db_manager(using).adjust({ (instance.book_id, instance.status) : -1 })
+
+# Per-object versions of the book and author pages
+
+def bump_pages_on_commit(using, book_ids=(), author_ids=()):
+	'''Bumps the versions of the given book and author pages once the transaction commits.'''
+	book_ids = set(book_ids) - { None }
+	author_ids = set(author_ids) - { None }
+
+	# author pages list their books, so they change with them
+	if book_ids:
+		author_ids |= set(
+			Book.objects.using(using).filter(pk__in=book_ids).values_list('author_id', flat=True)
+		) - { None }
+
+	def bump():
+		bump_object_versions(Book, book_ids)
+		bump_object_versions(Author, author_ids)
+
+	transaction.on_commit(bump, using=using)
+
+@receiver(pre_save, sender=Book)
+def remember_book_author(sender, instance, using, **kwargs):
+	instance._stored_author_id = None
+	if not instance._state.adding:
+		instance._stored_author_id = (
+			sender.objects.using(using).filter(pk=instance.pk).values_list('author_id', flat=True).first()
+		)
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_page_changed(sender, instance, using, **kwargs):
+	# the previous author's page listed this book too
+	bump_pages_on_commit(
+		using,
+		book_ids=[instance.pk],
+		author_ids=[instance.author_id, getattr(instance, '_stored_author_id', None)]
+	)
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def author_page_changed(sender, instance, using, **kwargs):
+	# book pages show the author name
+	book_ids = Book.objects.using(using).filter(author=instance.pk).values_list('pk', flat=True)
+	bump_pages_on_commit(using, book_ids=book_ids, author_ids=[instance.pk])
+
+@receiver(post_save, sender=Genre)
+@receiver(pre_delete, sender=Genre)
+def genre_pages_changed(sender, instance, using, **kwargs):
+	# collected before delete, the through rows go with the genre
+	book_ids = Book.genre.through.objects.using(using).filter(genre=instance.pk).values_list('book_id', flat=True)
+	bump_pages_on_commit(using, book_ids=book_ids)
+
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def language_pages_changed(sender, instance, using, **kwargs):
+	book_ids = Book.objects.using(using).filter(language=instance.pk).values_list('pk', flat=True)
+	bump_pages_on_commit(using, book_ids=book_ids)
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genre_pages_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+	if action not in ('post_add', 'post_remove', 'post_clear'):
+		return
+
+	if not reverse:
+		bump_pages_on_commit(using, book_ids=[instance.pk])
+	elif pk_set is not None:
+		bump_pages_on_commit(using, book_ids=pk_set)
+	else:
+		# genre.book_set.clear() doesn't say which books lost the genre
+		transaction.on_commit(partial(bump_versions, ALL_OBJECTS_VERSION_KEY), using=using)
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+def copy_pages_changed(sender, instance, using, **kwargs):
+	stored = getattr(instance, '_stored_copy_state', None)
+	bump_pages_on_commit(using, book_ids=[instance.book_id, stored and stored[0]])
+
+@receiver(copies_bulk_changed)
+def copy_pages_changed_in_bulk(sender, using, book_ids, **kwargs):
+	if book_ids is None:
+		transaction.on_commit(partial(bump_versions, ALL_OBJECTS_VERSION_KEY), using=using)
+	else:
+		bump_pages_on_commit(using, book_ids=book_ids)
+
+# Cached permission sets
+
+User = get_user_model()
+
+def bump_permissions(using, user_ids=None):
+	'''Invalidates the cached permissions of the given users, of every user when None.'''
+	if user_ids is None:
+		keys = [PERMISSIONS_VERSION_KEY]
+	else:
+		keys = [user_permissions_version_key(user_id) for user_id in user_ids]
+
+	if keys:
+		# now for the rest of this transaction (a view granting and then checking a
+		# permission), again on commit in case a concurrent request cached the old set
+		bump_versions(*keys)
+		transaction.on_commit(partial(bump_versions, *keys), using=using)
+
+@receiver(post_save, sender=User)
+def user_permissions_changed(sender, instance, using, update_fields, **kwargs):
+	# logging in only stores last_login, covers is_active and is_superuser otherwise
+	if update_fields is None or set(update_fields) != { 'last_login' }:
+		bump_permissions(using, user_ids=[instance.pk])
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def user_assignments_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+	if action not in ('post_add', 'post_remove', 'post_clear'):
+		return
+
+	if not reverse:
+		bump_permissions(using, user_ids=[instance.pk])
+	else:
+		# permission.user_set / group.user_set, clear() doesn't say which users
+		bump_permissions(using, user_ids=pk_set)
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, action, using, **kwargs):
+	if action in ('post_add', 'post_remove', 'post_clear'):
+		bump_permissions(using)
+
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+@receiver(post_delete, sender=Group)
+def permissions_changed(sender, using, **kwargs):
+	# deleting cascades to the assignments without m2m_changed
+	bump_permissions(using)
+
+# Connection tuning
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+	'''Applies the SQLITE_PRAGMAS profile to every new SQLite connection.'''
+	if connection.vendor != 'sqlite':
+		return
+
+	with connection.cursor() as cursor:
+		for pragma, value in settings.SQLITE_PRAGMAS.items():
+			cursor.execute(f'PRAGMA {pragma} = {value}')
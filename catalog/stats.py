@@ -0,0 +1,113 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router
+from django.db.models import Count, Value
+from django.db.models.functions import Lower
+
+from .models import Book, Author, Genre, CopyCount
+
+# Cache key holding the latest dashboard snapshot
+STATS_CACHE_KEY = 'catalog:stats'
+
+def _count_sql(queryset):
+	'''Returns (sql, params) for a single-column COUNT(*) over the queryset.'''
+	# grouping on a constant collapses the whole queryset into one row
+	counted = (
+		queryset
+			.order_by()
+			.annotate(_one=Value(1))
+			.values('_one')
+			.annotate(count=Count('*'))
+			.values('count')
+	)
+	return counted.query.sql_with_params()
+
+def count_all(**querysets):
+	'''Evaluates several COUNT(*) querysets in one round trip as scalar subqueries.'''
+	using = router.db_for_read(Book)
+	connection = connections[using]
+
+	columns = []
+	params = []
+
+	for alias, queryset in querysets.items():
+		sql, sql_params = _count_sql(queryset.using(using))
+		columns.append(f'({sql}) AS {connection.ops.quote_name(alias)}')
+		params.extend(sql_params)
+
+	with connection.cursor() as cursor:
+		cursor.execute('SELECT ' + ', '.join(columns), params)
+		row = cursor.fetchone()
+
+	return dict(zip(querysets, row))
+
+def catalog_count_querysets():
+	'''Returns the querysets counted for the home page, by context name.'''
+	# compared on Lower() so the functional indexes on genre name and book title apply
+	genres = Genre.objects.alias(name_lower=Lower('name'))
+	books = Book.objects.alias(title_lower=Lower('title'))
+
+	return {
+		'num_books' : Book.objects.all(),
+		'num_authors' : Author.objects.all(),
+
+		'num_genre_fantasy' : genres.filter(name_lower='fantasy'),
+		'num_genre_drama' : genres.filter(name_lower='drana'),
+
+		'num_book_topaz' : books.filter(title_lower='topaz'),
+		'num_book_c' : books.filter(title_lower='sobre'),
+	}
+
+def compute_catalog_stats():
+	'''Computes the home page record counts straight from the database.'''
+	stats = count_all(**catalog_count_querysets())
+
+	# Copy numbers come from the maintained per-status counters
+	copy_counts = CopyCount.objects.counts()
+	stats['num_instances'] = sum(copy_counts.values())
+	# Available books, a=available
+	stats['num_instances_available'] = copy_counts.get('a', 0)
+
+	return stats
+
+def get_catalog_stats():
+	'''Returns the cached stats snapshot, recomputing it when missing or expired.'''
+	stats = cache.get(STATS_CACHE_KEY)
+
+	if stats is None:
+		stats = compute_catalog_stats()
+		cache.set(STATS_CACHE_KEY, stats, timeout=settings.CATALOG_STATS_MAX_AGE)
+
+	return stats
+
+async def acompute_catalog_stats():
+	'''Async compute_catalog_stats(), the record counts and the copy counters are read concurrently.'''
+	async def copy_counts():
+		counters = CopyCount.objects.filter(book__isnull=True).values_list('status', 'count')
+		return { status : count async for status, count in counters }
+
+	stats, copy_counts = await asyncio.gather(
+		sync_to_async(count_all)(**catalog_count_querysets()),
+		copy_counts()
+	)
+	stats['num_instances'] = sum(copy_counts.values())
+	stats['num_instances_available'] = copy_counts.get('a', 0)
+
+	return stats
+
+async def aget_catalog_stats():
+	'''Async get_catalog_stats().'''
+	stats = await cache.aget(STATS_CACHE_KEY)
+
+	if stats is None:
+		stats = await acompute_catalog_stats()
+		await cache.aset(STATS_CACHE_KEY, stats, timeout=settings.CATALOG_STATS_MAX_AGE)
+
+	return stats
+
+def invalidate_catalog_stats():
+	'''Drops the snapshot so the next read recomputes it.'''
+	cache.delete(STATS_CACHE_KEY)
@@ -0,0 +1,114 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, CopyCount, Genre
+from catalog.pagination import EstimatedCountPaginator, estimate_row_count
+
+# the admin templates need static file URLs, without requiring a collectstatic manifest
+@override_settings(STORAGES={
+	'default' : { 'BACKEND' : 'django.core.files.storage.FileSystemStorage' },
+	'staticfiles' : { 'BACKEND' : 'django.contrib.staticfiles.storage.StaticFilesStorage' },
+})
+class AdminChangelistQueryTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.superuser = get_user_model().objects.create_superuser(username='admin', password='1X<ISRUkw+tuK')
+		cls.genres = [Genre.objects.create(name=name) for name in ('Fantasy', 'Mystery', 'Poetry')]
+
+	def setUp(self):
+		self.client.force_login(self.superuser)
+
+	def add_books(self, count):
+		first = Book.objects.count()
+		for number in range(first, first + count):
+			author = Author.objects.create(first_name='First', last_name=f'Last {number}')
+			book = Book.objects.create(title=f'Title {number}', summary='Summary', isbn=f'{number:013d}', author=author)
+			book.genre.set(self.genres)
+			BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+
+	def changelist_queries(self, model):
+		url = reverse(f'admin:catalog_{model._meta.model_name}_changelist')
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(url)
+		self.assertEqual(response.status_code, 200)
+		return len(queries)
+
+	def test_changelist_queries_bounded(self):
+		models = (Book, BookInstance, Author)
+
+		self.add_books(2)
+		few = [self.changelist_queries(model) for model in models]
+
+		self.add_books(10)
+		self.assertEqual([self.changelist_queries(model) for model in models], few)
+
+	def test_book_changelist_shows_genres(self):
+		self.add_books(1)
+		response = self.client.get(reverse('admin:catalog_book_changelist'))
+		self.assertContains(response, 'Fantasy, Mystery, Poetry')
+
+	def test_estimated_count(self):
+		self.add_books(3)
+		self.assertGreaterEqual(estimate_row_count(Book.objects.all()), 3)
+
+		paginator = EstimatedCountPaginator(Book.objects.order_by('pk'), 2)
+		paginator.estimate_threshold = 1
+		self.assertGreaterEqual(paginator.count, 3)
+
+		# filtered querysets are always counted exactly
+		paginator = EstimatedCountPaginator(Book.objects.filter(title='Title 1').order_by('pk'), 2)
+		paginator.estimate_threshold = 1
+		self.assertEqual(paginator.count, 1)
+
+@override_settings(STORAGES={
+	'default' : { 'BACKEND' : 'django.core.files.storage.FileSystemStorage' },
+	'staticfiles' : { 'BACKEND' : 'django.contrib.staticfiles.storage.StaticFilesStorage' },
+})
+class BookInstanceActionsTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.superuser = get_user_model().objects.create_superuser(username='admin', password='1X<ISRUkw+tuK')
+		patron = get_user_model().objects.create_user(username='patron')
+		book = Book.objects.create(title='Title', summary='Summary', isbn='ABCDEFG')
+		cls.copies = [
+			BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=patron, due_back=datetime.date.today())
+			for _ in range(30)
+		]
+
+	def setUp(self):
+		self.client.force_login(self.superuser)
+
+	def act(self, action, **data):
+		return self.client.post(reverse('admin:catalog_bookinstance_changelist'), {
+			'action' : action,
+			'_selected_action' : [copy.pk for copy in self.copies],
+			**data,
+		}, follow=True)
+
+	def test_renew(self):
+		renewal_date = datetime.date.today() + datetime.timedelta(weeks=2)
+		with CaptureQueriesContext(connection) as queries:
+			response = self.act('renew', renewal_date=renewal_date)
+
+		self.assertContains(response, 'Renewed 30 loans')
+		self.assertEqual(set(BookInstance.objects.values_list('due_back', flat=True)), { renewal_date })
+		self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE "catalog_bookinstance"')]), 1)
+
+	def test_renew_validates_the_date(self):
+		response = self.act('renew', renewal_date=datetime.date.today() + datetime.timedelta(weeks=5))
+
+		self.assertContains(response, 'Invalid date - renewal more than 4 weeks')
+		self.assertEqual(set(BookInstance.objects.values_list('due_back', flat=True)), { datetime.date.today() })
+
+	def test_mark_returned(self):
+		self.assertContains(self.act('mark_returned'), 'Marked 30 copies returned')
+		self.assertEqual(CopyCount.objects.counts(), { 'a' : 30, 'o' : 0 })
+
+	def test_send_to_maintenance(self):
+		self.assertContains(self.act('send_to_maintenance'), 'Sent 30 copies to maintenance')
+		self.assertEqual(set(BookInstance.objects.values_list('status', 'borrower')), { ('m', None) })
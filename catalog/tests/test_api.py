@@ -0,0 +1,141 @@
+import tempfile
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog import circulation
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.versioning import model_version_key
+
+class CatalogApiTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.author = Author.objects.create(first_name='Dominique', last_name='Rousseau')
+		cls.book = Book.objects.create(
+			title='BookTitle',
+			summary='Summary',
+			isbn='ABCDEFG',
+			author=cls.author,
+			language=Language.objects.create(name='English')
+		)
+		cls.book.genre.set([Genre.objects.create(name='Fantasy')])
+
+		BookInstance.objects.create(book=cls.book, imprint='Imprint', status='a')
+		BookInstance.objects.create(book=cls.book, imprint='Imprint', status='o', due_back='2030-01-01')
+
+		for author_id in range(60):
+			Author.objects.create(first_name=f'First { author_id }', last_name=f'Last { author_id:02d}')
+
+	def setUp(self):
+		cache.clear()
+
+	def test_book_detail(self):
+		response = self.client.get(reverse('api_book_detail', args=[self.book.pk]))
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json(), {
+			'id' : self.book.pk,
+			'title' : 'BookTitle',
+			'summary' : 'Summary',
+			'isbn' : 'ABCDEFG',
+			'author_id' : self.author.pk,
+			'author__first_name' : 'Dominique',
+			'author__last_name' : 'Rousseau',
+			'language__name' : 'English',
+			'genres' : ['Fantasy'],
+			'copies' : { 'a' : 1, 'o' : 1 },
+		})
+
+	def test_write_in_another_worker_changes_the_etag(self):
+		with tempfile.TemporaryDirectory() as directory:
+			backend = { 'BACKEND' : 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION' : directory }
+			with override_settings(CACHES={ 'default' : backend }):
+				url = reverse('api_book_list')
+				etag = self.client.get(url)['ETag']
+				self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+				# the worker that saved the book bumped the token through its own cache client
+				FileBasedCache(directory, {}).set(model_version_key(Book), uuid.uuid4().hex, timeout=None)
+
+				self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+	def test_book_availability(self):
+		response = self.client.get(reverse('api_book_availability', args=[self.book.pk]))
+		self.assertEqual(response.json()['available'], 1)
+		self.assertEqual(response.json()['next_due_back'], '2030-01-01')
+
+	def test_missing_book_is_404(self):
+		response = self.client.get(reverse('api_book_detail', args=[self.book.pk + 1]))
+		self.assertEqual(response.status_code, 404)
+
+	def test_author_list_is_cursor_paginated(self):
+		response = self.client.get(reverse('api_author_list'))
+		page = response.json()
+		self.assertEqual(len(page['results']), 50)
+		self.assertIsNone(page['previous'])
+
+		response = self.client.get(reverse('api_author_list'), { 'cursor' : page['next'] })
+		page = response.json()
+		self.assertEqual(len(page['results']), 11)
+		self.assertIsNone(page['next'])
+
+	def test_matching_etag_gets_304_without_queries(self):
+		url = reverse('api_book_detail', args=[self.book.pk])
+		etag = self.client.get(url)['ETag']
+		self.assertFalse(etag.startswith('W/'))
+
+		with self.assertNumQueries(0):
+			response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+
+	def test_etag_changes_when_data_changes(self):
+		url = reverse('api_book_detail', args=[self.book.pk])
+		etag = self.client.get(url)['ETag']
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.book.genre.add(Genre.objects.create(name='Drama'))
+
+		response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertNotEqual(response['ETag'], etag)
+		self.assertEqual(response.json()['genres'], ['Drama', 'Fantasy'])
+
+	def test_writes_are_not_allowed(self):
+		response = self.client.post(reverse('api_book_list'))
+		self.assertEqual(response.status_code, 405)
+
+class HoldApiTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		book = Book.objects.create(title='BookTitle', summary='Summary', isbn='ABCDEFG')
+		cls.patron, other, cls.librarian = (
+			get_user_model().objects.create_user(username=username) for username in ('patron', 'other', 'librarian')
+		)
+		cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+
+		BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=other, due_back='2030-01-01')
+		circulation.place_hold(book, other)
+		cls.hold = circulation.place_hold(book, cls.patron)
+
+	def test_hold_detail(self):
+		self.client.force_login(self.patron)
+		response = self.client.get(reverse('api_hold_detail', args=[self.hold.pk]))
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json()['position'], 2)
+		self.assertEqual(response.json()['estimated_available'], '2030-01-22')
+		self.assertIsNone(response.json()['copy_id'])
+
+	def test_other_borrowers_holds_are_hidden(self):
+		self.assertEqual(self.client.get(reverse('api_hold_detail', args=[self.hold.pk])).status_code, 403)
+
+		self.client.force_login(get_user_model().objects.get(username='other'))
+		self.assertEqual(self.client.get(reverse('api_hold_detail', args=[self.hold.pk])).status_code, 404)
+
+		self.client.force_login(self.librarian)
+		self.assertEqual(self.client.get(reverse('api_hold_detail', args=[self.hold.pk])).status_code, 200)
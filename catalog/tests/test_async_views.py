@@ -0,0 +1,138 @@
+import datetime
+import importlib
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import clear_url_caches, reverse
+
+from catalog import async_views
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+User = get_user_model()
+
+def reload_urlconf():
+	'''Re-imports the URLconfs, which pick the sync or async views at import time.'''
+	import catalog.urls
+	import liib1.urls
+
+	importlib.reload(catalog.urls)
+	importlib.reload(liib1.urls)
+	clear_url_caches()
+
+@override_settings(CATALOG_ASYNC_VIEWS=True)
+class AsyncViewsTest(TestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		reload_urlconf()
+		# runs once the settings override is gone again
+		cls.addClassCleanup(reload_urlconf)
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.author = Author.objects.create(first_name='Dominique', last_name='Rousseau')
+		cls.book = Book.objects.create(
+			title='Topaz',
+			summary='Summary',
+			isbn='ABCDEFG',
+			author=cls.author,
+			language=Language.objects.create(name='English')
+		)
+		cls.book.genre.set([Genre.objects.create(name='Fantasy')])
+
+		for number in range(12):
+			Author.objects.create(first_name=f'First {number}', last_name=f'Last {number:02d}')
+
+		cls.borrower = User.objects.create_user(username='borrower', password='1X<ISRUkw+tuK')
+		cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+		cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+
+		due_back = datetime.date.today() + datetime.timedelta(days=5)
+		for status in ('a', 'o', 'o'):
+			BookInstance.objects.create(
+				book=cls.book,
+				imprint='Unlikely Imprint, 2016',
+				status=status,
+				due_back=due_back if status == 'o' else None,
+				borrower=cls.borrower if status == 'o' else None
+			)
+
+	def setUp(self):
+		cache.clear()
+
+	def test_async_views_routed(self):
+		from catalog import urls
+		self.assertIs(urls.book_list, async_views.book_list)
+
+	async def test_index(self):
+		response = await self.async_client.get(reverse('index'))
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.context['num_books'], 1)
+		self.assertEqual(response.context['num_instances'], 3)
+		self.assertEqual(response.context['num_instances_available'], 1)
+		self.assertEqual(response.context['num_visits'], 1)
+
+	async def test_author_list_paginated(self):
+		response = await self.async_client.get(reverse('authors'))
+
+		self.assertEqual(response.status_code, 200)
+		self.assertTemplateUsed(response, 'catalog/author_list.html')
+		self.assertTrue(response.context['is_paginated'])
+		self.assertEqual(len(response.context['author_list']), async_views.PAGE_SIZE)
+
+		response = await self.async_client.get(reverse('authors') + '?page=2')
+		self.assertEqual(len(response.context['author_list']), 3)
+
+		response = await self.async_client.get(reverse('authors') + '?page=9')
+		self.assertEqual(response.status_code, 404)
+
+	async def test_author_list_by_cursor(self):
+		response = await self.async_client.get(reverse('authors') + '?cursor=')
+		next_cursor = response.context['page_obj'].next_cursor
+
+		response = await self.async_client.get(reverse('authors'), { 'cursor' : next_cursor })
+		self.assertEqual(len(response.context['author_list']), 3)
+
+	async def test_book_list(self):
+		response = await self.async_client.get(reverse('books'))
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual([book.title for book in response.context['book_list']], ['Topaz'])
+
+	async def test_book_detail(self):
+		response = await self.async_client.get(reverse('book_detail', args=[self.book.pk]))
+
+		self.assertEqual(response.status_code, 200)
+		self.assertContains(response, 'Fantasy')
+		self.assertContains(response, 'Unlikely Imprint, 2016', count=3)
+
+		response = await self.async_client.get(reverse('book_detail', args=[self.book.pk + 100]))
+		self.assertEqual(response.status_code, 404)
+
+	async def test_author_detail(self):
+		response = await self.async_client.get(reverse('author_detail', args=[self.author.pk]))
+
+		self.assertEqual(response.status_code, 200)
+		self.assertContains(response, 'Available: 1')
+
+	async def test_loaned_books_by_user(self):
+		response = await self.async_client.get(reverse('my_borrowed'))
+		self.assertRedirects(response, f'/accounts/login/?next={reverse("my_borrowed")}', fetch_redirect_response=False)
+
+		await self.async_client.aforce_login(self.borrower)
+		response = await self.async_client.get(reverse('my_borrowed'))
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(response.context['bookinstance_list']), 2)
+
+	async def test_all_loaned_books_permission(self):
+		await self.async_client.aforce_login(self.borrower)
+		response = await self.async_client.get(reverse('all_borrowed'))
+		self.assertEqual(response.status_code, 403)
+
+		await self.async_client.aforce_login(self.librarian)
+		response = await self.async_client.get(reverse('all_borrowed'))
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(response.context['bookinstance_list']), 2)
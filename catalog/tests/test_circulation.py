@@ -0,0 +1,330 @@
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+
+from catalog import circulation
+from catalog.models import Author, Book, BookInstance, CopyCount, Hold, LoanEvent, LoanEventArchive
+
+User = get_user_model()
+
+class CirculationTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		author = Author.objects.create(first_name='Dominique', last_name='Rousseau')
+		cls.book = Book.objects.create(title='Topaz', summary='Summary', isbn='ABCDEFG', author=author)
+		cls.patron = User.objects.create_user(username='patron', password='2HJ1vRV0Z&3iD')
+
+		cls.available = BookInstance.objects.create(book=cls.book, imprint='Imprint', status='a')
+		BookInstance.objects.create(book=cls.book, imprint='Imprint', status='m')
+
+	def test_checkout_takes_an_available_copy(self):
+		copy_id = circulation.checkout(self.book, self.patron)
+
+		copy = BookInstance.objects.get(pk=copy_id)
+		self.assertEqual(copy, self.available)
+		self.assertEqual((copy.status, copy.borrower), ('o', self.patron))
+		self.assertEqual(copy.due_back, datetime.date.today() + circulation.LOAN_PERIOD)
+		self.assertEqual(CopyCount.objects.counts(self.book), { 'a' : 0, 'o' : 1, 'm' : 1 })
+
+	def test_checkout_without_an_available_copy(self):
+		circulation.checkout(self.book, self.patron)
+
+		with self.assertRaises(circulation.CopyUnavailable):
+			circulation.checkout(self.book, self.patron)
+
+	def test_checkout_picks_and_takes_the_copy_in_one_statement(self):
+		# every counter exists
+		circulation.give_back(circulation.checkout(self.book, self.patron))
+
+		# in savepoints: an UPDATE ... RETURNING for a reserved copy then one for an
+		# available copy, the four counters moved by one, the book's author for the page
+		# versions, the ledger entry
+		with self.assertNumQueries(2 + 2 + 2 + 4 + 1 + 1):
+			circulation.checkout(self.book, self.patron)
+
+		self.assertEqual(CopyCount.objects.counts(self.book), { 'a' : 0, 'o' : 1, 'm' : 1 })
+		self.assertEqual(CopyCount.objects.expected(), CopyCount.objects.actual())
+
+	def test_checkout_copy(self):
+		due_back = datetime.date.today() + datetime.timedelta(days=3)
+		circulation.checkout_copy(self.available, self.patron, due_back)
+
+		self.assertEqual(BookInstance.objects.get(pk=self.available.pk).due_back, due_back)
+		with self.assertRaises(circulation.CopyUnavailable):
+			circulation.checkout_copy(self.available, self.patron)
+
+	def test_give_back(self):
+		circulation.checkout_copy(self.available, self.patron)
+		circulation.give_back(self.available)
+
+		copy = BookInstance.objects.get(pk=self.available.pk)
+		self.assertEqual((copy.status, copy.borrower, copy.due_back), ('a', None, None))
+		self.assertEqual(CopyCount.objects.counts(self.book), { 'a' : 1, 'o' : 0, 'm' : 1 })
+
+		with self.assertRaises(circulation.NotOnLoan):
+			circulation.give_back(self.available)
+
+	def test_renew(self):
+		due_back = datetime.date.today() + datetime.timedelta(weeks=4)
+		with self.assertRaises(circulation.NotOnLoan):
+			circulation.renew(self.available, due_back)
+
+		circulation.checkout_copy(self.available, self.patron)
+		circulation.renew(self.available, due_back)
+
+		copy = BookInstance.objects.get(pk=self.available.pk)
+		self.assertEqual((copy.status, copy.borrower, copy.due_back), ('o', self.patron, due_back))
+
+class HoldQueueTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		author = Author.objects.create(first_name='Dominique', last_name='Rousseau')
+		cls.book = Book.objects.create(title='Topaz', summary='Summary', isbn='ABCDEFG', author=author)
+		cls.patrons = [User.objects.create_user(username=f'patron{number}') for number in range(4)]
+
+		today = datetime.date.today()
+		cls.copies = [
+			BookInstance.objects.create(
+				book=cls.book, imprint='Imprint', status='o', borrower=cls.patrons[0], due_back=today + datetime.timedelta(days=days)
+			)
+			for days in (10, 3)
+		]
+
+	def place(self, *patrons):
+		return [circulation.place_hold(self.book, patron) for patron in patrons]
+
+	def test_holds_wait_first_come_first_served(self):
+		first, second, third = self.place(*self.patrons[1:])
+
+		self.assertEqual([circulation.queue_position(hold) for hold in (first, second, third)], [1, 2, 3])
+		self.assertEqual(circulation.place_hold(self.book, self.patrons[2]), second)
+
+	def test_return_reserves_the_copy_for_the_first_hold(self):
+		first, second = self.place(*self.patrons[1:3])
+
+		circulation.give_back(self.copies[0])
+
+		copy = BookInstance.objects.get(pk=self.copies[0].pk)
+		self.assertEqual((copy.status, copy.borrower), ('r', self.patrons[1]))
+		self.assertEqual(copy.due_back, datetime.date.today() + circulation.PICKUP_PERIOD)
+		first.refresh_from_db()
+		self.assertEqual(first.copy, copy)
+		self.assertEqual(circulation.queue_position(first), 0)
+		self.assertEqual(circulation.queue_position(Hold.objects.get(pk=second.pk)), 1)
+
+		# only the holder can take it
+		with self.assertRaises(circulation.CopyUnavailable):
+			circulation.checkout(self.book, self.patrons[2])
+		self.assertEqual(circulation.checkout(self.book, self.patrons[1]), copy.pk)
+		self.assertFalse(Hold.objects.filter(pk=first.pk).exists())
+		self.assertEqual(CopyCount.objects.expected(), CopyCount.objects.actual())
+
+	def test_return_without_holds_makes_the_copy_available(self):
+		circulation.give_back(self.copies[0])
+
+		self.assertEqual(BookInstance.objects.get(pk=self.copies[0].pk).status, 'a')
+
+	def test_hold_on_an_available_copy_reserves_it(self):
+		circulation.give_back(self.copies[0])
+		hold, = self.place(self.patrons[1])
+
+		self.assertEqual(hold.copy_id, self.copies[0].pk)
+		self.assertEqual(BookInstance.objects.get(pk=self.copies[0].pk).status, 'r')
+
+	def test_cancelled_hold_passes_the_copy_on(self):
+		first, second = self.place(*self.patrons[1:3])
+		circulation.give_back(self.copies[0])
+
+		circulation.cancel_hold(Hold.objects.get(pk=first.pk))
+
+		copy = BookInstance.objects.get(pk=self.copies[0].pk)
+		self.assertEqual((copy.status, copy.borrower), ('r', self.patrons[2]))
+		self.assertEqual(Hold.objects.get(pk=second.pk).copy, copy)
+
+	def test_bulk_return_serves_the_holds_first(self):
+		hold, = self.place(self.patrons[1])
+
+		returned = circulation.give_back_many(BookInstance.objects.filter(book=self.book))
+
+		self.assertEqual(returned, 2)
+		self.assertEqual(sorted(BookInstance.objects.values_list('status', flat=True)), ['a', 'r'])
+		self.assertIsNotNone(Hold.objects.get(pk=hold.pk).copy)
+
+	def test_maintenance_puts_the_hold_back_in_line(self):
+		hold, = self.place(self.patrons[1])
+		circulation.give_back(self.copies[0])
+
+		circulation.send_to_maintenance(BookInstance.objects.filter(pk=self.copies[0].pk))
+
+		self.assertIsNone(Hold.objects.get(pk=hold.pk).copy)
+		self.assertEqual(BookInstance.objects.get(pk=self.copies[0].pk).status, 'm')
+
+	def test_estimated_availability_follows_the_due_dates(self):
+		today = datetime.date.today()
+		holds = self.place(*self.patrons[1:])
+
+		self.assertEqual(
+			[circulation.estimated_availability(hold) for hold in holds],
+			[
+				today + datetime.timedelta(days=3),
+				today + datetime.timedelta(days=10),
+				today + datetime.timedelta(days=3) + circulation.LOAN_PERIOD,
+			]
+		)
+
+	def test_estimate_loads_neither_the_queue_nor_the_loans(self):
+		hold = self.place(*self.patrons[1:])[-1]
+
+		# the position count, the loan counter and one due date, whatever the queue length
+		with self.assertNumQueries(3):
+			circulation.estimated_availability(hold)
+
+class LoanLedgerTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		author = Author.objects.create(first_name='Dominique', last_name='Rousseau')
+		cls.book = Book.objects.create(title='Topaz', summary='Summary', isbn='ABCDEFG', author=author)
+		cls.patrons = [User.objects.create_user(username=f'patron{number}') for number in range(2)]
+		cls.copy = BookInstance.objects.create(book=cls.book, imprint='Imprint', status='a')
+
+	def actions(self, **filters):
+		return [event['action'] for event in circulation.loan_history(**filters)]
+
+	def test_every_change_of_a_loan_is_recorded(self):
+		due_back = datetime.date.today() + datetime.timedelta(weeks=4)
+		circulation.checkout(self.book, self.patrons[0])
+		circulation.place_hold(self.book, self.patrons[1])
+		circulation.renew(self.copy, due_back)
+		circulation.give_back(self.copy)
+		circulation.send_to_maintenance(BookInstance.objects.filter(pk=self.copy.pk))
+
+		# newest first
+		self.assertEqual(self.actions(book=self.book), ['m', 'h', 'r', 'n', 'c'])
+		self.assertEqual(self.actions(borrower=self.patrons[0]), ['r', 'n', 'c'])
+
+		returned = LoanEvent.objects.get(action='r')
+		self.assertEqual((returned.copy_id, returned.borrower_id, returned.due_back), (self.copy.pk, self.patrons[0].pk, due_back))
+
+	def test_failed_operations_are_not_recorded(self):
+		with self.assertRaises(circulation.NotOnLoan):
+			circulation.renew(self.copy, datetime.date.today())
+
+		self.assertFalse(LoanEvent.objects.exists())
+
+	def test_bulk_operations_record_one_event_per_copy(self):
+		BookInstance.objects.bulk_create(BookInstance(book=self.book, imprint='Imprint', status='a') for _ in range(2))
+		for _ in range(3):
+			circulation.checkout(self.book, self.patrons[0])
+
+		copies = BookInstance.objects.filter(book=self.book)
+		circulation.renew_many(copies, datetime.date.today() + datetime.timedelta(weeks=4))
+		circulation.give_back_many(copies)
+
+		self.assertEqual(LoanEvent.objects.filter(action='n').count(), 3)
+		self.assertEqual(LoanEvent.objects.filter(action='r').count(), 3)
+
+	def test_history_spans_the_archive(self):
+		circulation.checkout(self.book, self.patrons[0])
+		old = LoanEvent.objects.get()
+		LoanEventArchive.objects.create(
+			id=old.id, action=old.action, copy_id=old.copy_id, book_id=old.book_id, borrower_id=old.borrower_id,
+			due_back=old.due_back, created=old.created,
+		)
+		old.delete()
+		circulation.give_back(self.copy)
+
+		self.assertEqual(self.actions(borrower=self.patrons[0]), ['r', 'c'])
+		self.assertEqual(self.actions(borrower=self.patrons[1]), [])
+
+# Run in a separate process against a SQLite file, the in-memory test database can't be
+# written from several threads
+CONTENTION_SCRIPT = '''
+import json, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth import get_user_model
+from django.db import connections
+from catalog import circulation
+from catalog.models import Book, BookInstance, CopyCount
+
+book = Book.objects.create(title='Contended', summary='', isbn='CONTENDED')
+BookInstance.objects.bulk_create(BookInstance(book=book, imprint='', status='a') for _ in range(COPIES))
+users = [get_user_model().objects.create_user(f'patron{number}').pk for number in range(WORKERS)]
+
+def grab(number):
+	lent, missed = [], 0
+	try:
+		for _ in range(ATTEMPTS):
+			try:
+				lent.append(str(circulation.checkout(book, users[number])))
+			except circulation.CopyUnavailable:
+				missed += 1
+	finally:
+		connections.close_all()
+	return lent, missed
+
+def cycle(number):
+	try:
+		for _ in range(ATTEMPTS):
+			circulation.give_back(circulation.checkout(book, users[number]))
+	finally:
+		connections.close_all()
+
+with ThreadPoolExecutor(WORKERS) as pool:
+	grabbed = list(pool.map(grab, range(WORKERS)))
+lent = [copy_id for copies, missed in grabbed for copy_id in copies]
+result = {
+	'lent' : lent,
+	'missed' : sum(missed for copies, missed in grabbed),
+	'counts' : CopyCount.objects.counts(book),
+}
+
+BookInstance.objects.filter(book=book).update(status='a', borrower=None, due_back=None)
+started = time.perf_counter()
+with ThreadPoolExecutor(WORKERS) as pool:
+	list(pool.map(cycle, range(WORKERS)))
+result['throughput_ops'] = 2 * WORKERS * ATTEMPTS / (time.perf_counter() - started)
+result['consistent'] = CopyCount.objects.actual() == CopyCount.objects.expected()
+print(json.dumps(result))
+'''
+
+class CheckoutContentionTest(SimpleTestCase):
+	COPIES, WORKERS, ATTEMPTS = 10, 6, 5
+
+	def manage(self, *args, **env):
+		environ = { key : value for key, value in os.environ.items() if not key.startswith(('DATABASE_', 'DJANGO_')) }
+		return subprocess.run(
+			[sys.executable, 'manage.py', *args],
+			cwd=settings.BASE_DIR,
+			capture_output=True,
+			text=True,
+			check=True,
+			env={ **environ, **env },
+		)
+
+	def test_concurrent_checkouts_never_share_a_copy(self):
+		script = CONTENTION_SCRIPT
+		for name in ('COPIES', 'WORKERS', 'ATTEMPTS'):
+			script = script.replace(name, str(getattr(self, name)))
+
+		with tempfile.TemporaryDirectory() as directory:
+			database = f'sqlite:///{Path(directory) / "circulation.sqlite3"}'
+			self.manage('migrate', '--verbosity', '0', DATABASE_URL=database)
+			output = self.manage('shell', '-c', script, DATABASE_URL=database).stdout
+			result = json.loads(output.strip().splitlines()[-1])
+
+		# every copy lent out exactly once, every other attempt told there was none
+		self.assertEqual(len(result['lent']), self.COPIES)
+		self.assertEqual(len(set(result['lent'])), self.COPIES)
+		self.assertEqual(result['missed'], self.WORKERS * self.ATTEMPTS - self.COPIES)
+		self.assertEqual(result['counts'], { 'a' : 0, 'o' : self.COPIES })
+
+		self.assertTrue(result['consistent'])
+		self.assertGreater(result['throughput_ops'], 0)
@@ -0,0 +1,296 @@
+import datetime
+import json
+import tempfile
+from unittest import mock
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+
+from catalog.benchmark import percentile
+from catalog.management.commands.seed_catalog import GENRES
+from catalog.models import Author, Book, BookInstance, CopyCount, Genre, Language, LoanEvent, LoanEventArchive, OverdueReminder
+
+class ImportCatalogCommandTest(TestCase):
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.addCleanup(self.directory.cleanup)
+
+		Genre.objects.create(name='Fantasy')
+
+	def write(self, name, content):
+		path = Path(self.directory.name) / name
+		path.write_text(content)
+		return str(path)
+
+	def test_import_csv(self):
+		path = self.write('books.csv', (
+			'title,isbn,summary,author,language,genres,copies,imprint\n'
+			'Earthsea,9780553383041,Mages,"Le Guin, Ursula",English,fantasy;Classics,3,Bantam\n'
+			'Lathe,9780060512750,Dreams,"Le Guin, Ursula",English,Science Fiction,1,Harper\n'
+		))
+		call_command('import_catalog', path, '--batch-size', '1', stdout=StringIO())
+
+		book = Book.objects.get(isbn='9780553383041')
+		self.assertEqual(str(book.author), 'Le Guin, Ursula')
+		self.assertEqual(book.language.name, 'English')
+		self.assertEqual(sorted(genre.name for genre in book.genre.all()), ['Classics', 'Fantasy'])
+
+		# authors, genres and languages resolved once and reused
+		self.assertEqual(Author.objects.count(), 1)
+		self.assertEqual(Language.objects.count(), 1)
+		self.assertEqual(Genre.objects.count(), 3)
+
+		self.assertEqual(BookInstance.objects.filter(book=book, status='a').count(), 3)
+		self.assertEqual(CopyCount.objects.counts(), { 'a' : 4 })
+
+	def test_import_jsonl(self):
+		path = self.write('books.jsonl', '\n'.join(json.dumps(row) for row in [
+			{ 'title' : 'Earthsea', 'isbn' : '9780553383041', 'author_first_name' : 'Ursula',
+				'author_last_name' : 'Le Guin', 'genres' : ['Fantasy'], 'copies' : 2, 'status' : 'm' },
+			{ 'title' : 'Anonymous', 'isbn' : '9780000000001' },
+		]))
+		call_command('import_catalog', path, stdout=StringIO())
+
+		self.assertEqual(Book.objects.count(), 2)
+		self.assertIsNone(Book.objects.get(isbn='9780000000001').author)
+		self.assertEqual(CopyCount.objects.counts(), { 'm' : 2 })
+
+	def test_rerun_skips_existing_books(self):
+		path = self.write('books.jsonl', json.dumps({ 'title' : 'Earthsea', 'isbn' : '9780553383041', 'copies' : 1 }))
+		call_command('import_catalog', path, stdout=StringIO())
+		call_command('import_catalog', path, stdout=StringIO())
+
+		self.assertEqual(Book.objects.count(), 1)
+		self.assertEqual(BookInstance.objects.count(), 1)
+
+	def test_resume_after_failure(self):
+		path = self.write('books.jsonl', '\n'.join([
+			json.dumps({ 'title' : 'Earthsea', 'isbn' : '9780553383041' }),
+			json.dumps({ 'title' : 'Broken', 'isbn' : '9780000000001', 'status' : 'x' }),
+		]))
+
+		with self.assertRaises(CommandError):
+			call_command('import_catalog', path, '--batch-size', '1', stdout=StringIO())
+
+		# first batch committed and checkpointed, the failed one rolled back
+		self.assertEqual(Path(path + '.progress').read_text(), '1')
+		self.assertEqual(list(Book.objects.values_list('isbn', flat=True)), ['9780553383041'])
+
+		Path(path).write_text('\n'.join([
+			json.dumps({ 'title' : 'Earthsea', 'isbn' : '9780553383041' }),
+			json.dumps({ 'title' : 'Fixed', 'isbn' : '9780000000001' }),
+		]))
+		out = StringIO()
+		call_command('import_catalog', path, '--resume', stdout=out)
+
+		self.assertIn('Resuming after row 1', out.getvalue())
+		self.assertEqual(Book.objects.count(), 2)
+
+	def test_invalid_copy_count(self):
+		for copies in ('three', '-1', '2.5'):
+			with self.subTest(copies=copies):
+				path = self.write('books.csv', (
+					'title,isbn,copies\n'
+					'Earthsea,9780553383041,1\n'
+					f'Lathe,9780060512750,{copies}\n'
+				))
+
+				with self.assertRaisesMessage(CommandError, f"Row 2: invalid number of copies '{copies}' for ISBN 9780060512750"):
+					call_command('import_catalog', path, stdout=StringIO())
+				self.assertFalse(Book.objects.exists())
+
+class ExportCatalogCommandTest(TestCase):
+	def test_export_round_trips_through_import(self):
+		Book.objects.create(title='Earthsea', isbn='9780553383041', summary='Mages')
+
+		with tempfile.TemporaryDirectory() as directory:
+			path = str(Path(directory) / 'books.csv')
+			call_command('export_catalog', 'books', '--output', path)
+
+			Book.objects.all().delete()
+			call_command('import_catalog', path, stdout=StringIO())
+
+		self.assertEqual(list(Book.objects.values_list('title', 'isbn')), [('Earthsea', '9780553383041')])
+
+	def test_export_to_stdout(self):
+		out = StringIO()
+		call_command('export_catalog', 'copies', '--format', 'jsonl', stdout=out)
+		self.assertEqual(out.getvalue(), '')
+
+class SeedCatalogCommandTest(TestCase):
+	def test_seed(self):
+		call_command('seed_catalog', '--books', '30', '--copies-per-book', '2', '--users', '5', '--batch-size', '7', stdout=StringIO())
+
+		self.assertEqual(Book.objects.count(), 30)
+		self.assertEqual(Author.objects.count(), 3)
+		self.assertEqual(BookInstance.objects.count(), 60)
+		self.assertEqual(get_user_model().objects.count(), 5)
+		self.assertFalse(Book.objects.filter(genre=None).exists())
+		self.assertFalse(BookInstance.objects.filter(status__exact='o', borrower=None).exists())
+		self.assertEqual(CopyCount.objects.expected(), CopyCount.objects.actual())
+
+	def test_seed_again_adds_more(self):
+		call_command('seed_catalog', '--books', '5', '--users', '2', stdout=StringIO())
+		call_command('seed_catalog', '--books', '5', '--users', '2', stdout=StringIO())
+
+		self.assertEqual(Book.objects.count(), 10)
+		self.assertEqual(get_user_model().objects.count(), 4)
+		self.assertEqual(Genre.objects.count(), len(GENRES))
+
+class SendOverdueRemindersCommandTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		today = datetime.date.today()
+		book = Book.objects.create(title='Earthsea', summary='Mages', isbn='9780553383041')
+		cls.patrons = [
+			get_user_model().objects.create_user(username=f'patron{number}', email=f'patron{number}@example.com')
+			for number in range(3)
+		]
+		no_email = get_user_model().objects.create_user(username='no_email')
+
+		cls.overdue = []
+		for borrower, days in ((cls.patrons[0], 1), (cls.patrons[0], 5), (cls.patrons[1], 2), (no_email, 3)):
+			cls.overdue.append(BookInstance.objects.create(
+				book=book, imprint='Imprint', status='o', borrower=borrower, due_back=today - datetime.timedelta(days=days)
+			))
+		BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=cls.patrons[2], due_back=today)
+
+	def send(self, *args):
+		stdout = StringIO()
+		call_command('send_overdue_reminders', '--batch-size', '1', *args, stdout=stdout)
+		return stdout.getvalue()
+
+	def test_one_email_per_borrower_over_one_connection(self):
+		with mock.patch(
+			'catalog.management.commands.send_overdue_reminders.get_connection', wraps=mail.get_connection
+		) as get_connection:
+			output = self.send()
+
+		# two batches of one borrower
+		self.assertIn('Reminded 2 borrower(s) of 3 overdue loan(s).', output)
+		self.assertEqual(get_connection.call_count, 1)
+		self.assertEqual([message.to for message in mail.outbox], [['patron0@example.com'], ['patron1@example.com']])
+		self.assertEqual(mail.outbox[0].body.count('Earthsea'), 2)
+		self.assertEqual(OverdueReminder.objects.count(), 3)
+
+	def test_rerun_sends_nothing_again(self):
+		self.send()
+		mail.outbox.clear()
+
+		self.assertIn('Reminded 0 borrower(s)', self.send())
+		self.assertEqual(mail.outbox, [])
+
+	def test_renewed_loan_overdue_again_is_reminded(self):
+		self.send()
+		mail.outbox.clear()
+
+		BookInstance.objects.filter(pk=self.overdue[0].pk).update(due_back=datetime.date.today() - datetime.timedelta(days=10))
+		self.send()
+
+		self.assertEqual([message.to for message in mail.outbox], [['patron0@example.com']])
+
+	def test_dry_run(self):
+		self.assertIn('Would remind 2 borrower(s) of 3 overdue loan(s).', self.send('--dry-run'))
+		self.assertEqual(mail.outbox, [])
+		self.assertFalse(OverdueReminder.objects.exists())
+
+class ArchiveLoanEventsCommandTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		book = Book.objects.create(title='Earthsea', summary='Mages', isbn='9780553383041')
+		cls.copy = BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+		now = timezone.now()
+
+		LoanEvent.objects.bulk_create(
+			LoanEvent(action='c', copy=cls.copy, book=book, created=now - datetime.timedelta(days=days))
+			for days in (500, 450, 400, 60, 0)
+		)
+
+	def archive(self, *args):
+		stdout = StringIO()
+		call_command('archive_loan_events', '--batch-size', '2', *args, stdout=stdout)
+		return stdout.getvalue()
+
+	def test_moves_old_events_in_batches(self):
+		ids = list(LoanEvent.objects.order_by('created').values_list('id', flat=True))
+
+		self.assertIn('Archived 3 loan event(s)', self.archive())
+		self.assertEqual(list(LoanEventArchive.objects.order_by('created').values_list('id', flat=True)), ids[:3])
+		self.assertEqual(list(LoanEvent.objects.order_by('created').values_list('id', flat=True)), ids[3:])
+
+		self.assertIn('Archived 0 loan event(s)', self.archive())
+
+	def test_batch_costs_a_fixed_number_of_statements(self):
+		old = timezone.now() - datetime.timedelta(days=400)
+		LoanEvent.objects.bulk_create(LoanEvent(action='r', copy=self.copy, created=old) for _ in range(100))
+
+		# one batch of 103: a select, one INSERT and one DELETE, then the select finding
+		# nothing left; each batch runs in a savepoint inside the test
+		with self.assertNumQueries(5 + 3):
+			self.archive('--batch-size', '5000')
+		self.assertEqual(LoanEventArchive.objects.count(), 103)
+
+	def test_months(self):
+		self.assertIn('Archived 4 loan event(s)', self.archive('--months', '1'))
+		self.assertEqual(LoanEvent.objects.count(), 1)
+
+	def test_dry_run(self):
+		self.assertIn('Would archive 3 loan event(s)', self.archive('--dry-run'))
+		self.assertFalse(LoanEventArchive.objects.exists())
+
+	def test_invalid_batch_size(self):
+		with self.assertRaises(CommandError):
+			call_command('archive_loan_events', '--batch-size', '0', stdout=StringIO())
+
+class BenchmarkCatalogCommandTest(TestCase):
+	def test_benchmark_writes_results(self):
+		call_command('seed_catalog', '--books', '10', '--users', '2', stdout=StringIO())
+
+		with tempfile.TemporaryDirectory() as directory:
+			path = str(Path(directory) / 'results.json')
+			call_command(
+				'benchmark_catalog', '--requests', '3', '--warmup', '0',
+				'--url', 'books', '--url', 'book_detail', '--output', path, '--label', '10',
+				stdout=StringIO()
+			)
+			results = json.loads(Path(path).read_text())
+
+		self.assertEqual(results['label'], '10')
+		self.assertEqual(results['dataset']['books'], 10)
+		self.assertEqual([entry['name'] for entry in results['results']], ['books', 'book_detail'])
+		for entry in results['results']:
+			self.assertEqual(entry['status'], 200)
+			self.assertEqual(entry['requests'], 3)
+			self.assertLessEqual(entry['p50_ms'], entry['p99_ms'])
+			self.assertGreater(entry['queries_per_request'], 0)
+
+	def test_template_benchmark_times_both_variants(self):
+		call_command('seed_catalog', '--books', '12', '--users', '2', stdout=StringIO())
+
+		with tempfile.TemporaryDirectory() as directory:
+			path = str(Path(directory) / 'templates.json')
+			call_command(
+				'benchmark_templates', '--requests', '2', '--warmup', '0',
+				'--url', 'books', '--url', 'api_book_list', '--output', path,
+				stdout=StringIO()
+			)
+			results = json.loads(Path(path).read_text())
+
+		# JSON responses render no template
+		self.assertEqual(
+			[(entry['name'], entry['variant']) for entry in results['results']],
+			[('books', 'before'), ('books', 'after')]
+		)
+		self.assertEqual(results['results'][0]['requests'], 2)
+
+	def test_percentile(self):
+		samples = list(range(1, 101))
+		self.assertEqual(percentile(samples, 50), 50)
+		self.assertEqual(percentile(samples, 99), 99)
+		self.assertEqual(percentile([7], 95), 7)
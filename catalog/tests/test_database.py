@@ -0,0 +1,59 @@
+import importlib.util
+import os
+import subprocess
+import sys
+
+import django
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+class SqliteTuningTest(TestCase):
+	def pragma(self, name):
+		with connection.cursor() as cursor:
+			cursor.execute(f'PRAGMA {name}')
+			return cursor.fetchone()[0]
+
+	def test_pragmas_applied_on_connect(self):
+		if connection.vendor != 'sqlite':
+			self.skipTest('SQLite only')
+
+		connection.close()
+		connection.ensure_connection()
+
+		synchronous = { 'OFF' : 0, 'NORMAL' : 1, 'FULL' : 2, 'EXTRA' : 3 }
+		self.assertEqual(self.pragma('synchronous'), synchronous[settings.SQLITE_PRAGMAS['synchronous']])
+		if 'busy_timeout' in settings.SQLITE_PRAGMAS:
+			self.assertEqual(self.pragma('busy_timeout'), settings.SQLITE_PRAGMAS['busy_timeout'])
+
+class SqliteTransactionModeTest(TransactionTestCase):
+	def test_transactions_take_the_write_lock_up_front(self):
+		if connection.vendor != 'sqlite' or settings.DATABASE_PROFILE != 'tuned':
+			self.skipTest('tuned SQLite profile only')
+
+		with CaptureQueriesContext(connection) as queries:
+			with transaction.atomic():
+				pass
+
+		self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+class PoolSettingsTest(SimpleTestCase):
+	def load_settings(self, **env):
+		return subprocess.run(
+			[sys.executable, '-c', 'import liib1.settings'],
+			cwd=settings.BASE_DIR,
+			capture_output=True,
+			text=True,
+			env={ **os.environ, 'DATABASE_URL' : 'postgres://library@localhost/library', **env },
+		)
+
+	def test_pool_refused_without_django_pool_support(self):
+		if django.VERSION >= (5, 1) and importlib.util.find_spec('psycopg'):
+			self.skipTest('Django pool supported here')
+
+		result = self.load_settings(DJANGO_DB_POOL_MAX_SIZE='10')
+		self.assertNotEqual(result.returncode, 0)
+		self.assertIn('ImproperlyConfigured', result.stderr)
+
+		self.assertEqual(self.load_settings(DJANGO_DB_PGBOUNCER='True').returncode, 0)
@@ -0,0 +1,93 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog.middleware import STAFF_COOKIE, QueryRecorder
+from catalog.models import Author
+
+User = get_user_model()
+
+@override_settings(CATALOG_SQL_SAMPLE_RATE=0, CATALOG_SLOW_REQUEST_MS=60000, CATALOG_DUPLICATE_QUERY_THRESHOLD=3)
+class QueryInstrumentationMiddlewareTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		User.objects.create_user(username='staff', password='1X<ISRUkw+tuK', is_staff=True)
+		User.objects.create_user(username='patron', password='2HJ1vRV0Z&3iD')
+
+	def setUp(self):
+		cache.clear()
+
+	def test_server_timing_for_staff(self):
+		self.client.login(username='staff', password='1X<ISRUkw+tuK')
+		# the first page that loads the user marks the session as staff
+		response = self.client.get(reverse('index'))
+		self.assertIn(STAFF_COOKIE, response.cookies)
+
+		response = self.client.get(reverse('index'))
+		self.assertIn('db;dur=', response['Server-Timing'])
+		self.assertIn('queries"', response['Server-Timing'])
+
+	def test_staff_cookie_only_matches_its_session(self):
+		self.client.login(username='staff', password='1X<ISRUkw+tuK')
+		staff_cookie = self.client.get(reverse('index')).cookies[STAFF_COOKIE].value
+		self.client.logout()
+
+		self.client.login(username='patron', password='2HJ1vRV0Z&3iD')
+		self.client.cookies[STAFF_COOKIE] = staff_cookie
+		response = self.client.get(reverse('index'))
+
+		self.assertFalse(response.has_header('Server-Timing'))
+		self.assertEqual(response.cookies[STAFF_COOKIE].value, '')
+
+	def test_unsampled_requests_do_not_load_the_user(self):
+		self.client.get(reverse('api_book_list'))
+		with self.assertNumQueries(1):
+			self.client.get(reverse('api_book_list'))
+
+		self.client.login(username='staff', password='1X<ISRUkw+tuK')
+		self.client.get(reverse('api_book_list'))
+		with self.assertNumQueries(1):
+			self.client.get(reverse('api_book_list'))
+
+	def test_no_server_timing_for_other_users(self):
+		self.client.login(username='patron', password='2HJ1vRV0Z&3iD')
+
+		with override_settings(CATALOG_SQL_SAMPLE_RATE=1):
+			response = self.client.get(reverse('index'))
+
+		self.assertFalse(response.has_header('Server-Timing'))
+
+	@override_settings(CATALOG_SLOW_REQUEST_MS=0, CATALOG_SQL_SAMPLE_RATE=1)
+	def test_slow_request_logged_with_query_stats(self):
+		with self.assertLogs('catalog.sql', level='WARNING') as logs:
+			self.client.get(reverse('index'))
+
+		message = next(line for line in logs.output if 'Slow request' in line)
+		record = json.loads(message.split('Slow request ', 1)[1])
+		self.assertEqual(record['path'], reverse('index'))
+		self.assertEqual(record['status'], 200)
+		self.assertGreater(record['queries'], 0)
+
+	@override_settings(CATALOG_SLOW_REQUEST_MS=0)
+	def test_unsampled_slow_request_logged_without_query_stats(self):
+		with self.assertLogs('catalog.sql', level='WARNING') as logs:
+			self.client.get(reverse('index'))
+
+		self.assertNotIn('"queries"', logs.output[0])
+
+	def test_recorder_flags_repeated_sql(self):
+		recorder = QueryRecorder()
+		with recorder.record():
+			for pk in range(3):
+				list(Author.objects.filter(pk=pk))
+			Author.objects.count()
+
+		self.assertEqual(recorder.count, 4)
+		duplicates = recorder.duplicates(3)
+		self.assertEqual(len(duplicates), 1)
+		self.assertEqual(duplicates[0][0], connection.alias)
+		self.assertEqual(duplicates[0][2], 3)
@@ -1,6 +1,12 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.test import TestCase
 
-from catalog.models import Author
+from catalog.models import Author, Book, BookInstance, BookInstanceQuerySet, CopyCount
 
 class TestClassI(TestCase):
 	@classmethod
@@ -78,3 +84,85 @@ class AuthorModelTest(TestCase):
 		# note : will also fail with undefined URLConf
 		# for id=1
 		self.assertEqual(author.get_absolute_url(), '/catalog/authors/1')
+
+class CopyCountTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.book = Book.objects.create(title='Counted', summary='Summary', isbn='1234567890123')
+		cls.other_book = Book.objects.create(title='Other', summary='Summary', isbn='1234567890124')
+
+		for status in ('a', 'a', 'o'):
+			BookInstance.objects.create(book=cls.book, imprint='Imprint', status=status)
+		BookInstance.objects.create(book=cls.other_book, imprint='Imprint', status='m')
+
+	def test_counts_on_create(self):
+		self.assertEqual(CopyCount.objects.counts(book=self.book), { 'a' : 2, 'o' : 1 })
+		self.assertEqual(CopyCount.objects.counts(), { 'a' : 2, 'o' : 1, 'm' : 1 })
+
+	def test_counts_on_status_change(self):
+		copy = BookInstance.objects.filter(book=self.book, status='o').get()
+		copy.status = 'a'
+		copy.save()
+
+		self.assertEqual(CopyCount.objects.counts(book=self.book), { 'a' : 3, 'o' : 0 })
+
+	def test_counts_on_delete(self):
+		BookInstance.objects.filter(book=self.other_book).delete()
+
+		self.assertEqual(CopyCount.objects.counts(book=self.other_book), { 'm' : 0 })
+		self.assertEqual(CopyCount.objects.counts()['m'], 0)
+
+	def test_counts_on_bulk_update(self):
+		BookInstance.objects.filter(status='a').update(status='m')
+
+		self.assertEqual(CopyCount.objects.counts(book=self.book), { 'a' : 0, 'o' : 1, 'm' : 2 })
+		self.assertEqual(CopyCount.objects.counts(), { 'a' : 0, 'o' : 1, 'm' : 3 })
+
+	def test_bulk_update_only_changes_the_counted_copies(self):
+		# pretend the database locks rows (SQLite can't), then let a copy appear after the count
+		lock_and_count = BookInstanceQuerySet._lock_and_count
+
+		def count_then_insert(queryset):
+			counted = lock_and_count(queryset)
+			BookInstance.objects.create(book=self.book, imprint='Late', status='a')
+			return counted
+
+		with mock.patch.object(connection.features, 'has_select_for_update', True), \
+				mock.patch.object(connection.ops, 'for_update_sql', return_value=''), \
+				mock.patch.object(BookInstanceQuerySet, '_lock_and_count', count_then_insert):
+			rows = BookInstance.objects.filter(status='a').update(status='m')
+
+		self.assertEqual(rows, 2)
+		self.assertEqual(BookInstance.objects.get(imprint='Late').status, 'a')
+		self.assertEqual(CopyCount.objects.expected(), CopyCount.objects.actual())
+		self.assertEqual(CopyCount.objects.counts(book=self.book), { 'a' : 1, 'o' : 1, 'm' : 2 })
+
+	def test_counts_on_bulk_create(self):
+		BookInstance.objects.bulk_create([
+			BookInstance(book=self.other_book, imprint='Imprint', status='a') for _ in range(5)
+		])
+
+		self.assertEqual(CopyCount.objects.counts(book=self.other_book), { 'a' : 5, 'm' : 1 })
+
+	def test_counts_on_large_bulk_create(self):
+		books = Book.objects.bulk_create([
+			Book(title=f'Bulk {number}', summary='Summary', isbn=f'{number:013d}') for number in range(20)
+		])
+		BookInstance.objects.bulk_create([
+			BookInstance(book=book, imprint='Imprint', status=status)
+			for book in books + [self.book]
+			for status in ('a', 'a', 'r')
+		])
+
+		# set-based path: existing counters updated, missing ones created
+		self.assertEqual(CopyCount.objects.expected(), CopyCount.objects.actual())
+		self.assertEqual(CopyCount.objects.counts(book=self.book), { 'a' : 4, 'o' : 1, 'r' : 1 })
+
+	def test_rebuild_command_repairs_drift(self):
+		CopyCount.objects.filter(book=self.book, status='a').update(count=42)
+
+		with self.assertRaises(CommandError):
+			call_command('rebuild_copy_counts', '--check', stdout=StringIO(), stderr=StringIO())
+
+		call_command('rebuild_copy_counts', stdout=StringIO())
+		self.assertEqual(CopyCount.objects.counts(book=self.book), { 'a' : 2, 'o' : 1 })
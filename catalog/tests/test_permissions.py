@@ -0,0 +1,101 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+User = get_user_model()
+
+class CachedPermissionsTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.add_book = Permission.objects.get(codename='add_book')
+		cls.add_author = Permission.objects.get(codename='add_author')
+		cls.user = User.objects.create_user(username='librarian', password='1X<ISRUkw+tuK')
+		cls.librarians = Group.objects.create(name='Librarians')
+
+	def setUp(self):
+		cache.clear()
+
+	def permissions(self):
+		# a fresh user object, like the one each request loads
+		return User.objects.get(pk=self.user.pk).get_all_permissions()
+
+	def test_permissions_are_loaded_once(self):
+		self.user.user_permissions.add(self.add_book)
+		self.assertEqual(self.permissions(), { 'catalog.add_book' })
+
+		user = User.objects.get(pk=self.user.pk)
+		with self.assertNumQueries(0):
+			self.assertTrue(user.has_perm('catalog.add_book'))
+			self.assertFalse(user.has_perm('catalog.add_author'))
+
+	def test_pages_skip_the_permission_queries(self):
+		self.user.user_permissions.add(self.add_book)
+		self.client.force_login(self.user)
+		self.client.get(reverse('index'))
+
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(reverse('books'))
+
+		self.assertContains(response, reverse('book_create'))
+		self.assertFalse([query for query in queries if 'auth_permission' in query['sql']])
+
+	def test_user_permission_changes_invalidate(self):
+		self.permissions()
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.user.user_permissions.add(self.add_book)
+		self.assertEqual(self.permissions(), { 'catalog.add_book' })
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.add_book.user_set.remove(self.user)
+		self.assertEqual(self.permissions(), set())
+
+	def test_group_changes_invalidate(self):
+		self.permissions()
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.user.groups.add(self.librarians)
+			self.librarians.permissions.add(self.add_author)
+		self.assertEqual(self.permissions(), { 'catalog.add_author' })
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.librarians.permissions.clear()
+		self.assertEqual(self.permissions(), set())
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.librarians.permissions.add(self.add_book)
+			self.librarians.user_set.clear()
+		self.assertEqual(self.permissions(), set())
+
+	def test_deleting_a_group_invalidates(self):
+		self.user.groups.add(self.librarians)
+		self.librarians.permissions.add(self.add_author)
+		self.assertEqual(self.permissions(), { 'catalog.add_author' })
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.librarians.delete()
+		self.assertEqual(self.permissions(), set())
+
+	def test_superuser_and_active_flags_invalidate(self):
+		self.permissions()
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.user.is_superuser = True
+			self.user.save()
+		self.assertIn('catalog.add_book', self.permissions())
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.user.is_active = False
+			self.user.save()
+		self.assertFalse(User.objects.get(pk=self.user.pk).has_perm('catalog.add_book'))
+
+	def test_login_keeps_the_cached_permissions(self):
+		self.permissions()
+
+		with self.captureOnCommitCallbacks(execute=True) as callbacks:
+			self.client.login(username='librarian', password='1X<ISRUkw+tuK')
+		self.assertEqual(callbacks, [])
@@ -0,0 +1,171 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+
+from catalog import routers
+from catalog.middleware import PIN_COOKIE, ReplicaPinningMiddleware
+from catalog.models import Author, Book
+
+User = get_user_model()
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class PrimaryReplicaRouterTest(TransactionTestCase):
+	def setUp(self):
+		self.router = routers.PrimaryReplicaRouter()
+
+	def test_catalog_reads_go_to_a_replica(self):
+		self.assertEqual(self.router.db_for_read(Book), 'replica')
+
+	def test_other_apps_read_from_the_primary(self):
+		self.assertEqual(self.router.db_for_read(User), 'default')
+
+	@override_settings(DATABASE_REPLICAS=[])
+	def test_no_replicas(self):
+		self.assertEqual(self.router.db_for_read(Book), 'default')
+
+	def test_reads_in_a_transaction_stay_on_the_primary(self):
+		with transaction.atomic():
+			self.assertEqual(self.router.db_for_read(Book), 'default')
+
+	def test_writes_go_to_the_primary(self):
+		self.assertEqual(self.router.db_for_write(Book), 'default')
+		self.assertTrue(self.router.allow_migrate('default', 'catalog'))
+		self.assertFalse(self.router.allow_migrate('replica', 'catalog'))
+
+	def test_reads_after_a_catalog_write_stay_on_the_primary(self):
+		token = routers.start_request(pinned=False)
+		try:
+			self.router.db_for_write(User)
+			self.assertEqual(self.router.db_for_read(Author), 'replica')
+
+			self.router.db_for_write(Book)
+			self.assertEqual(self.router.db_for_read(Author), 'default')
+		finally:
+			self.assertTrue(routers.end_request(token))
+
+	def test_use_primary(self):
+		with routers.use_primary():
+			self.assertEqual(self.router.db_for_read(Book), 'default')
+		self.assertEqual(self.router.db_for_read(Book), 'replica')
+
+		token = routers.start_request(pinned=False)
+		try:
+			with routers.use_primary():
+				self.assertEqual(self.router.db_for_read(Book), 'default')
+			self.assertEqual(self.router.db_for_read(Book), 'replica')
+		finally:
+			routers.end_request(token)
+
+@override_settings(DATABASE_REPLICAS=['replica'], DATABASE_REPLICA_PIN_SECONDS=30)
+class ReplicaPinningMiddlewareTest(SimpleTestCase):
+	def setUp(self):
+		self.factory = RequestFactory()
+		self.router = routers.PrimaryReplicaRouter()
+		self.routed = []
+
+	def view(self, write=False):
+		def get_response(request):
+			if write:
+				self.router.db_for_write(Book)
+			self.routed.append(self.router.db_for_read(Book))
+			return HttpResponse()
+		return ReplicaPinningMiddleware(get_response)
+
+	def test_reads_without_writes_are_not_pinned(self):
+		response = self.view()(self.factory.get('/'))
+
+		self.assertEqual(self.routed, ['replica'])
+		self.assertNotIn(PIN_COOKIE, response.cookies)
+
+	def test_write_sets_the_pin_cookie(self):
+		response = self.view(write=True)(self.factory.get('/'))
+
+		self.assertEqual(self.routed, ['default'])
+		until = int(response.cookies[PIN_COOKIE].value)
+		self.assertAlmostEqual(until, time.time() + 30, delta=2)
+
+	def test_pin_cookie_keeps_reads_on_the_primary(self):
+		request = self.factory.get('/')
+		request.COOKIES[PIN_COOKIE] = str(int(time.time() + 30))
+		self.view()(request)
+
+		request = self.factory.get('/')
+		request.COOKIES[PIN_COOKIE] = str(int(time.time() - 1))
+		self.view()(request)
+
+		self.assertEqual(self.routed, ['default', 'replica'])
+
+	def test_unsafe_methods_read_from_the_primary(self):
+		self.view()(self.factory.post('/'))
+
+		self.assertEqual(self.routed, ['default'])
+
+	@override_settings(DATABASE_REPLICAS=[])
+	def test_no_replicas(self):
+		response = self.view(write=True)(self.factory.get('/'))
+
+		self.assertNotIn(PIN_COOKIE, response.cookies)
+
+# Run in a separate process against two real SQLite files, the test databases mirror the replica
+REPLICA_SCRIPT = '''
+import json
+from django.test import Client
+from django.urls import reverse
+from catalog.models import Author
+from catalog.routers import use_primary
+
+author = Author.objects.create(first_name='Only', last_name='OnPrimary')
+result = { 'replica' : Author.objects.filter(last_name='OnPrimary').count() }
+with use_primary():
+	result['primary'] = Author.objects.filter(last_name='OnPrimary').count()
+
+client = Client(SERVER_NAME='127.0.0.1')
+result['list_from_replica'] = b'OnPrimary' in client.get(reverse('authors')).content
+result['detail_status'] = client.get(reverse('author_detail', args=[author.pk])).status_code
+print(json.dumps(result))
+'''
+
+class TwoFileReplicaTest(SimpleTestCase):
+	def manage(self, *args, **env):
+		environ = { key : value for key, value in os.environ.items() if not key.startswith(('DATABASE_', 'DJANGO_')) }
+		return subprocess.run(
+			[sys.executable, 'manage.py', *args],
+			cwd=settings.BASE_DIR,
+			capture_output=True,
+			text=True,
+			check=True,
+			env={ **environ, **env },
+		)
+
+	def test_reads_from_the_replica_file(self):
+		with tempfile.TemporaryDirectory() as directory:
+			primary, replica = Path(directory) / 'primary.sqlite3', Path(directory) / 'replica.sqlite3'
+			self.manage('migrate', '--verbosity', '0', DATABASE_URL=f'sqlite:///{primary}')
+
+			# the copy step documented next to DATABASE_REPLICA_URL in the settings
+			with sqlite3.connect(primary) as source, sqlite3.connect(replica) as target:
+				source.backup(target)
+
+			output = self.manage(
+				'shell', '-c', REPLICA_SCRIPT,
+				DATABASE_URL=f'sqlite:///{primary}',
+				DATABASE_REPLICA_URL=f'sqlite:///{replica}',
+			).stdout
+			result = json.loads(output.strip().splitlines()[-1])
+
+		self.assertEqual(result['replica'], 0)
+		self.assertEqual(result['primary'], 1)
+		self.assertFalse(result['list_from_replica'])
+		# cached pages are always read from the primary
+		self.assertEqual(result['detail_status'], 200)
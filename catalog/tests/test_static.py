@@ -0,0 +1,69 @@
+import gzip
+import importlib.util
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog.models import Book
+
+BOOTSTRAP_CSS = 'vendor/bootstrap-5.3.3/css/bootstrap.min.css'
+
+class SelfHostedStaticTest(TestCase):
+	def test_pages_do_not_load_from_a_cdn(self):
+		response = self.client.get(reverse('books'))
+
+		self.assertContains(response, f'/static/{BOOTSTRAP_CSS}')
+		self.assertContains(response, '/static/css/styles.css')
+		self.assertNotContains(response, 'cdn.jsdelivr.net')
+
+	def test_collected_files_are_fingerprinted_precompressed_and_immutable(self):
+		with tempfile.TemporaryDirectory() as directory, override_settings(
+			STATIC_ROOT=directory,
+			STORAGES={ 'staticfiles' : { 'BACKEND' : 'whitenoise.storage.CompressedManifestStaticFilesStorage' } },
+		):
+			call_command('collectstatic', interactive=False, verbosity=0, stdout=StringIO())
+
+			url = staticfiles_storage.url(BOOTSTRAP_CSS)
+			self.assertRegex(url, r'/bootstrap\.min\.[0-9a-f]{12}\.css$')
+
+			collected = Path(directory) / url.removeprefix('/static/')
+			self.assertTrue(collected.with_name(collected.name + '.gz').exists())
+			if importlib.util.find_spec('brotli'):
+				self.assertTrue(collected.with_name(collected.name + '.br').exists())
+
+			# a new client loads WhiteNoise again, which scans the collected files
+			response = self.client_class().get(url, HTTP_ACCEPT_ENCODING='gzip')
+			self.assertEqual(response.status_code, 200)
+			self.assertEqual(response['Content-Encoding'], 'gzip')
+			self.assertIn('immutable', response['Cache-Control'])
+			self.assertIn('Bootstrap', gzip.decompress(b''.join(response.streaming_content)).decode())
+
+class CompressionAndConditionalGetTest(TestCase):
+	def test_pages_are_compressed(self):
+		response = self.client.get(reverse('books'), HTTP_ACCEPT_ENCODING='gzip')
+
+		self.assertEqual(response['Content-Encoding'], 'gzip')
+		self.assertIn(b'All books', gzip.decompress(response.content))
+
+	def test_unchanged_page_gets_not_modified(self):
+		response = self.client.get(reverse('books'), HTTP_ACCEPT_ENCODING='gzip')
+
+		response = self.client.get(reverse('books'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response.content, b'')
+
+	def test_api_keeps_strong_etags(self):
+		# long enough to be worth compressing
+		Book.objects.bulk_create(Book(title=f'Book {number}', summary='', isbn=f'{number:013d}') for number in range(10))
+		response = self.client.get(reverse('api_book_list'), HTTP_ACCEPT_ENCODING='gzip')
+
+		self.assertFalse(response.has_header('Content-Encoding'))
+		self.assertRegex(response['ETag'], r'^"[0-9a-f]+"$')
+
+		response = self.client.get(reverse('api_book_list'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+		self.assertEqual(response.status_code, 304)
@@ -1,9 +1,19 @@
 
 import datetime
+import json
+import os
+import subprocess
+import sys
 import uuid
 import random
+import tempfile
+from unittest import mock
+from urllib.parse import urlencode
 
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
@@ -11,10 +21,90 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission # Required to grant permission to set book returned
 
 from django.contrib.contenttypes.models import ContentType
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.utils import make_template_fragment_key
 
-from catalog.models import Author, BookInstance, Book, Genre, Language
+from catalog import circulation
+from catalog.context_processors import permission_set_key
+from catalog.models import Author, BookInstance, Book, Genre, Language, LoanEvent
+from catalog.pagination import paginate_by_cursor
+from catalog.search import SEARCH_BACKENDS
+from catalog.versioning import object_version_key
+from catalog.visits import VISITS_COOKIE
+from catalog.stats import catalog_count_querysets, compute_catalog_stats, get_catalog_stats
+from catalog.views import all_loans
 User = get_user_model()
 
+class IndexViewTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		test_author = Author.objects.create(first_name='Dominique', last_name='Rousseau')
+		Genre.objects.create(name='Fantasy')
+		test_book = Book.objects.create(title='Topaz', summary='Summary', isbn='ABCDEFG', author=test_author)
+
+		for status in ('a', 'a', 'o', 'm'):
+			BookInstance.objects.create(book=test_book, imprint='Imprint', status=status)
+
+	def setUp(self):
+		# snapshot is shared through the cache, start every test without one
+		cache.clear()
+
+	def test_view_url_accessible_by_name(self):
+		response = self.client.get(reverse('index'))
+		self.assertEqual(response.status_code, 200)
+		self.assertTemplateUsed(response, 'index.html')
+
+	def test_counts_in_context(self):
+		response = self.client.get(reverse('index'))
+		self.assertEqual(response.context['num_books'], 1)
+		self.assertEqual(response.context['num_authors'], 1)
+		self.assertEqual(response.context['num_instances'], 4)
+		self.assertEqual(response.context['num_instances_available'], 2)
+		self.assertEqual(response.context['num_genre_fantasy'], 1)
+		self.assertEqual(response.context['num_book_topaz'], 1)
+
+	def test_visits_counted_without_session(self):
+		for expected in (1, 2, 3):
+			response = self.client.get(reverse('index'))
+			self.assertEqual(response.context['num_visits'], expected)
+
+		# the counter lives in a signed cookie, no session is created or saved
+		self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+		self.assertIn(VISITS_COOKIE, response.cookies)
+
+	def test_tampered_visit_cookie_restarts_count(self):
+		self.client.cookies[VISITS_COOKIE] = '41'
+		response = self.client.get(reverse('index'))
+		self.assertEqual(response.context['num_visits'], 1)
+
+	def test_stats_computed_in_two_queries(self):
+		# one for the record counts, one for the copy counters
+		with self.assertNumQueries(2):
+			compute_catalog_stats()
+
+	def test_stats_served_from_cache(self):
+		get_catalog_stats()
+		with self.assertNumQueries(0):
+			get_catalog_stats()
+
+	def test_stats_refreshed_on_change(self):
+		self.assertEqual(get_catalog_stats()['num_authors'], 1)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			Author.objects.create(first_name='Big', last_name='Bob')
+
+		self.assertEqual(get_catalog_stats()['num_authors'], 2)
+
+	def test_unrelated_models_still_fast_delete(self):
+		LoanEvent.objects.create(action='c', copy=BookInstance.objects.first())
+
+		# the stats and version receivers listen to their own models only
+		with self.assertNumQueries(1):
+			LoanEvent.objects.filter(action='c').delete()
+		self.assertFalse(LoanEvent.objects.exists())
+
 class AuthorListViewTest(TestCase):
 	@classmethod
 	def setUpTestData(cls):
@@ -58,6 +148,442 @@ class AuthorListViewTest(TestCase):
 		self.assertTrue(response.context['is_paginated'] == True)
 		self.assertEqual(len(response.context['author_list']), 3)
 
+	def test_cursor_pagination_walks_all_authors(self):
+		response = self.client.get(reverse('authors') + '?cursor=')
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.context['is_paginated'])
+		self.assertIsNone(response.context['paginator'])
+
+		first_page = list(response.context['author_list'])
+		self.assertEqual(first_page, list(Author.objects.all()[:10]))
+		self.assertFalse(response.context['page_obj'].has_previous())
+
+		next_cursor = response.context['page_obj'].next_cursor
+		response = self.client.get(reverse('authors'), { 'cursor' : next_cursor })
+		self.assertEqual(list(response.context['author_list']), list(Author.objects.all()[10:]))
+		self.assertFalse(response.context['page_obj'].has_next())
+
+		# and back again
+		previous_cursor = response.context['page_obj'].previous_cursor
+		response = self.client.get(reverse('authors'), { 'cursor' : previous_cursor })
+		self.assertEqual(list(response.context['author_list']), first_page)
+
+	def test_cursor_pagination_skips_count(self):
+		response = self.client.get(reverse('authors') + '?cursor=')
+		next_cursor = response.context['page_obj'].next_cursor
+
+		with self.assertNumQueries(1):
+			self.client.get(reverse('authors'), { 'cursor' : next_cursor })
+
+	def test_invalid_cursor_is_404(self):
+		response = self.client.get(reverse('authors'), { 'cursor' : 'not-a-cursor' })
+		self.assertEqual(response.status_code, 404)
+
+class BookSearchViewTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+		other_author = Author.objects.create(first_name='Dominique', last_name='Rousseau')
+
+		cls.wizard = Book.objects.create(
+			title='A Wizard of Earthsea',
+			summary='A young mage on an archipelago.',
+			isbn='9780553383041',
+			author=cls.author
+		)
+		cls.mention = Book.objects.create(
+			title='Essays',
+			summary='Mentions a wizard once.',
+			isbn='9780000000001',
+			author=other_author
+		)
+
+		# enough matches for two pages
+		for book_id in range(12):
+			Book.objects.create(
+				title=f'Dragon { book_id }',
+				summary='Dragons',
+				isbn=f'97800000001{ book_id:02d}',
+				author=other_author
+			)
+
+	def search(self, query, **params):
+		return self.client.get(reverse('book_search'), { 'q' : query, **params })
+
+	def test_view_uses_correct_template(self):
+		response = self.search('wizard')
+		self.assertEqual(response.status_code, 200)
+		self.assertTemplateUsed(response, 'catalog/book_search.html')
+
+	def test_title_match_ranks_above_summary_match(self):
+		response = self.search('wizard')
+		self.assertEqual(list(response.context['book_list']), [self.wizard, self.mention])
+
+	def test_search_by_author_and_isbn(self):
+		self.assertEqual(list(self.search('guin').context['book_list']), [self.wizard])
+		self.assertEqual(list(self.search('9780553383041').context['book_list']), [self.wizard])
+
+	def test_search_results_are_paginated(self):
+		response = self.search('dragon')
+		self.assertTrue(response.context['is_paginated'])
+		self.assertEqual(len(response.context['book_list']), 10)
+
+		response = self.search('dragon', page=2)
+		self.assertEqual(len(response.context['book_list']), 2)
+
+	def test_index_follows_author_rename_and_book_delete(self):
+		self.author.last_name = 'Leguin'
+		self.author.save()
+		self.assertEqual(list(self.search('leguin').context['book_list']), [self.wizard])
+
+		self.mention.delete()
+		self.assertEqual(list(self.search('wizard').context['book_list']), [self.wizard])
+
+	def test_fts_syntax_in_query_is_ignored(self):
+		response = self.search('earthsea")*(')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(list(response.context['book_list']), [self.wizard])
+
+	def test_fallback_on_databases_without_a_search_index(self):
+		with mock.patch.dict(SEARCH_BACKENDS, clear=True):
+			response = self.search('wizard')
+			self.assertEqual(response.status_code, 200)
+			self.assertEqual(list(response.context['book_list']), [self.wizard, self.mention])
+
+			self.assertEqual(list(self.search('ursula earthsea').context['book_list']), [self.wizard])
+			self.assertEqual(len(self.search('dragon', page=2).context['book_list']), 2)
+
+class CatalogExportViewTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		User.objects.create_user(username='staff', password='1X<ISRUkw+tuK', is_staff=True)
+		User.objects.create_user(username='patron', password='2HJ1vRV0Z&3iD')
+
+		test_author = Author.objects.create(first_name='Dominique', last_name='Rousseau')
+		test_book = Book.objects.create(title='BookTitle', summary='Summary', isbn='ABCDEFG', author=test_author)
+		test_book.genre.set([Genre.objects.create(name='Fantasy'), Genre.objects.create(name='Drama')])
+		BookInstance.objects.create(book=test_book, imprint='Imprint', status='a')
+
+	def test_redirect_if_not_staff(self):
+		self.client.login(username='patron', password='2HJ1vRV0Z&3iD')
+		response = self.client.get(reverse('catalog_export', args=['books', 'csv']))
+		self.assertEqual(response.status_code, 302)
+
+	def test_books_csv_is_streamed(self):
+		self.client.login(username='staff', password='1X<ISRUkw+tuK')
+		response = self.client.get(reverse('catalog_export', args=['books', 'csv']))
+
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.streaming)
+		self.assertEqual(response['Content-Type'], 'text/csv')
+
+		lines = b''.join(response.streaming_content).decode().splitlines()
+		self.assertEqual(lines[0], 'id,title,isbn,summary,author_id,author,language,genres')
+		self.assertIn('"Rousseau, Dominique"', lines[1])
+		self.assertTrue(lines[1].endswith('Drama;Fantasy') or lines[1].endswith('Fantasy;Drama'))
+
+	def test_copies_jsonl(self):
+		self.client.login(username='staff', password='1X<ISRUkw+tuK')
+		response = self.client.get(reverse('catalog_export', args=['copies', 'jsonl']))
+
+		rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+		self.assertEqual(len(rows), 1)
+		self.assertEqual(rows[0]['status'], 'a')
+		self.assertIsNone(rows[0]['borrower_id'])
+
+	def test_unknown_dataset_is_404(self):
+		self.client.login(username='staff', password='1X<ISRUkw+tuK')
+		response = self.client.get(reverse('catalog_export', args=['users', 'csv']))
+		self.assertEqual(response.status_code, 404)
+
+class DetailPageCacheTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.author = Author.objects.create(first_name='Dominique', last_name='Rousseau')
+		cls.book = Book.objects.create(title='BookTitle', summary='Summary', isbn='ABCDEFG', author=cls.author)
+		cls.book.genre.set([Genre.objects.create(name='Fantasy')])
+		cls.copy = BookInstance.objects.create(book=cls.book, imprint='Imprint', status='a')
+
+	def setUp(self):
+		cache.clear()
+
+	def get_book_page(self):
+		return self.client.get(reverse('book_detail', args=[self.book.pk]))
+
+	def test_cached_page_skips_content_queries(self):
+		self.get_book_page()
+
+		# object lookup only, genres, copies and counters come from the cache
+		with self.assertNumQueries(1):
+			response = self.get_book_page()
+		self.assertContains(response, 'Fantasy')
+
+	def test_copy_change_refreshes_book_and_author_pages(self):
+		self.get_book_page()
+		self.client.get(reverse('author_detail', args=[self.author.pk]))
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.copy.status = 'o'
+			self.copy.save()
+
+		self.assertContains(self.get_book_page(), 'On loan')
+		with self.assertNumQueries(1):
+			# and is cached again under the new version
+			self.get_book_page()
+
+	def test_author_rename_refreshes_book_page(self):
+		self.get_book_page()
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.author.last_name = 'Renamed'
+			self.author.save()
+
+		self.assertContains(self.get_book_page(), 'Renamed, Dominique')
+
+	def test_genre_change_refreshes_book_page(self):
+		self.get_book_page()
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.book.genre.add(Genre.objects.create(name='Drama'))
+
+		self.assertContains(self.get_book_page(), 'Drama')
+
+	def test_write_in_another_worker_invalidates_the_shared_cache(self):
+		with tempfile.TemporaryDirectory() as directory:
+			backend = { 'BACKEND' : 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION' : directory }
+			with override_settings(CACHES={ 'default' : backend }):
+				self.assertContains(self.get_book_page(), 'Fantasy')
+
+				# another process renames the genre; its signal handler bumps the tokens in its own cache client
+				Genre.objects.filter(name='Fantasy').update(name='Fable')
+				other_worker = FileBasedCache(directory, {})
+				other_worker.set(object_version_key(Book, self.book.pk), uuid.uuid4().hex, timeout=None)
+
+				self.assertContains(self.get_book_page(), 'Fable')
+
+	def test_file_and_database_cache_backends(self):
+		with tempfile.TemporaryDirectory() as directory:
+			backends = {
+				'file' : { 'BACKEND' : 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION' : directory },
+				'db' : { 'BACKEND' : 'django.core.cache.backends.db.DatabaseCache', 'LOCATION' : 'test_cache' },
+			}
+
+			for name, backend in backends.items():
+				with self.subTest(backend=name), override_settings(CACHES={ 'default' : backend }):
+					if name == 'db':
+						call_command('createcachetable', verbosity=0)
+
+					self.get_book_page()
+					with self.captureOnCommitCallbacks(execute=True):
+						self.book.genre.add(Genre.objects.create(name=f'Genre { name }'))
+					self.assertContains(self.get_book_page(), f'Genre { name }')
+
+class CacheSettingsTest(SimpleTestCase):
+	def load_settings(self, **env):
+		return subprocess.run(
+			[sys.executable, '-c', 'from liib1 import settings; print(settings.CACHES["default"]["BACKEND"])'],
+			cwd=settings.BASE_DIR,
+			capture_output=True,
+			text=True,
+			env={ **{ key : value for key, value in os.environ.items() if key not in ('DJANGO_CACHE', 'WEB_CONCURRENCY') }, **env },
+		)
+
+	def test_production_defaults_to_a_shared_cache(self):
+		result = self.load_settings(DJANGO_DEBUG='False')
+		self.assertIn('FileBasedCache', result.stdout)
+
+	def test_locmem_refused_for_several_workers(self):
+		result = self.load_settings(DJANGO_DEBUG='False', DJANGO_CACHE='locmem')
+		self.assertIn('ImproperlyConfigured', result.stderr)
+
+		result = self.load_settings(DJANGO_DEBUG='False', DJANGO_CACHE='locmem', WEB_CONCURRENCY='1')
+		self.assertIn('LocMemCache', result.stdout)
+
+class DetailPageQueryCountTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.author = Author.objects.create(first_name='Dominique', last_name='Rousseau')
+		cls.language = Language.objects.create(name='English')
+		cls.genres = [Genre.objects.create(name=f'Genre { genre_id }') for genre_id in range(5)]
+
+	def setUp(self):
+		# render from scratch, not from the page cache
+		cache.clear()
+
+	def add_books(self, number_of_books, copies_per_book):
+		for book_id in range(number_of_books):
+			book = Book.objects.create(
+				title=f'Book { book_id }',
+				summary='Summary',
+				isbn=f'{ Book.objects.count():013d}',
+				author=self.author,
+				language=self.language
+			)
+			book.genre.set(self.genres)
+
+			for copy_id in range(copies_per_book):
+				BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', status='a' if copy_id % 2 else 'o')
+
+		return book
+
+	def test_book_detail_queries_do_not_grow_with_copies(self):
+		for copies_per_book in (1, 20):
+			book = self.add_books(1, copies_per_book)
+			cache.clear()
+
+			# book with author and language, genres, copies, copy counters
+			with self.assertNumQueries(4):
+				response = self.client.get(reverse('book_detail', args=[book.pk]))
+			self.assertContains(response, 'Rousseau, Dominique')
+			self.assertContains(response, 'Unlikely Imprint, 2016', count=copies_per_book)
+
+	def test_author_detail_queries_do_not_grow_with_books(self):
+		for number_of_books in (1, 20):
+			self.add_books(number_of_books, 3)
+			cache.clear()
+
+			# author, books annotated with available copies
+			with self.assertNumQueries(2):
+				response = self.client.get(reverse('author_detail', args=[self.author.pk]))
+
+		self.assertEqual(len(response.context['books']), 21)
+		self.assertTrue(all(book.num_available == 1 for book in response.context['books']))
+
+	def test_book_list_queries_do_not_grow_with_books(self):
+		self.add_books(10, 0)
+
+		# count for the paginator, page of books with authors
+		with self.assertNumQueries(2):
+			self.client.get(reverse('books'))
+
+class QueryPlanTest(TestCase):
+	'''Fails when a hot query on a filtered table is planned as a full scan.'''
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.librarian = User.objects.create_user(username='librarian', password='1X<ISRUkw+tuK')
+		cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+
+		test_book = Book.objects.create(title='Topaz', summary='Summary', isbn='ABCDEFG')
+		Genre.objects.create(name='Fantasy')
+
+		for copy_id in range(20):
+			BookInstance.objects.create(
+				book=test_book,
+				imprint='Imprint',
+				status='o' if copy_id % 2 else 'a',
+				borrower=cls.librarian,
+				due_back=datetime.date.today() + datetime.timedelta(days=copy_id)
+			)
+
+	def explain(self, sql, params=()):
+		with connection.cursor() as cursor:
+			if connection.vendor == 'postgresql':
+				# tiny test tables would always be scanned otherwise
+				cursor.execute('SET LOCAL enable_seqscan = off')
+				cursor.execute('EXPLAIN ' + sql, params)
+			else:
+				cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+			return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+	def assertNoFullScan(self, plan, *tables):
+		for table in tables:
+			self.assertNotRegex(plan, rf'(^|\n)\W*(SCAN|Seq Scan on) {table}\b', plan)
+		self.assertNotIn('TEMP B-TREE FOR ORDER BY', plan)
+
+	def view_plans(self, url):
+		with CaptureQueriesContext(connection) as context:
+			response = self.client.get(url)
+		self.assertEqual(response.status_code, 200)
+
+		return [
+			self.explain(query['sql']) for query in context.captured_queries
+			if query['sql'].startswith('SELECT') and 'catalog_bookinstance' in query['sql']
+		]
+
+	def test_all_borrowed_uses_status_due_back_index(self):
+		self.client.login(username='librarian', password='1X<ISRUkw+tuK')
+
+		plans = self.view_plans(reverse('all_borrowed'))
+		self.assertTrue(plans)
+		for plan in plans:
+			self.assertNoFullScan(plan, 'catalog_bookinstance')
+
+	def test_my_borrowed_uses_borrower_status_due_back_index(self):
+		self.client.login(username='librarian', password='1X<ISRUkw+tuK')
+
+		plans = self.view_plans(reverse('my_borrowed'))
+		self.assertTrue(plans)
+		for plan in plans:
+			self.assertNoFullScan(plan, 'catalog_bookinstance')
+
+	def test_overdue_lists_use_the_due_back_indexes(self):
+		self.client.login(username='librarian', password='1X<ISRUkw+tuK')
+
+		for name in ('all_overdue', 'my_overdue'):
+			with self.subTest(name):
+				for plan in self.view_plans(reverse(name)):
+					self.assertNoFullScan(plan, 'catalog_bookinstance')
+
+	def test_deep_loan_page_seeks_on_the_due_back_range(self):
+		self.client.login(username='librarian', password='1X<ISRUkw+tuK')
+		cursor = paginate_by_cursor(all_loans(), None, 3).next_cursor
+
+		# the loans after the cursor, then the tail without a due date as the page isn't full
+		seek, null_tail = self.view_plans(reverse('all_borrowed') + '?' + urlencode({ 'cursor' : cursor }))
+		for plan in (seek, null_tail):
+			self.assertNoFullScan(plan, 'catalog_bookinstance')
+
+		# a range bound on the index, not an OR filtered over all of it
+		if connection.vendor == 'sqlite':
+			self.assertRegex(seek, r'INDEX bookinst_status_due \(status=\? AND due_back>\?\)')
+		else:
+			self.assertIn('due_back >=', seek)
+
+	def test_index_name_and_title_counts_use_lower_indexes(self):
+		querysets = catalog_count_querysets()
+
+		for name in ('num_genre_fantasy', 'num_genre_drama', 'num_book_topaz', 'num_book_c'):
+			with self.subTest(name):
+				sql, params = querysets[name].query.sql_with_params()
+				self.assertNoFullScan(self.explain(sql, params), 'catalog_genre', 'catalog_book')
+
+class LoanCursorPaginationTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		test_book = Book.objects.create(title='Topaz', summary='Summary', isbn='ABCDEFG')
+		borrower = User.objects.create_user(username='borrower')
+		today = datetime.date.today()
+
+		# ties on due_back and loans without one, which are listed last
+		for days in (3, None, 1, 3, None, 2, 3, 1, None, 5, 3, 2, None):
+			BookInstance.objects.create(
+				book=test_book,
+				imprint='Imprint',
+				status='o',
+				borrower=borrower,
+				due_back=None if days is None else today + datetime.timedelta(days=days)
+			)
+
+		loans = BookInstance.objects.filter(status__exact='o')
+		cls.expected = (
+			list(loans.filter(due_back__isnull=False).order_by('due_back', 'id').values_list('pk', flat=True))
+			+ list(loans.filter(due_back__isnull=True).order_by('id').values_list('pk', flat=True))
+		)
+
+	def test_walks_forward_and_back_through_the_null_due_dates(self):
+		for page_size in (1, 2, 3, 4, 5):
+			with self.subTest(page_size=page_size):
+				pages = [paginate_by_cursor(all_loans(), None, page_size)]
+				while pages[-1].has_next():
+					pages.append(paginate_by_cursor(all_loans(), pages[-1].next_cursor, page_size))
+				self.assertEqual([copy.pk for page in pages for copy in page], self.expected)
+
+				backward = [pages[-1]]
+				while backward[-1].has_previous():
+					backward.append(paginate_by_cursor(all_loans(), backward[-1].previous_cursor, page_size))
+				self.assertEqual([copy.pk for page in reversed(backward) for copy in page], self.expected)
+
 class LoanedBookInstancesByUserListViewTest(TestCase):
 	def setUp(self):
 		# Create two users
@@ -165,6 +691,41 @@ class LoanedBookInstancesByUserListViewTest(TestCase):
 		# Verify "successful" response
 		self.assertEqual(response.status_code, 200)
 
+class OverdueLoansViewTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+		cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+
+		book = Book.objects.create(title='Book title', summary='Summary', isbn='ABCDEFG')
+		today = datetime.date.today()
+		cls.overdue = BookInstance.objects.create(
+			book=book, imprint='Imprint', status='o', borrower=cls.librarian, due_back=today - datetime.timedelta(days=1)
+		)
+		cls.due_today = BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=cls.librarian, due_back=today)
+
+	def setUp(self):
+		self.client.force_login(self.librarian)
+
+	def test_loans_are_annotated(self):
+		for name in ('all_borrowed', 'my_borrowed'):
+			with self.subTest(name):
+				response = self.client.get(reverse(name))
+
+				self.assertEqual(
+					[(copy.pk, copy.overdue) for copy in response.context['bookinstance_list']],
+					[(self.overdue.pk, True), (self.due_today.pk, False)]
+				)
+				self.assertContains(response, 'class="text-danger"', count=1)
+
+	def test_overdue_only(self):
+		for name in ('all_overdue', 'my_overdue'):
+			with self.subTest(name):
+				response = self.client.get(reverse(name))
+
+				self.assertTrue(response.context['overdue'])
+				self.assertEqual([copy.pk for copy in response.context['bookinstance_list']], [self.overdue.pk])
+
 class RenewBookInstancesViewTest(TestCase):
 	def setUp(self):
 		# Create users
@@ -318,6 +879,98 @@ class RenewBookInstancesViewTest(TestCase):
 			'Invalid date - renewal more than 4 weeks ahead'
 		)
 
+	def test_renewal_writes_only_the_due_date(self):
+		login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+		valid_date_in_future = datetime.date.today() + datetime.timedelta(weeks=2)
+		self.client.post(reverse('renew_book_librarian', kwargs={
+			'pk' : self.test_bookinstance1.pk
+		}), { 'renewal_date' : valid_date_in_future })
+
+		copy = BookInstance.objects.get(pk=self.test_bookinstance1.pk)
+		self.assertEqual((copy.status, copy.borrower_id, copy.due_back), ('o', self.test_bookinstance1.borrower_id, valid_date_in_future))
+
+	def test_renewal_is_recorded_in_the_ledger(self):
+		login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+		valid_date_in_future = datetime.date.today() + datetime.timedelta(weeks=2)
+		self.client.post(reverse('renew_book_librarian', kwargs={
+			'pk' : self.test_bookinstance1.pk
+		}), { 'renewal_date' : valid_date_in_future })
+
+		event = LoanEvent.objects.get()
+		self.assertEqual(
+			(event.action, event.copy_id, event.borrower_id, event.due_back),
+			('n', self.test_bookinstance1.pk, self.test_bookinstance1.borrower_id, valid_date_in_future)
+		)
+
+	def test_returned_copy_is_not_renewed(self):
+		login = self.client.login(username='testuser2', password='2HJ1vRV0Z&3iD')
+		response = self.client.get(reverse('renew_book_librarian', kwargs={
+			'pk' : self.test_bookinstance1.pk
+		}))
+
+		# returned while the librarian had the form open
+		circulation.give_back(self.test_bookinstance1)
+		response = self.client.post(reverse('renew_book_librarian', kwargs={
+			'pk' : self.test_bookinstance1.pk
+		}), { 'renewal_date' : datetime.date.today() + datetime.timedelta(weeks=2) })
+
+		self.assertEqual(response.status_code, 200)
+		self.assertFormError(response.context['form'], None, 'This copy is no longer on loan.')
+		copy = BookInstance.objects.get(pk=self.test_bookinstance1.pk)
+		self.assertEqual((copy.status, copy.borrower, copy.due_back), ('a', None, None))
+
+class BulkRenewViewTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+		cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+		cls.patron = User.objects.create_user(username='patron', password='1X<ISRUkw+tuK')
+
+		book = Book.objects.create(title='Book title', summary='Summary', isbn='ABCDEFG')
+		cls.copies = [
+			BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=cls.patron, due_back=datetime.date.today())
+			for _ in range(3)
+		]
+
+	def renew(self, renewal_date, copies):
+		return self.client.post(reverse('renew_books_librarian'), {
+			'renewal_date' : renewal_date,
+			'copies' : [copy.pk for copy in copies],
+		}, follow=True)
+
+	def test_needs_permission(self):
+		self.client.force_login(self.patron)
+		self.assertEqual(self.renew(datetime.date.today(), self.copies).status_code, 403)
+
+	def test_list_offers_bulk_renewal(self):
+		self.client.force_login(self.librarian)
+		response = self.client.get(reverse('all_borrowed'))
+
+		self.assertContains(response, reverse('renew_books_librarian'))
+		self.assertContains(response, f'value="{self.copies[0].pk}"')
+
+	def test_renews_the_selected_copies_in_one_update(self):
+		self.client.force_login(self.librarian)
+		renewal_date = datetime.date.today() + datetime.timedelta(weeks=2)
+
+		with CaptureQueriesContext(connection) as queries:
+			response = self.renew(renewal_date, self.copies[:2])
+
+		self.assertRedirects(response, reverse('all_borrowed'))
+		self.assertContains(response, 'Renewed 2 loans')
+		self.assertEqual(
+			[BookInstance.objects.get(pk=copy.pk).due_back for copy in self.copies],
+			[renewal_date, renewal_date, datetime.date.today()]
+		)
+		self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE "catalog_bookinstance"')]), 1)
+
+	def test_invalid_date_renews_nothing(self):
+		self.client.force_login(self.librarian)
+		response = self.renew(datetime.date.today() - datetime.timedelta(days=1), self.copies)
+
+		self.assertContains(response, 'Invalid date - renewal in past')
+		self.assertEqual({ copy.due_back for copy in BookInstance.objects.all() }, { datetime.date.today() })
+
 class AuthorCreateViewTest(TestCase):
 	# check access, initial date, used template, redirect successful
 	def setUp(self):
@@ -386,3 +1039,69 @@ class AuthorCreateViewTest(TestCase):
 
 		inital_date = datetime.date(2025, 11, 11)
 		self.assertEqual(response.context['form'].initial['date_of_death'], inital_date)
+
+class LayoutCacheTest(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		add_book = Permission.objects.get(codename='add_book')
+		cls.librarians = []
+		for username in ('librarian1', 'librarian2'):
+			user = User.objects.create_user(username=username, password='1X<ISRUkw+tuK')
+			user.user_permissions.add(add_book)
+			cls.librarians.append(user)
+		cls.patron = User.objects.create_user(username='patron', password='2HJ1vRV0Z&3iD')
+
+		for number in range(12):
+			Author.objects.create(first_name='First', last_name=f'Last {number}')
+
+	def setUp(self):
+		cache.clear()
+
+	def test_templates_are_compiled_once(self):
+		loaders = settings.TEMPLATES[0]['OPTIONS']['loaders']
+		self.assertEqual(loaders[0][0], 'django.template.loaders.cached.Loader')
+
+	def test_users_with_the_same_permissions_share_the_sidebar(self):
+		self.client.force_login(self.librarians[0])
+		self.client.get(reverse('index'))
+
+		key = permission_set_key(self.librarians[1])
+		self.assertEqual(key, permission_set_key(self.librarians[0]))
+		fragment = make_template_fragment_key('sidebar_staff_links', [key])
+		self.assertIn(reverse('book_create'), cache.get(fragment))
+		cache.set(fragment, '<li>Cached staff links</li>')
+
+		self.client.force_login(self.librarians[1])
+		response = self.client.get(reverse('index'))
+
+		self.assertContains(response, 'Cached staff links')
+		# the user's own part of the sidebar isn't cached
+		self.assertContains(response, 'User : librarian2')
+
+	def test_sidebar_follows_the_permission_set(self):
+		self.client.force_login(self.librarians[0])
+		self.assertContains(self.client.get(reverse('index')), reverse('book_create'))
+
+		self.client.force_login(self.patron)
+		self.assertNotContains(self.client.get(reverse('index')), reverse('book_create'))
+
+		self.client.logout()
+		response = self.client.get(reverse('index'))
+		self.assertNotContains(response, 'My borrowed')
+		self.assertContains(response, f'{reverse("login")}?next={reverse("index")}')
+
+	def test_pagination_cached_per_page(self):
+		response = self.client.get(reverse('authors'))
+		self.assertContains(response, '?page=2')
+
+		response = self.client.get(reverse('authors'), { 'page' : 2 })
+		self.assertContains(response, 'Page 2 of 2')
+		self.assertContains(response, '?page=1')
+
+	@override_settings(CATALOG_LAYOUT_CACHE_TIMEOUT=0)
+	def test_timeout_zero_turns_the_cache_off(self):
+		self.client.force_login(self.patron)
+		self.client.get(reverse('index'))
+
+		self.patron.user_permissions.add(Permission.objects.get(codename='add_book'))
+		self.assertContains(self.client.get(reverse('index')), reverse('book_create'))
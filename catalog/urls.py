@@ -1,21 +1,54 @@
 
+from django.conf import settings
 from django.urls import path, include
-from . import views
+from . import views, api, async_views
+
+# Read-only pages, served by their async versions under ASGI with CATALOG_ASYNC_VIEWS
+if settings.CATALOG_ASYNC_VIEWS:
+	index = async_views.index
+	book_list = async_views.book_list
+	book_detail = async_views.book_detail
+	author_list = async_views.author_list
+	author_detail = async_views.author_detail
+	my_borrowed = async_views.loaned_books_by_user
+	all_borrowed = async_views.all_loaned_books
+else:
+	index = views.index
+	book_list = views.BookListView.as_view()
+	book_detail = views.BookDetailView.as_view()
+	author_list = views.AuthorListView.as_view()
+	author_detail = views.AuthorDetailView.as_view()
+	my_borrowed = views.LoanedBooksByUserListView.as_view()
+	all_borrowed = views.AllLoanedBooksListView.as_view()
 
 urlpatterns = [
-	path('', views.index, name='index'),
+	path('', index, name='index'),
 
-	path('books/', views.BookListView.as_view(), name='books'),
-	path('book/<int:pk>', views.BookDetailView.as_view(), name='book_detail'), # store primary key = pk
+	path('books/', book_list, name='books'),
+	path('books/search/', views.BookSearchView.as_view(), name='book_search'),
+	path('book/<int:pk>', book_detail, name='book_detail'), # store primary key = pk
 
-	path('authors/', views.AuthorListView.as_view(), name='authors'),
-	path('authors/<int:pk>', views.AuthorDetailView.as_view(), name='author_detail'),
+	path('authors/', author_list, name='authors'),
+	path('authors/<int:pk>', author_detail, name='author_detail'),
 
-	path('mybooks/', views.LoanedBooksByUserListView.as_view(), name='my_borrowed'),
-	path('allbooks/', views.AllLoanedBooksListView.as_view(), name='all_borrowed'),
+	path('mybooks/', my_borrowed, name='my_borrowed'),
+	path('mybooks/overdue/', my_borrowed, { 'overdue' : True }, name='my_overdue'),
+	path('allbooks/', all_borrowed, name='all_borrowed'),
+	path('allbooks/overdue/', all_borrowed, { 'overdue' : True }, name='all_overdue'),
+	path('allbooks/renew/', views.renew_books_librarian, name='renew_books_librarian'),
 
 	path('book/<uuid:pk>/renew/', views.renew_book_librarian, name='renew_book_librarian'),
 
+	path('export/<slug:dataset>.<slug:fmt>', views.catalog_export, name='catalog_export'),
+
+	path('api/v1/books/', api.book_list, name='api_book_list'),
+	path('api/v1/books/<int:pk>/', api.book_detail, name='api_book_detail'),
+	path('api/v1/books/<int:pk>/availability/', api.book_availability, name='api_book_availability'),
+	path('api/v1/authors/', api.author_list, name='api_author_list'),
+	path('api/v1/authors/<int:pk>/', api.author_detail, name='api_author_detail'),
+	path('api/v1/genres/', api.genre_list, name='api_genre_list'),
+	path('api/v1/holds/<int:pk>/', api.hold_detail, name='api_hold_detail'),
+
 	path('author/create/', views.AuthorCreate.as_view(), name='author_create'),
 	path('author/<int:pk>/update/', views.AuthorUpdate.as_view(), name='author_update'),
 	path('author/<int:pk>/delete/', views.AuthorDelete.as_view(), name='author_delete'),
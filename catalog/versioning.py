@@ -0,0 +1,60 @@
+import uuid
+
+from django.core.cache import cache
+
+# Cache keys holding the current version token of a model (or of one object)
+VERSION_KEY_PREFIX = 'catalog:version'
+
+def version_key(*parts):
+	return ':'.join([VERSION_KEY_PREFIX, *(str(part) for part in parts)])
+
+def get_versions(*keys):
+	'''Returns the version tokens for the given version keys, in order.'''
+	versions = cache.get_many(keys)
+
+	for key in keys:
+		if key not in versions:
+			# a fresh random token, an evicted version can never come back with an old value
+			token = uuid.uuid4().hex
+			if not cache.add(key, token, timeout=None):
+				token = cache.get(key) or token
+			versions[key] = token
+
+	return [versions[key] for key in keys]
+
+async def aget_versions(*keys):
+	'''Async get_versions().'''
+	versions = await cache.aget_many(keys)
+
+	for key in keys:
+		if key not in versions:
+			token = uuid.uuid4().hex
+			if not await cache.aadd(key, token, timeout=None):
+				token = await cache.aget(key) or token
+			versions[key] = token
+
+	return [versions[key] for key in keys]
+
+def bump_versions(*keys):
+	'''Replaces the version tokens, invalidating everything derived from them.'''
+	cache.set_many({ key : uuid.uuid4().hex for key in keys }, timeout=None)
+
+def model_version_key(model):
+	return version_key(model._meta.label_lower)
+
+# Bumped when changed objects can't be pinned down, invalidates every object version
+ALL_OBJECTS_VERSION_KEY = version_key('objects')
+
+def object_version_key(model, pk):
+	return version_key(model._meta.label_lower, pk)
+
+def get_object_version(model, pk):
+	'''Returns a token that changes whenever the object, or anything it displays, changes.'''
+	return '.'.join(get_versions(object_version_key(model, pk), ALL_OBJECTS_VERSION_KEY))
+
+def bump_object_versions(model, pks):
+	bump_versions(*(object_version_key(model, pk) for pk in pks if pk is not None))
+
+async def aget_object_version(model, pk):
+	'''Async get_object_version().'''
+	return '.'.join(await aget_versions(object_version_key(model, pk), ALL_OBJECTS_VERSION_KEY))
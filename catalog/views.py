@@ -1,59 +1,52 @@
 from django.shortcuts import render, get_object_or_404
 from django.views import generic
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
+from django.views.decorators.http import require_POST
 
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, StreamingHttpResponse, Http404
 from django.urls import reverse, reverse_lazy
+from django.conf import settings
+from django.utils.functional import cached_property
+from django.db.models import BooleanField, ExpressionWrapper, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
+from django.contrib.admin.views.decorators import staff_member_required
 
 import datetime
 
-from .models import Book, BookInstance, Author, Genre
-from catalog.forms import RenewBookForm
+from .models import Book, BookInstance, Author, Genre, CopyCount
+from catalog.forms import BulkRenewForm, RenewBookForm
+from catalog.stats import get_catalog_stats
+from catalog.pagination import KeysetPaginationMixin
+from catalog.routers import use_primary
+from catalog.search import search_books
+from catalog import circulation, export
+from catalog.versioning import get_object_version
+from catalog.visits import get_visit_count, set_visit_count
 
 # Create your views here.
 
 def index(request):
 	'''View function for the home page of the site.'''
 
-	# Object counts
-	num_books = Book.objects.all().count()
-	num_authors = Author.objects.count() # all implied
-	num_instances = BookInstance.objects.all().count()
+	# Object counts, served from a cached snapshot (see catalog.stats)
+	stats = get_catalog_stats()
 
-	# Available books, a=available
-	num_instances_available = BookInstance.objects.filter(status__exact='a').count()
+	# Number of visits in the view, counted via signed cookie (see catalog.visits)
+	num_visits = get_visit_count(request) + 1
 
-	num_genre_fantasy = Genre.objects.filter(name__iexact='fantasy').count()
-	num_genre_drama = Genre.objects.filter(name__iexact='drana').count()
-
-	num_book_topaz = Book.objects.filter(title__iexact='topaz').count()
-	num_book_c = Book.objects.filter(title__iexact='sobre').count()
-
-	# Number of visits in the view, counted via session variable
-	num_visits = request.session.get('num_visits', 0)
-	num_visits += 1
-	request.session['num_visits'] = num_visits
-	
 	context = {
-		'num_books' : num_books,
-		'num_authors' : num_authors,
-		'num_instances' : num_instances,
-		'num_instances_available' : num_instances_available,
-
-		'num_genre_fantasy' : num_genre_fantasy,
-		'num_genre_drama' : num_genre_drama,
-
-		'num_book_topaz' : num_book_topaz,
-		'num_book_c' : num_book_c,
+		**stats,
 
 		'num_visits' : num_visits,
 	}
 
 	# render in template with data provided in context
-	return render(request, 'index.html', context=context)
+	response = render(request, 'index.html', context=context)
+	return set_visit_count(response, num_visits)
 
 @login_required
 @permission_required('catalog.can_mark_returned', raise_exception=True)
@@ -69,19 +62,21 @@ def renew_book_librarian(request, pk):
 		if form.is_valid():
 			# process the data in form.cleared_data as required (write to model due_back field)
 			# ensure sanitization, validation, conversion to more 'friendly' data types
-			book_instance.due_back = form.cleaned_data['renewal_date']
-			book_instance.save()
-
-			# redirect to success
-			return HttpResponseRedirect(reverse('all_borrowed'))
-		else:
-			# doesn't work when producing renewal dates?
-			context = {
-				'form' : form,
-				'book_instance' : book_instance,
-			}
-
-			return render(request, 'catalog/book_renew_librarian.html', context)
+			# only due_back is written, and only while the copy is still on loan
+			try:
+				circulation.renew(book_instance, form.cleaned_data['renewal_date'])
+			except circulation.NotOnLoan:
+				form.add_error(None, 'This copy is no longer on loan.')
+			else:
+				# redirect to success
+				return HttpResponseRedirect(reverse('all_borrowed'))
+
+		context = {
+			'form' : form,
+			'book_instance' : book_instance,
+		}
+
+		return render(request, 'catalog/book_renew_librarian.html', context)
 	
 	# Produce default form for other methods like GET
 	else:
@@ -96,12 +91,41 @@ def renew_book_librarian(request, pk):
 
 		return render(request, 'catalog/book_renew_librarian.html', context)
 
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+@require_POST
+def renew_books_librarian(request):
+	'''Renews the copies ticked on the all borrowed list in one UPDATE.'''
+	form = BulkRenewForm(request.POST)
+
+	if form.is_valid():
+		renewal_date = form.cleaned_data['renewal_date']
+		renewed = circulation.renew_many(form.cleaned_data['copies'], renewal_date)
+		messages.success(request, f'Renewed {renewed} loans until {renewal_date}.')
+	else:
+		for errors in form.errors.values():
+			messages.error(request, ' '.join(errors))
+
+	return HttpResponseRedirect(reverse('all_borrowed'))
+
+@staff_member_required
+def catalog_export(request, dataset, fmt):
+	'''Streams a full dump of books or copies as CSV or JSONL.'''
+	if dataset not in export.DATASETS or fmt not in export.FORMATS:
+		raise Http404('Unknown export')
+
+	response = StreamingHttpResponse(export.export_lines(dataset, fmt), content_type=export.FORMATS[fmt])
+	response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+
+	return response
+
 # implementation II
 
 # Book views
 
-class BookListView(generic.ListView):
+class BookListView(KeysetPaginationMixin, generic.ListView):
 	model = Book
+	queryset = Book.objects.select_related('author')
 
 	context_object_name = 'book_list' # list name
 	paginate_by = 10
@@ -109,37 +133,134 @@ class BookListView(generic.ListView):
 	# def get_queryset(self):
 	#	return Book.objects.filter(title__icontains='campana')[:5]
 
-class BookDetailView(generic.DetailView):
+class BookSearchView(generic.ListView):
+	'''Ranked full-text search over book title, summary, ISBN and author name.'''
+
+	template_name = 'catalog/book_search.html'
+	context_object_name = 'book_list'
+	paginate_by = 10
+
+	def get_queryset(self):
+		return search_books(self.request.GET.get('q', ''))
+
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+		context['query'] = self.request.GET.get('q', '')
+		return context
+
+class CopySummary:
+	'''Per-status copy numbers of a book, read from the maintained counters on first use.'''
+
+	def __init__(self, book):
+		self.book = book
+
+	@cached_property
+	def counts(self):
+		return CopyCount.objects.counts(book=self.book)
+
+	def by_status(self):
+		return [(label, self.counts.get(status, 0)) for status, label in BookInstance.LOAN_STATUS]
+
+	def total(self):
+		return sum(self.counts.values())
+
+class VersionedPageMixin:
+	'''
+	Provides page_version for caching the page content with {% cache %}: a token that
+	changes whenever the object or anything shown with it changes (see catalog.signals).
+	'''
+
+	def get(self, request, *args, **kwargs):
+		# the content is cached under the newest token, a lagging replica could fill
+		# it with the old rows, so the page is read and rendered from the primary
+		with use_primary():
+			return super().get(request, *args, **kwargs).render()
+
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+		context['page_version'] = get_object_version(self.model, self.object.pk)
+		context['page_cache_timeout'] = settings.CATALOG_PAGE_CACHE_TIMEOUT
+		return context
+
+class BookDetailView(VersionedPageMixin, generic.DetailView):
 	model = Book
+	# genres and copies are one query each, run only when the cached content is stale
+	queryset = Book.objects.select_related('author', 'language')
+
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+		context['copies'] = CopySummary(self.object)
+		return context
 
 # Author views
 
-class AuthorListView(generic.ListView):
+class AuthorListView(KeysetPaginationMixin, generic.ListView):
 	model = Author
 
 	context_object_name = 'author_list'
 	paginate_by = 10
 
-class AuthorDetailView(generic.DetailView):
+class AuthorDetailView(VersionedPageMixin, generic.DetailView):
 	model = Author
 
-class LoanedBooksByUserListView (LoginRequiredMixin, generic.ListView):
-	"""Generic class-based view listing books on loan to the current user."""
+	def get_context_data(self, **kwargs):
+		context = super().get_context_data(**kwargs)
+
+		# evaluated once, by the content or the sidebar, whichever comes first
+		context['books'] = author_books(self.object)
+
+		return context
+
+def author_books(author):
+	'''An author's books with their number of available copies.'''
+	return Book.objects.filter(author=author).annotate(
+		num_available=Coalesce(
+			Subquery(
+				CopyCount.objects
+					.filter(book=OuterRef('pk'), status__exact='a')
+					.values('count')
+			),
+			0
+		)
+	).order_by('pk')
+
+class LoanedBooksByUserListView (LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
+	"""Generic class-based view listing books on loan to the current user, or only the overdue ones."""
 
 	model = BookInstance
 	template_name = 'catalog/bookinstance_list_borrowed_user.html'
 	paginate_by = 10
 
 	def get_queryset(self):
-		return (
-			BookInstance.objects
-				.filter(borrower=self.request.user)
-				.filter(status__exact='o')
-				.order_by('due_back')
-		)
-
-class AllLoanedBooksListView(PermissionRequiredMixin, generic.ListView):
-	'''Generic class-based view for lising all books on loan.'''
+		return loans_of(self.request.user, overdue=self.kwargs.get('overdue', False))
+
+	def get_context_data(self, **kwargs):
+		return super().get_context_data(overdue=self.kwargs.get('overdue', False), **kwargs)
+
+def overdue_loans(loans, overdue_only):
+	'''
+	Annotates the loans with overdue (due before today), computed by the database like
+	BookInstance.is_overdue; with overdue_only, keeps just those.
+	'''
+	today = datetime.date.today()
+	if overdue_only:
+		# a range on the (status, due_back) indexes
+		loans = loans.filter(due_back__lt=today)
+	return loans.annotate(overdue=ExpressionWrapper(Q(due_back__lt=today), output_field=BooleanField()))
+
+def loans_of(user, overdue=False):
+	'''Copies on loan to user, soonest due first.'''
+	return overdue_loans(
+		BookInstance.objects
+			.filter(borrower=user)
+			.filter(status__exact='o')
+			.select_related('book')
+			.order_by('due_back'),
+		overdue
+	)
+
+class AllLoanedBooksListView(PermissionRequiredMixin, KeysetPaginationMixin, generic.ListView):
+	'''Generic class-based view for lising all books on loan, or only the overdue ones.'''
 
 	permission_required = 'catalog.can_mark_returned'
 
@@ -149,11 +270,20 @@ class AllLoanedBooksListView(PermissionRequiredMixin, generic.ListView):
 
 	# get all books
 	def get_queryset(self):
-		return (
-			BookInstance.objects
-				.filter(status__exact='o')
-				.order_by('due_back')
-		)
+		return all_loans(overdue=self.kwargs.get('overdue', False))
+
+	def get_context_data(self, **kwargs):
+		return super().get_context_data(overdue=self.kwargs.get('overdue', False), **kwargs)
+
+def all_loans(overdue=False):
+	'''Every copy on loan, soonest due first.'''
+	return overdue_loans(
+		BookInstance.objects
+			.filter(status__exact='o')
+			.select_related('book', 'borrower')
+			.order_by('due_back'),
+		overdue
+	)
 
 # Author modification views
 
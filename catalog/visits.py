@@ -0,0 +1,30 @@
+from django.core import signing
+
+# Home page visit counter, kept in a signed cookie so counting never writes the session
+VISITS_COOKIE = 'num_visits'
+VISITS_COOKIE_SALT = 'catalog.visits'
+VISITS_COOKIE_MAX_AGE = 365 * 24 * 60 * 60
+
+def get_visit_count(request):
+	'''Returns the number of earlier visits, 0 for new visitors or tampered cookies.'''
+	try:
+		return int(request.get_signed_cookie(VISITS_COOKIE, salt=VISITS_COOKIE_SALT))
+	except (KeyError, signing.BadSignature, ValueError):
+		pass
+
+	# carry over counts stored by the old session-based counter (read only, never saved)
+	if request.COOKIES.get(VISITS_COOKIE) is None and hasattr(request, 'session'):
+		return request.session.get('num_visits', 0)
+
+	return 0
+
+def set_visit_count(response, num_visits):
+	response.set_signed_cookie(
+		VISITS_COOKIE,
+		num_visits,
+		salt=VISITS_COOKIE_SALT,
+		max_age=VISITS_COOKIE_MAX_AGE,
+		httponly=True,
+		samesite='Lax'
+	)
+	return response
@@ -0,0 +1,14 @@
+from django.db.backends.sqlite3 import base
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend starting transactions with BEGIN IMMEDIATE (built into Django
+    5.1+ as the "transaction_mode" option).
+
+    A plain BEGIN takes the write lock only at the first write, and a transaction
+    that can't upgrade its lock fails with "database is locked" without waiting
+    for the busy timeout. Taking the lock up front makes concurrent writers queue.
+    """
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
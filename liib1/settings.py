@@ -12,8 +12,11 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 from dotenv import load_dotenv
+import importlib.util
 import os
 import dj_database_url
+import django
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -55,27 +58,48 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
 	'django.middleware.security.SecurityMiddleware',
 	'whitenoise.middleware.WhiteNoiseMiddleware',
+	# dynamic pages only, WhiteNoise answers static requests with the precompressed files;
+	# Django masks the compressed length against BREACH (CSRF tokens in forms); skips
+	# CATALOG_GZIP_EXCLUDE_PATHS
+	'catalog.middleware.CatalogGZipMiddleware',
+	# ETag on page content, repeat GETs of an unchanged page get a 304 without the body
+	'django.middleware.http.ConditionalGetMiddleware',
+	'catalog.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+	'catalog.middleware.QueryInstrumentationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# WhiteNoise only runs synchronously; under ASGI let the proxy serve /static/ and set
+# DJANGO_SERVE_STATIC=False so requests reach the async views without a thread hop
+if os.environ.get('DJANGO_SERVE_STATIC', '') == 'False':
+	MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
 ROOT_URLCONF = 'liib1.urls'
 
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'catalog.context_processors.layout',
+            ],
+            # templates are compiled once per process and reused for every render
+            # (runserver's autoreloader clears them when a template changes)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
@@ -91,9 +115,82 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # seconds a writer waits for the lock before "database is locked"
+        'OPTIONS': { 'timeout': 20 },
     }
 }
 
+# Database tuning profile, DJANGO_DB_PROFILE=plain turns it off
+DATABASE_PROFILE = os.environ.get('DJANGO_DB_PROFILE', 'tuned')
+
+# PRAGMAs run on every new SQLite connection (see catalog.signals); journal_mode is
+# stored in the database file, so the plain profile sets SQLite's defaults back
+SQLITE_PRAGMAS = {
+	# readers and the writer no longer block each other
+	'journal_mode': 'WAL',
+	# with WAL, a power loss can drop the last commits but never corrupt the file
+	'synchronous': 'NORMAL',
+	'mmap_size': int(os.environ.get('DJANGO_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+	# milliseconds to wait for a lock, same as the timeout option above
+	'busy_timeout': 20000,
+	'temp_store': 'MEMORY',
+} if DATABASE_PROFILE == 'tuned' else {
+	'journal_mode': 'DELETE',
+	'synchronous': 'FULL',
+	'mmap_size': 0,
+}
+
+# Transactions take the SQLite write lock when they begin, so writers queue on the busy
+# timeout instead of failing on a lock upgrade (see liib1/backends/sqlite3)
+SQLITE_ENGINE = 'liib1.backends.sqlite3' if DATABASE_PROFILE == 'tuned' else 'django.db.backends.sqlite3'
+DATABASES['default']['ENGINE'] = SQLITE_ENGINE
+
+# Seconds a connection is kept for reuse across requests (0: a new one per request)
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DJANGO_CONN_MAX_AGE', 60 if DATABASE_PROFILE == 'tuned' else 0))
+
+DATABASES['default']['CONN_MAX_AGE'] = DATABASE_CONN_MAX_AGE
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Selected with $DJANGO_CACHE; the database cache needs 'manage.py createcachetable'
+CACHE_BACKENDS = {
+	'locmem': {
+		'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+		'LOCATION': 'liib1',
+	},
+	'file': {
+		'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+		'LOCATION': BASE_DIR / 'cache',
+		# the cached pages are many small entries; culling only costs a re-render
+		'OPTIONS': { 'MAX_ENTRIES': 20000 },
+	},
+	'db': {
+		'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+		'LOCATION': 'liib1_cache',
+		'OPTIONS': { 'MAX_ENTRIES': 20000 },
+	},
+}
+
+# The cache holds the version tokens (catalog/versioning.py) behind the cached book
+# and author pages and the API ETags, so every worker process must share it: with
+# locmem a write only bumps the tokens of the worker that handled it, and the others
+# keep serving stale pages and 304s. locmem is therefore for development (DEBUG) or a
+# single worker process only (WEB_CONCURRENCY=1); 'file' is shared by the workers of
+# one host, 'db' by several hosts.
+CACHE_NAME = os.environ.get('DJANGO_CACHE', 'locmem' if DEBUG else 'file')
+
+if CACHE_NAME == 'locmem' and not DEBUG and os.environ.get('WEB_CONCURRENCY', '') != '1':
+	raise ImproperlyConfigured(
+		'DJANGO_CACHE=locmem is per process, the catalog page cache and API ETags need a cache '
+		'shared by all workers; use DJANGO_CACHE=file or db (or set WEB_CONCURRENCY=1).'
+	)
+
+CACHES = {
+	'default': CACHE_BACKENDS[CACHE_NAME],
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -145,6 +242,60 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_REDIRECT_URL = '/'
 
+# ModelBackend with each user's permission set kept in the cache (catalog.permissions)
+AUTHENTICATION_BACKENDS = ['catalog.permissions.CachedModelBackend']
+
+# Maximum age (seconds) of the cached home page record counts
+CATALOG_STATS_MAX_AGE = int(os.environ.get('CATALOG_STATS_MAX_AGE', 300))
+
+# Lifetime (seconds) of the cached book and author page content; pages are also
+# invalidated as soon as anything shown on them changes
+CATALOG_PAGE_CACHE_TIMEOUT = int(os.environ.get('CATALOG_PAGE_CACHE_TIMEOUT', 24 * 60 * 60))
+
+# Lifetime (seconds) of the cached sidebar links in base_generic.html, 0 renders them on
+# every page; they are keyed on the user's permission set, so only template changes
+# need them to expire
+CATALOG_LAYOUT_CACHE_TIMEOUT = int(os.environ.get('CATALOG_LAYOUT_CACHE_TIMEOUT', 60 * 60))
+
+# Lifetime (seconds) of the cached user permission sets; they are invalidated as soon
+# as a user's permissions, groups or superuser flag change
+CATALOG_PERMISSION_CACHE_TIMEOUT = int(os.environ.get('CATALOG_PERMISSION_CACHE_TIMEOUT', 24 * 60 * 60))
+
+# Paginate the catalog list views with keyset cursors instead of page numbers
+CATALOG_CURSOR_PAGINATION = os.environ.get('CATALOG_CURSOR_PAGINATION', '') == 'True'
+
+# Path prefixes served uncompressed, gzip would turn the API's strong version ETags weak
+CATALOG_GZIP_EXCLUDE_PATHS = ('/catalog/api/',)
+
+# Share of requests (0-1) whose queries are counted and timed; staff requests always are
+CATALOG_SQL_SAMPLE_RATE = float(os.environ.get('CATALOG_SQL_SAMPLE_RATE', 0))
+
+# Requests slower than this (milliseconds) are written to the 'catalog.sql' log
+CATALOG_SLOW_REQUEST_MS = int(os.environ.get('CATALOG_SLOW_REQUEST_MS', 500))
+
+# Identical SQL run this many times in one request is logged as a likely N+1 pattern
+CATALOG_DUPLICATE_QUERY_THRESHOLD = int(os.environ.get('CATALOG_DUPLICATE_QUERY_THRESHOLD', 5))
+
+LOGGING = {
+	'version': 1,
+	'disable_existing_loggers': False,
+	'handlers': {
+		'console': {
+			'class': 'logging.StreamHandler',
+		},
+	},
+	'loggers': {
+		'catalog.sql': {
+			'handlers': ['console'],
+			'level': os.environ.get('CATALOG_SQL_LOG_LEVEL', 'WARNING'),
+			'propagate': False,
+		},
+	},
+}
+
+# Serve the read-only catalog pages with the async views (for ASGI deployments)
+CATALOG_ASYNC_VIEWS = os.environ.get('CATALOG_ASYNC_VIEWS', '') == 'True'
+
 # Allow email testing through logging emails sent via the console
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -152,13 +303,90 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 # Update database configuration from $DATABASE_URL environment variable (if defined)
 if 'DATABASE_URL' in os.environ:
 	DATABASES['default'] = dj_database_url.config(
-		conn_max_age=500,
+		conn_max_age=DATABASE_CONN_MAX_AGE,
 		conn_health_checks=True
     )
-	
-# Static file serving
+
+	if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+		DATABASES['default']['ENGINE'] = SQLITE_ENGINE
+		DATABASES['default'].setdefault('OPTIONS', {})['timeout'] = 20
+
+	# PostgreSQL connection pooling. Django 5.0 with psycopg2 (requirements.txt) has no
+	# pool of its own, so pool with PgBouncer in transaction mode in front of the server,
+	# e.g. in pgbouncer.ini:
+	#
+	#   [databases]
+	#   library = host=127.0.0.1 port=5432 dbname=library
+	#   [pgbouncer]
+	#   pool_mode = transaction
+	#   default_pool_size = 20
+	#   max_client_conn = 500
+	#
+	# then point DATABASE_URL at PgBouncer (port 6432) and set DJANGO_DB_PGBOUNCER=True.
+	# Server-side cursors don't survive transaction pooling, the persistent connections
+	# (DJANGO_CONN_MAX_AGE) to PgBouncer are cheap and stay on.
+	if os.environ.get('DJANGO_DB_PGBOUNCER', '') == 'True':
+		DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+	# Django's own connection pool, only on Django 5.1+ with psycopg 3
+	DATABASE_POOL_MAX_SIZE = int(os.environ.get('DJANGO_DB_POOL_MAX_SIZE', 0))
+	if DATABASE_POOL_MAX_SIZE and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+		if django.VERSION < (5, 1) or importlib.util.find_spec('psycopg') is None:
+			# older versions pass OPTIONS['pool'] on to the driver and every connection fails
+			raise ImproperlyConfigured(
+				'DJANGO_DB_POOL_MAX_SIZE needs Django 5.1+ and psycopg 3; '
+				'use PgBouncer with DJANGO_DB_PGBOUNCER=True instead.'
+			)
+		DATABASES['default']['CONN_MAX_AGE'] = 0
+		DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+			'min_size': int(os.environ.get('DJANGO_DB_POOL_MIN_SIZE', 2)),
+			'max_size': DATABASE_POOL_MAX_SIZE,
+			'timeout': 10,
+		}
+
+# Optional read replica from $DATABASE_REPLICA_URL (same schema, kept in sync outside
+# Django); catalog reads are sent there, writes and sessions stay on 'default'.
+# Migrations only run on 'default', a replica gets its schema from replication. To
+# try it locally with two SQLite files, migrate the primary and copy it:
+#
+#   DATABASE_URL=sqlite:////srv/primary.sqlite3 python manage.py migrate
+#   sqlite3 /srv/primary.sqlite3 ".backup /srv/replica.sqlite3"
+#
+# and repeat the copy to "replicate" (catalog/tests/test_routers.py does the same).
+# Book and author pages and the API always read the primary, their caches are keyed
+# on version tokens that change as soon as the primary commits.
+if 'DATABASE_REPLICA_URL' in os.environ:
+	DATABASES['replica'] = dj_database_url.parse(
+		os.environ['DATABASE_REPLICA_URL'],
+		conn_max_age=DATABASE_CONN_MAX_AGE,
+		conn_health_checks=True
+	)
+	if DATABASES['replica']['ENGINE'] == 'django.db.backends.sqlite3':
+		DATABASES['replica']['ENGINE'] = SQLITE_ENGINE
+		DATABASES['replica'].setdefault('OPTIONS', {})['timeout'] = 20
+	# tests run against the primary only
+	DATABASES['replica']['TEST'] = { 'MIRROR': 'default' }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['catalog.routers.PrimaryReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they wrote, so they see their own changes
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DATABASE_REPLICA_PIN_SECONDS', 10))
+
+# Static file serving. collectstatic fingerprints every file (bootstrap.min.css ->
+# bootstrap.min.<hash>.css) and writes .gz and, with the brotli package, .br variants;
+# WhiteNoise serves the fingerprinted names with 'Cache-Control: public, immutable'
+# and a ten year max-age and picks the variant from Accept-Encoding. In development
+# (DEBUG) files are served as they are, no collectstatic needed.
 STORAGES = {
 	'staticfiles': {
-		'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+		'BACKEND': (
+			'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+			else 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+		)
     }
-}
\ No newline at end of file
+}
+
+# Unfingerprinted files (e.g. favicon.ico) may change under the same name, cache them for a day
+WHITENOISE_MAX_AGE = 24 * 60 * 60
\ No newline at end of file